@@ -26,7 +26,7 @@ def get_full_name(user):
     """
     if user is None:
         return None
-    return user.get_full_name(user)
+    return user.get_full_name()
 
 
 def get_addressed_as(user):
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Storage for the purchase and tickets of running checkouts.
+
+During the checkout the purchase and its tickets are not saved to the
+database. Instead of pickling these model instances into the session, they
+are stored as plain dicts of field values in a cache (Redis in production)
+under the id of the checkout and expire together with it. The session only
+keeps the id of the checkout next to the few values every step needs.
+
+Stored states carry a version. States of another version are ignored, which
+restarts the checkout.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import math
+import uuid
+
+from django.core.cache import caches
+
+from . import settings as app_settings
+from .models import Purchase, TicketType
+
+
+STATE_VERSION = 1
+
+
+def _get_cache():
+    return caches[app_settings.CHECKOUT_CACHE]
+
+
+def _get_key(checkout_id):
+    return 'checkout:{0}'.format(checkout_id)
+
+
+def new_checkout_id():
+    return uuid.uuid4().hex
+
+
+def _dump_fields(obj, exclude=()):
+    """
+    Returns the values of the concrete fields of the given model instance
+    which differ from the field's default, foreign keys as ids.
+    """
+    fields = {}
+    for field in obj._meta.concrete_fields:
+        if field.primary_key or field.name in exclude:
+            continue
+        value = field.value_from_object(obj)
+        if value != field.get_default():
+            fields[field.attname] = value
+    return fields
+
+
+def dump_purchase(purchase):
+    return {
+        'pk': purchase.pk,
+        'fields': _dump_fields(purchase),
+    }
+
+
+def dump_ticket(ticket):
+    return {
+        'pk': ticket.pk,
+        'fields': _dump_fields(ticket, exclude=('purchase',)),
+        # Unsaved m2m relations (see Ticket.save_related_data)
+        'related': dict((name, [obj.pk for obj in values])
+                        for name, values in ticket.related_data.items()),
+    }
+
+
+def load_purchase(data):
+    purchase = Purchase(**data['fields'])
+    purchase.pk = data['pk']
+    return purchase
+
+
+def load_tickets(data, purchase):
+    """
+    Returns the tickets of the given dumps for the given purchase or None if
+    one of their ticket types no longer exists.
+    """
+    ticket_types = TicketType.objects.get_cached(
+        set(ticket['fields']['ticket_type_id'] for ticket in data))
+    tickets = []
+    # Primary keys of the related objects of all tickets by model
+    related_pks = {}
+    for ticket_data in data:
+        ticket_type = ticket_types.get(ticket_data['fields']['ticket_type_id'])
+        if ticket_type is None:
+            return None
+        ticket = ticket_type.content_type.model_class()(**ticket_data['fields'])
+        ticket.pk = ticket_data['pk']
+        ticket.ticket_type = ticket_type
+        ticket.purchase = purchase
+        for name, pks in ticket_data['related'].items():
+            related_model = ticket._meta.get_field(name).related_model
+            related_pks.setdefault(related_model, set()).update(pks)
+        tickets.append((ticket, ticket_data['related']))
+    related_objs = dict((model, model.objects.in_bulk(pks) if pks else {})
+                        for model, pks in related_pks.items())
+    for ticket, related in tickets:
+        for name, pks in related.items():
+            objs = related_objs[ticket._meta.get_field(name).related_model]
+            ticket.related_data[name] = [objs[pk] for pk in pks if pk in objs]
+    return [ticket for ticket, related in tickets]
+
+
+def set_state(checkout_id, purchase, tickets, expires):
+    """
+    Stores the purchase and tickets of the given checkout until ``expires``
+    (in UTC).
+    """
+    timeout = (expires - datetime.datetime.utcnow()).total_seconds()
+    _get_cache().set(_get_key(checkout_id), {
+        'version': STATE_VERSION,
+        'purchase': dump_purchase(purchase),
+        'tickets': [dump_ticket(ticket) for ticket in tickets],
+    }, max(1, int(math.ceil(timeout))))
+
+
+def get_state(checkout_id):
+    """
+    Returns the purchase and the tickets of the given checkout or None if
+    there is no (usable) state stored for it.
+    """
+    if checkout_id is None:
+        return None
+    data = _get_cache().get(_get_key(checkout_id))
+    if data is None or data.get('version') != STATE_VERSION:
+        return None
+    purchase = load_purchase(data['purchase'])
+    tickets = load_tickets(data['tickets'], purchase)
+    if tickets is None:
+        return None
+    return purchase, tickets
+
+
+def delete_state(checkout_id):
+    _get_cache().delete(_get_key(checkout_id))
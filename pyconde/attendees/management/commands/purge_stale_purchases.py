@@ -28,3 +28,5 @@ class Command(BaseCommand):
                 date_added__lt=date):
             print(purchase, purchase.date_added)
             purchase.delete()
+        print("Released {0} expired ticket hold(s)".format(
+            models.TicketHold.objects.release_expired()))
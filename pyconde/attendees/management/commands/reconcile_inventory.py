@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from ... import models
+
+
+class Command(BaseCommand):
+    help = 'Recounts the sold and held tickets of all ticket types and fixes the inventory'
+
+    def handle(self, *args, **options):
+        fixed = models.TicketInventory.objects.reconcile()
+        for ticket_type_pk, counts in sorted(fixed.items()):
+            self.stdout.write('Fixed inventory of ticket type {0} (was {1})'.format(
+                ticket_type_pk,
+                'missing' if counts is None else '{0} sold, {1} held'.format(*counts)))
+        self.stdout.write('{0} inventory counter(s) fixed'.format(len(fixed)))
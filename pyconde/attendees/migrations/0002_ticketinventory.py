@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_ticket_inventories(apps, schema_editor):
+    TicketType = apps.get_model('attendees', 'TicketType')
+    Ticket = apps.get_model('attendees', 'Ticket')
+    TicketInventory = apps.get_model('attendees', 'TicketInventory')
+    sold = dict(Ticket.objects.filter(canceled=False)
+                .exclude(purchase__state__in=('incomplete', 'canceled'))
+                .order_by().values('ticket_type')
+                .annotate(sold=models.Count('pk'))
+                .values_list('ticket_type', 'sold'))
+    TicketInventory.objects.bulk_create([
+        TicketInventory(ticket_type_id=pk, sold=sold.get(pk, 0))
+        for pk in TicketType.objects.values_list('pk', flat=True)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendees', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketInventory',
+            fields=[
+                ('ticket_type', models.OneToOneField(related_name='inventory', primary_key=True, serialize=False, to='attendees.TicketType', verbose_name='Ticket type')),
+                ('sold', models.PositiveIntegerField(default=0, verbose_name='Sold tickets')),
+            ],
+            options={
+                'verbose_name': 'Ticket inventory',
+                'verbose_name_plural': 'Ticket inventories',
+            },
+        ),
+        migrations.RunPython(create_ticket_inventories, migrations.RunPython.noop),
+    ]
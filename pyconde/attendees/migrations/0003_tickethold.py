@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendees', '0002_ticketinventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketinventory',
+            name='held',
+            field=models.PositiveIntegerField(default=0, verbose_name='Held tickets'),
+        ),
+        migrations.CreateModel(
+            name='TicketHold',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(max_length=32, verbose_name='Checkout', db_index=True)),
+                ('quantity', models.PositiveIntegerField(verbose_name='Quantity')),
+                ('expires', models.DateTimeField(verbose_name='Expires', db_index=True)),
+                ('ticket_type', models.ForeignKey(related_name='holds', verbose_name='Ticket type', to='attendees.TicketType')),
+            ],
+            options={
+                'verbose_name': 'Ticket hold',
+                'verbose_name_plural': 'Ticket holds',
+            },
+        ),
+    ]
@@ -1,22 +1,27 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import collections
+import copy
+import datetime
 import decimal
 import uuid
 import os
 import string
+import time
 
 from email.utils import formataddr
 
 from django.contrib.contenttypes import models as content_models
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.conf import settings as django_settings
-from django.db import models
-from django.db.models import Q
+from django.db import connections, models, router, transaction
+from django.db.models import F, Q
 from django.utils.encoding import force_text
 from django.utils.timezone import now
 from django.utils.translation import ugettext, ugettext_lazy as _
 
 from . import settings
+from .exceptions import TicketNotAvailable
 from .validators import during_conference
 
 
@@ -28,6 +33,9 @@ PURCHASE_STATES = (
     ('canceled', _('canceled'))
 )
 
+#: Tickets of purchases in these states are not taken from the inventory.
+UNSOLD_PURCHASE_STATES = ('incomplete', 'canceled')
+
 PAYMENT_METHOD_CHOICES = (
     ('invoice', _('Invoice')),
     ('creditcard', _('Credit card')),
@@ -106,6 +114,11 @@ class Voucher(models.Model):
         super(Voucher, self).save(*args, **kwargs)
 
 
+# Ticket types cached by TicketTypeManager.get_cached() by pk, together with
+# the time they expire.
+_ticket_type_cache = {}
+
+
 class TicketTypeManager(models.Manager):
 
     def available(self):
@@ -120,6 +133,34 @@ class TicketTypeManager(models.Manager):
         else:
             return settings.PRODUCT_NUMBER_START
 
+    def get_cached(self, pks):
+        """
+        Returns a dict of the ticket types with the given pks (missing ones
+        are left out) including their conference, content type and voucher
+        type. The ticket types are cached in this process for
+        ``PURCHASE_TICKET_TYPE_CACHE_TIMEOUT`` seconds, so that they don't
+        have to be fetched on every step of a checkout. Every call returns
+        copies, which may be changed freely.
+        """
+        current_time = time.time()
+        result = {}
+        missing = []
+        for pk in pks:
+            entry = _ticket_type_cache.get(pk)
+            if entry is None or entry[0] <= current_time:
+                missing.append(pk)
+            else:
+                result[pk] = copy.copy(entry[1])
+        if missing:
+            expires = current_time + settings.TICKET_TYPE_CACHE_TIMEOUT
+            ticket_types = self.select_related(
+                'conference', 'content_type', 'vouchertype_needed'
+            ).in_bulk(missing)
+            for pk, ticket_type in ticket_types.items():
+                _ticket_type_cache[pk] = (expires, ticket_type)
+                result[pk] = copy.copy(ticket_type)
+        return result
+
     def filter_ondesk(self):
         vt_ct = content_models.ContentType.objects.get_for_model(VenueTicket)
         return self.get_queryset().filter(is_on_desk_active=True,
@@ -196,20 +237,36 @@ class TicketType(models.Model):
 
     @property
     def purchases_count(self):
-        # Ignore incomplete purchases.
-        return self.ticket_set.filter(ticket_type=self).exclude(
-            purchase__state='incomplete').count()
+        # Ignore incomplete and canceled purchases as well as canceled tickets.
+        return self.ticket_set.filter(canceled=False).exclude(
+            purchase__state__in=UNSOLD_PURCHASE_STATES).count()
+
+    def get_inventory(self):
+        try:
+            return self.inventory
+        except TicketInventory.DoesNotExist:
+            TicketInventory.objects.reconcile([self.pk])
+            self.inventory = TicketInventory.objects.get(ticket_type=self)
+            return self.inventory
+
+    @property
+    def sold_tickets(self):
+        """
+        Returns the number of sold tickets as counted by the inventory.
+        """
+        return self.get_inventory().sold
 
     @property
     def available_tickets(self):
         """
         Returns a number of still purchasable tickets or None if there is no
-        limit.
+        limit. Tickets held for running checkouts are not available.
         """
         if self.max_purchases < 1:
             return None
         else:
-            available_tickets = self.max_purchases - self.purchases_count
+            inventory = self.get_inventory()
+            available_tickets = self.max_purchases - inventory.sold - inventory.held
             return available_tickets if available_tickets > 0 else 0
 
     def save(self, *args, **kwargs):
@@ -241,6 +298,184 @@ class TicketType(models.Model):
         return self.fee - self.tax
 
 
+class TicketInventoryManager(models.Manager):
+
+    def reserve(self, ticket_type, quantity):
+        """
+        Holds the given number of tickets of the given type if they are
+        still available and returns whether that was possible. The counter
+        is checked and incremented by a single UPDATE, so concurrent
+        checkouts cannot oversell.
+        """
+        counter = self.filter(ticket_type=ticket_type)
+        if ticket_type.max_purchases > 0:
+            counter = counter.filter(
+                sold__lte=ticket_type.max_purchases - quantity - F('held'))
+        reserved = counter.update(held=F('held') + quantity)
+        if not reserved and not self.filter(ticket_type=ticket_type).exists():
+            self.reconcile([ticket_type.pk])
+            return self.reserve(ticket_type, quantity)
+        return bool(reserved)
+
+    def adjust(self, counts, field='sold'):
+        """
+        Adds the given numbers of tickets (which may be negative) to the
+        sold (or held) counters of the ticket types given by their ids.
+        Every counter is changed by a single UPDATE, so concurrent
+        purchases don't get lost.
+        """
+        for ticket_type_pk, count in counts.items():
+            if not count:
+                continue
+            counter = self.filter(ticket_type=ticket_type_pk)
+            if count > 0:
+                updated = counter.update(**{field: F(field) + count})
+            else:
+                updated = counter.filter(**{field + '__gte': -count}) \
+                    .update(**{field: F(field) + count}) \
+                    or counter.update(**{field: 0})
+            if not updated:
+                self.reconcile([ticket_type_pk])
+
+    def reconcile(self, ticket_type_pks=None):
+        """
+        Recounts the sold and held tickets of the given (or all) ticket
+        types and fixes the counters that are off. Returns a dictionary
+        mapping the affected ticket type ids to their former (sold, held)
+        counts (``None`` if there was no counter yet).
+        """
+        ticket_types = TicketType.objects.all()
+        tickets = Ticket.objects.filter(canceled=False) \
+            .exclude(purchase__state__in=UNSOLD_PURCHASE_STATES)
+        holds = TicketHold.objects.all()
+        if ticket_type_pks is not None:
+            ticket_types = ticket_types.filter(pk__in=ticket_type_pks)
+            tickets = tickets.filter(ticket_type__in=ticket_type_pks)
+            holds = holds.filter(ticket_type__in=ticket_type_pks)
+        sold = dict(tickets.order_by().values('ticket_type')
+                    .annotate(sold=models.Count('pk'))
+                    .values_list('ticket_type', 'sold'))
+        held = dict(holds.order_by().values('ticket_type')
+                    .annotate(held=models.Sum('quantity'))
+                    .values_list('ticket_type', 'held'))
+        actual = dict((pk, (sold.get(pk, 0), held.get(pk, 0)))
+                      for pk in ticket_types.values_list('pk', flat=True))
+        stored = dict((pk, (s, h)) for pk, s, h in
+                      self.filter(ticket_type__in=actual.keys())
+                      .values_list('ticket_type', 'sold', 'held'))
+        fixed = {}
+        for ticket_type_pk, counts in actual.items():
+            values = {'sold': counts[0], 'held': counts[1]}
+            if ticket_type_pk not in stored:
+                _, created = self.get_or_create(ticket_type_id=ticket_type_pk,
+                                                defaults=values)
+                if created:
+                    fixed[ticket_type_pk] = None
+            elif stored[ticket_type_pk] != counts:
+                self.filter(ticket_type=ticket_type_pk).update(**values)
+                fixed[ticket_type_pk] = stored[ticket_type_pk]
+        return fixed
+
+
+class TicketInventory(models.Model):
+    """
+    Number of sold and held tickets of a ticket type, so that the
+    availability of tickets can be checked without counting them. The
+    counters are kept up to date whenever tickets, purchases or holds
+    change; those stay the source of truth and the counters can be fixed
+    using the ``reconcile_inventory`` management command.
+    """
+    ticket_type = models.OneToOneField(TicketType, primary_key=True,
+        related_name='inventory', verbose_name=_('Ticket type'))
+    sold = models.PositiveIntegerField(_('Sold tickets'), default=0)
+    held = models.PositiveIntegerField(_('Held tickets'), default=0)
+
+    objects = TicketInventoryManager()
+
+    class Meta:
+        verbose_name = _('Ticket inventory')
+        verbose_name_plural = _('Ticket inventories')
+
+
+class TicketHoldManager(models.Manager):
+
+    def hold(self, key, quantities, expires):
+        """
+        Holds tickets for the checkout with the given key until it expires,
+        replacing any former holds of it. ``quantities`` maps ticket types
+        to the number of tickets. Either all or none of the tickets are
+        held; :class:`~pyconde.attendees.exceptions.TicketNotAvailable` is
+        raised for the first ticket type that is sold out.
+        """
+        with transaction.atomic():
+            self.release(key)
+            for ticket_type, quantity in quantities.items():
+                if not TicketInventory.objects.reserve(ticket_type, quantity):
+                    if not self.release_expired([ticket_type.pk]) or \
+                            not TicketInventory.objects.reserve(ticket_type, quantity):
+                        raise TicketNotAvailable(ticket_type)
+                self.create(key=key, ticket_type=ticket_type,
+                            quantity=quantity, expires=expires)
+
+    def get_held(self, key):
+        """
+        Returns a dictionary mapping the ids of the ticket types held for
+        the given checkout to their quantity, unless the holds expired.
+        """
+        return dict(self.filter(key=key, expires__gt=datetime.datetime.utcnow())
+                    .values_list('ticket_type', 'quantity'))
+
+    def release(self, key):
+        """
+        Gives the tickets held for the given checkout back to the inventory.
+        """
+        return self._release(self.filter(key=key))
+
+    def release_expired(self, ticket_type_pks=None):
+        """
+        Gives the tickets of all expired holds (of the given ticket types)
+        back to the inventory and returns the number of released holds.
+        """
+        holds = self.filter(expires__lte=datetime.datetime.utcnow())
+        if ticket_type_pks is not None:
+            holds = holds.filter(ticket_type__in=ticket_type_pks)
+        return self._release(holds)
+
+    def _release(self, holds):
+        with transaction.atomic():
+            released = list(holds.select_for_update()
+                            .values_list('pk', 'ticket_type', 'quantity'))
+            if not released:
+                return 0
+            self.filter(pk__in=[pk for pk, _, _ in released]).delete()
+            counts = collections.Counter()
+            for _, ticket_type_pk, quantity in released:
+                counts[ticket_type_pk] -= quantity
+            TicketInventory.objects.adjust(counts, field='held')
+        return len(released)
+
+
+class TicketHold(models.Model):
+    """
+    Tickets of a type held for a running checkout. The tickets are not
+    available to others until the hold is released, either when the
+    purchase gets completed or when the checkout expires.
+
+    ``expires`` is in UTC, just like the expiry of the checkout state.
+    """
+    key = models.CharField(_('Checkout'), max_length=32, db_index=True)
+    ticket_type = models.ForeignKey(TicketType, related_name='holds',
+        verbose_name=_('Ticket type'))
+    quantity = models.PositiveIntegerField(_('Quantity'))
+    expires = models.DateTimeField(_('Expires'), db_index=True)
+
+    objects = TicketHoldManager()
+
+    class Meta:
+        verbose_name = _('Ticket hold')
+        verbose_name_plural = _('Ticket holds')
+
+
 class PurchaseManager(models.Manager):
     def get_exportable_purchases(self):
         return self.filter(exported=False)
@@ -295,6 +530,15 @@ class Purchase(models.Model):
         verbose_name = _('Purchase')
         verbose_name_plural = _('Purchases')
 
+    def __init__(self, *args, **kwargs):
+        super(Purchase, self).__init__(*args, **kwargs)
+        # The state as of the last load or save, for updating the inventory
+        self._saved_state = self.state
+
+    @property
+    def is_sold(self):
+        return self.state not in UNSOLD_PURCHASE_STATES
+
     def subtotal(self, tickets=None):
         return self.calculate_payment_total() - self.payment_tax
 
@@ -394,6 +638,114 @@ class TicketManager(models.Manager):
                        )\
                    .filter(purchase__state='payment_received')
 
+    def bulk_create_for_purchase(self, purchase, tickets):
+        """
+        Saves the given new tickets of a purchase including their related
+        data (see Ticket.save_related_data) with a few bulk inserts: the
+        Ticket rows first, then the rows of each ticket subclass and finally
+        the rows of the m2m relations.
+
+        No signals are sent for the tickets, they are only added to the
+        inventory here if the purchase is already sold.
+        """
+        tickets = list(tickets)
+        if not tickets:
+            return tickets
+        using = router.db_for_write(Ticket)
+        with transaction.atomic(using=using):
+            for ticket in tickets:
+                ticket.purchase = purchase
+            _insert_in_batches(Ticket, tickets, [
+                f for f in Ticket._meta.local_concrete_fields
+                if not f.primary_key], using)
+
+            # Bulk inserts don't return the new primary keys, but the new
+            # tickets are the latest ones of the purchase.
+            pks = list(Ticket._base_manager.using(using)
+                       .filter(purchase=purchase).order_by('-pk')
+                       .values_list('pk', flat=True)[:len(tickets)])
+            pks.reverse()
+            subclass_tickets = collections.OrderedDict()
+            for ticket, pk in zip(tickets, pks):
+                ticket.id = ticket.pk = pk
+                ticket._state.adding = False
+                ticket._state.db = using
+                model = ticket._meta.concrete_model
+                if model is not Ticket:
+                    subclass_tickets.setdefault(model, []).append(ticket)
+            for model, objs in subclass_tickets.items():
+                _insert_in_batches(model, objs,
+                                   model._meta.local_concrete_fields, using)
+
+            through_rows = collections.OrderedDict()
+            for ticket in tickets:
+                for name, values in ticket.related_data.items():
+                    field = ticket._meta.get_field(name)
+                    through = field.rel.through
+                    source = through._meta.get_field(
+                        field.m2m_field_name()).attname
+                    target = through._meta.get_field(
+                        field.m2m_reverse_field_name()).attname
+                    target_pks = collections.OrderedDict.fromkeys(
+                        getattr(value, 'pk', value) for value in values)
+                    through_rows.setdefault(through, []).extend(
+                        through(**{source: ticket.pk, target: target_pk})
+                        for target_pk in target_pks)
+            for through, rows in through_rows.items():
+                through._base_manager.using(using).bulk_create(rows)
+
+            if purchase.is_sold:
+                TicketInventory.objects.adjust(collections.Counter(
+                    ticket.ticket_type_id for ticket in tickets
+                    if not ticket.canceled))
+        return tickets
+
+    def delete_for_purchase(self, purchase):
+        """
+        Deletes all tickets of a purchase with a few bulk deletes, the
+        counterpart of bulk_create_for_purchase: the rows of the m2m
+        relations first, then the rows of each ticket subclass and finally
+        the Ticket rows.
+
+        No signals are sent for the tickets, they are only given back to
+        the inventory here (once per ticket type) if the purchase is sold.
+        """
+        using = router.db_for_write(Ticket)
+        with transaction.atomic(using=using):
+            tickets = list(Ticket._base_manager.using(using)
+                           .filter(purchase=purchase)
+                           .values_list('pk', 'ticket_type', 'canceled'))
+            if not tickets:
+                return
+            pks = [pk for pk, ticket_type_pk, canceled in tickets]
+            subclasses = [rel.related_model for rel in Ticket._meta.get_fields()
+                          if rel.one_to_one and rel.auto_created and rel.parent_link]
+            for model in [Ticket] + subclasses:
+                for field in model._meta.local_many_to_many:
+                    field.rel.through._base_manager.using(using) \
+                        .filter(**{field.m2m_field_name() + '__in': pks}) \
+                        ._raw_delete(using)
+            for model in subclasses + [Ticket]:
+                model._base_manager.using(using).filter(pk__in=pks)._raw_delete(using)
+
+            if purchase.is_sold:
+                counts = collections.Counter()
+                for pk, ticket_type_pk, canceled in tickets:
+                    if not canceled:
+                        counts[ticket_type_pk] -= 1
+                TicketInventory.objects.adjust(counts)
+
+
+def _insert_in_batches(model, objs, fields, using):
+    """
+    Inserts the rows of the given fields of the given objects into the table
+    of the model, as many at once as the database allows.
+    """
+    batch_size = max(connections[using].ops.bulk_batch_size(fields, objs), 1)
+    for start in range(0, len(objs), batch_size):
+        model._base_manager._insert(objs[start:start + batch_size],
+                                    fields=fields, using=using)
+
 
 class Ticket(models.Model):
     purchase = models.ForeignKey(Purchase)
@@ -413,6 +765,9 @@ class Ticket(models.Model):
     def __init__(self, *args, **kwargs):
         obj = super(Ticket, self).__init__(*args, **kwargs)
         self.related_data = {}
+        # The ticket type and state as of the last load or save, for
+        # updating the inventory
+        self._saved_inventory_state = (self.ticket_type_id, self.canceled)
         return obj
 
     class Meta:
@@ -569,3 +924,77 @@ class SIMCardTicket(Ticket):
     def invoice_item_title(self):
         return force_text('SIM Card for:<br /><i>%s %s</i>' %
             (self.first_name, self.last_name))
+
+
+def _get_inventory_counts(purchase):
+    return dict(purchase.ticket_set.filter(canceled=False).order_by()
+                .values('ticket_type').annotate(sold=models.Count('pk'))
+                .values_list('ticket_type', 'sold'))
+
+
+def clear_ticket_type_cache(sender, instance, **kwargs):
+    """
+    Removes a changed ticket type from the cache of this process. Other
+    processes see the change once their cached copy expires.
+    """
+    _ticket_type_cache.pop(instance.pk, None)
+
+
+def update_inventory_for_purchase(sender, instance, created, raw=False, **kwargs):
+    """
+    Adds the tickets of a purchase to or removes them from the inventory
+    when the purchase gets into or out of a sold state.
+    """
+    # Purchases pickled before the state was tracked don't have it
+    saved_state = getattr(instance, '_saved_state', instance.state)
+    instance._saved_state = instance.state
+    if raw or created:
+        return
+    was_sold = saved_state not in UNSOLD_PURCHASE_STATES
+    if was_sold == instance.is_sold:
+        return
+    sign = 1 if instance.is_sold else -1
+    TicketInventory.objects.adjust(dict(
+        (ticket_type_pk, sign * count)
+        for ticket_type_pk, count in _get_inventory_counts(instance).items()))
+
+
+def update_inventory_for_ticket(sender, instance, created, raw=False, **kwargs):
+    """
+    Updates the inventory when a ticket of a sold purchase is created,
+    canceled or changes its type.
+    """
+    saved_type_pk, saved_canceled = getattr(
+        instance, '_saved_inventory_state',
+        (instance.ticket_type_id, instance.canceled))
+    instance._saved_inventory_state = (instance.ticket_type_id, instance.canceled)
+    if raw or not instance.purchase.is_sold:
+        return
+    counts = collections.Counter()
+    if not created and not saved_canceled:
+        counts[saved_type_pk] -= 1
+    if not instance.canceled:
+        counts[instance.ticket_type_id] += 1
+    TicketInventory.objects.adjust(counts)
+
+
+def release_inventory_for_ticket(sender, instance, **kwargs):
+    """
+    Gives the tickets of a sold purchase back to the inventory when they
+    get deleted.
+    """
+    if instance.canceled:
+        return
+    if Purchase.objects.filter(pk=instance.purchase_id) \
+            .exclude(state__in=UNSOLD_PURCHASE_STATES).exists():
+        TicketInventory.objects.adjust({instance.ticket_type_id: -1})
+
+
+models.signals.post_save.connect(clear_ticket_type_cache, sender=TicketType)
+models.signals.post_delete.connect(clear_ticket_type_cache, sender=TicketType)
+models.signals.post_save.connect(update_inventory_for_purchase, sender=Purchase)
+for sender in (Ticket, VenueTicket, SupportTicket, SIMCardTicket):
+    models.signals.post_save.connect(update_inventory_for_ticket, sender=sender)
+# Deleting a ticket of a subclass also deletes its Ticket row, so that the
+# signal is only handled once for the parent.
+models.signals.post_delete.connect(release_inventory_for_ticket, sender=Ticket)
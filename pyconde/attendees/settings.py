@@ -67,3 +67,19 @@ REMINDER_DUE_DATE_OFFSET = getattr(settings,
 REMINDER_LATEST_DUE_DATE = getattr(settings,
                                    'PAYMENT_REMINDER_LATEST_DUE_DATE',
                                    '')
+
+# Number of customers per second admitted to the purchase process by the
+# waiting room. 0 disables the waiting room.
+WAITING_ROOM_RATE = getattr(settings, 'PURCHASE_WAITING_ROOM_RATE', 0)
+
+# Number of seconds an admission to the purchase process stays valid.
+WAITING_ROOM_ADMISSION_DURATION = getattr(
+    settings, 'PURCHASE_WAITING_ROOM_ADMISSION_DURATION',
+    2 * settings.MAX_CHECKOUT_DURATION)
+
+# Cache (alias) storing the state of running checkouts.
+CHECKOUT_CACHE = getattr(settings, 'PURCHASE_CHECKOUT_CACHE', 'default')
+
+# Number of seconds ticket types are cached in-process for the checkout.
+TICKET_TYPE_CACHE_TIMEOUT = getattr(
+    settings, 'PURCHASE_TICKET_TYPE_CACHE_TIMEOUT', 60)
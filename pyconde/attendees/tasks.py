@@ -176,3 +176,10 @@ def cancel_purchase(purchase_id, recipients):
 
         send_mail(ticket_subject, ticket_message, settings.DEFAULT_FROM_EMAIL,
             [ticket_recipient], fail_silently=True)
+
+
+@app.task(ignore_result=True)
+def release_expired_ticket_holds():
+    from .models import TicketHold
+
+    TicketHold.objects.release_expired()
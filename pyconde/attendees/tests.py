@@ -1,25 +1,48 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import collections
 import datetime
+import json
 import mock
 
 from decimal import Decimal
+from importlib import import_module
 from os import path, unlink
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.db.models import Max
-from django.test import TestCase
-
+from django.test import Client, TestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from . import checkout
+from . import exceptions
+from . import settings as app_settings
+from . import tasks
 from . import utils
 from . import forms
 from . import models
+from . import views
+from . import waiting_room
 from ..conference.models import Conference
 
 
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'attendees-tests',
+    }
+}
+
+
 def escape_redirect(s):
     return s.replace('/', '%2F')
 
@@ -272,9 +295,11 @@ class PurchaseOverviewFormTests(TestCase):
         self.assertIn('creditcard', available_methods)
 
 
+@override_settings(CACHES=LOCMEM_CACHES)
 class PurchaseProcessTest(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.now = datetime.datetime.now()
         self.purchase_start = self.now - datetime.timedelta(days=5)
         self.purchase_end = self.now + datetime.timedelta(days=25)
@@ -495,7 +520,8 @@ class PurchaseProcessTest(TestCase):
         self.assertRedirects(response, reverse('attendees_purchase_names'))
 
         # check for created tickets
-        tickets = self.client.session['purchase_state']['tickets']
+        purchase, tickets = checkout.get_state(
+            self.client.session['purchase_state']['checkout'])
         self.assertIsInstance(tickets[0], models.VenueTicket)
         self.assertIsInstance(tickets[1], models.VenueTicket)
         self.assertIsInstance(tickets[2], models.VenueTicket)
@@ -535,7 +561,8 @@ class PurchaseProcessTest(TestCase):
         self.assertContains(response, '<legend>2. TT:SIM</legend>', count=1, html=True)
 
         # check for form fields
-        tickets = self.client.session['purchase_state']['tickets']
+        purchase, tickets = checkout.get_state(
+            self.client.session['purchase_state']['checkout'])
         for i in range(4):
             self.assertNameForm(response, tickets[i], models.VenueTicket)
         for i in range(4, 6):
@@ -965,3 +992,565 @@ class TestSupportTicketModel(TestCase):
         expected = set()
         fields = models.SupportTicket.get_fields()
         self.assertEqual(expected, fields)
+
+
+class TestTicketInventory(TestCase):
+    def setUp(self):
+        now = datetime.datetime.now()
+        self.ticket_type = models.TicketType.objects.create(
+            name="limited", fee=100, max_purchases=3,
+            date_valid_from=now - datetime.timedelta(days=1),
+            date_valid_to=now + datetime.timedelta(days=1),
+            content_type=ctype(models.VenueTicket))
+        self.other_ticket_type = models.TicketType.objects.create(
+            name="other", fee=100,
+            date_valid_from=now - datetime.timedelta(days=1),
+            date_valid_to=now + datetime.timedelta(days=1),
+            content_type=ctype(models.VenueTicket))
+        self.purchase_data = {
+            'first_name': 'Max',
+            'last_name': 'Mustermann',
+            'email': 'max@mustermann.de',
+            'street': 'Musterstraße',
+            'zip_code': 12345,
+            'city': 'Musterhausen',
+            'country': 'Musterland',
+        }
+
+    def create_purchase(self, num_tickets, state='incomplete'):
+        purchase = models.Purchase.objects.create(state=state, **self.purchase_data)
+        for _ in range(num_tickets):
+            models.VenueTicket.objects.create(purchase=purchase,
+                                              ticket_type=self.ticket_type)
+        return purchase
+
+    def get_sold(self, ticket_type=None):
+        ticket_type = ticket_type or self.ticket_type
+        return models.TicketInventory.objects.get(ticket_type=ticket_type).sold
+
+    def test_completed_purchase(self):
+        purchase = self.create_purchase(2)
+        self.assertEqual(0, self.ticket_type.sold_tickets)
+        purchase.state = 'new'
+        purchase.save()
+        self.assertEqual(2, self.get_sold())
+        purchase.state = 'payment_received'
+        purchase.save()
+        self.assertEqual(2, self.get_sold())
+        ticket_type = models.TicketType.objects.select_related('inventory') \
+                                               .get(pk=self.ticket_type.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(1, ticket_type.available_tickets)
+
+    def test_canceled(self):
+        purchase = self.create_purchase(3, state='payment_received')
+        self.assertEqual(3, self.get_sold())
+        ticket = purchase.ticket_set.all()[0]
+        ticket.canceled = True
+        ticket.save()
+        self.assertEqual(2, self.get_sold())
+        purchase = models.Purchase.objects.get(pk=purchase.pk)
+        purchase.state = 'canceled'
+        purchase.save()
+        self.assertEqual(0, self.get_sold())
+
+    def test_ticket_type_changed(self):
+        purchase = self.create_purchase(2, state='new')
+        ticket = models.VenueTicket.objects.filter(purchase=purchase)[0]
+        ticket.ticket_type = self.other_ticket_type
+        ticket.save()
+        self.assertEqual(1, self.get_sold())
+        self.assertEqual(1, self.get_sold(self.other_ticket_type))
+
+    def test_deleted(self):
+        purchase = self.create_purchase(2, state='new')
+        models.VenueTicket.objects.filter(purchase=purchase)[0].delete()
+        self.assertEqual(1, self.get_sold())
+        purchase.delete()
+        self.assertEqual(0, self.get_sold())
+
+    def test_stale_purchase_purged(self):
+        self.create_purchase(1, state='new')
+        self.create_purchase(2).delete()
+        self.assertEqual(1, self.get_sold())
+
+    def test_reconcile(self):
+        self.create_purchase(2, state='new')
+        models.TicketInventory.objects.update(sold=10)
+        models.TicketInventory.objects.filter(ticket_type=self.other_ticket_type).delete()
+        self.assertEqual({self.ticket_type.pk: (10, 0), self.other_ticket_type.pk: None},
+                         models.TicketInventory.objects.reconcile())
+        self.assertEqual(2, self.get_sold())
+        self.assertEqual(0, self.get_sold(self.other_ticket_type))
+        self.assertEqual({}, models.TicketInventory.objects.reconcile())
+
+    def test_missing_counter_is_created(self):
+        models.TicketInventory.objects.all().delete()
+        self.create_purchase(2, state='new')
+        self.assertEqual(2, self.get_sold())
+        models.TicketInventory.objects.all().delete()
+        self.assertEqual(1, models.TicketType.objects.get(pk=self.ticket_type.pk).available_tickets)
+
+
+class TestTicketHold(TestCase):
+    def setUp(self):
+        now = datetime.datetime.now()
+        self.ticket_type = models.TicketType.objects.create(
+            name="limited", fee=100, max_purchases=3,
+            date_valid_from=now - datetime.timedelta(days=1),
+            date_valid_to=now + datetime.timedelta(days=1),
+            content_type=ctype(models.VenueTicket))
+        self.unlimited_ticket_type = models.TicketType.objects.create(
+            name="unlimited", fee=100,
+            date_valid_from=now - datetime.timedelta(days=1),
+            date_valid_to=now + datetime.timedelta(days=1),
+            content_type=ctype(models.VenueTicket))
+        self.expires = datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
+
+    def get_available(self):
+        return models.TicketType.objects.get(pk=self.ticket_type.pk).available_tickets
+
+    def test_hold(self):
+        models.TicketHold.objects.hold('a', {self.ticket_type: 2}, self.expires)
+        self.assertEqual(1, self.get_available())
+        self.assertEqual({self.ticket_type.pk: 2}, models.TicketHold.objects.get_held('a'))
+        with self.assertRaises(exceptions.TicketNotAvailable):
+            models.TicketHold.objects.hold('b', {self.ticket_type: 2}, self.expires)
+        models.TicketHold.objects.hold('b', {self.ticket_type: 1}, self.expires)
+        self.assertEqual(0, self.get_available())
+
+    def test_hold_replaces_former_hold(self):
+        models.TicketHold.objects.hold('a', {self.ticket_type: 2}, self.expires)
+        models.TicketHold.objects.hold('a', {self.ticket_type: 3}, self.expires)
+        self.assertEqual(0, self.get_available())
+        self.assertEqual(1, models.TicketHold.objects.count())
+
+    def test_hold_all_or_nothing(self):
+        with self.assertRaises(exceptions.TicketNotAvailable):
+            models.TicketHold.objects.hold('a', collections.OrderedDict([
+                (self.unlimited_ticket_type, 5), (self.ticket_type, 4)]), self.expires)
+        self.assertFalse(models.TicketHold.objects.exists())
+        self.assertEqual(0, models.TicketType.objects.get(
+            pk=self.unlimited_ticket_type.pk).get_inventory().held)
+
+    def test_release(self):
+        models.TicketHold.objects.hold('a', {self.ticket_type: 2}, self.expires)
+        self.assertEqual(1, models.TicketHold.objects.release('a'))
+        self.assertEqual(3, self.get_available())
+        self.assertEqual(0, models.TicketHold.objects.release('a'))
+        self.assertEqual(3, self.get_available())
+
+    def test_release_expired(self):
+        expired = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        models.TicketHold.objects.hold('a', {self.ticket_type: 2}, expired)
+        models.TicketHold.objects.hold('b', {self.ticket_type: 1}, self.expires)
+        self.assertEqual({}, models.TicketHold.objects.get_held('a'))
+        tasks.release_expired_ticket_holds()
+        self.assertEqual(2, self.get_available())
+        self.assertEqual(['b'], list(models.TicketHold.objects.values_list('key', flat=True)))
+
+    def test_hold_releases_expired_when_sold_out(self):
+        expired = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        models.TicketHold.objects.hold('a', {self.ticket_type: 3}, expired)
+        models.TicketHold.objects.hold('b', {self.ticket_type: 3}, self.expires)
+        self.assertEqual({self.ticket_type.pk: 3}, models.TicketHold.objects.get_held('b'))
+        self.assertEqual(0, self.get_available())
+
+    @mock.patch('pyconde.attendees.utils.send_purchase_confirmation_mail')
+    @mock.patch('pyconde.attendees.utils.generate_invoice_number',
+                new_callable=get_next_invoice_number)
+    def test_complete_purchase_converts_hold(self, mock_invoice_number, mock_send_mail):
+        purchase = models.Purchase.objects.create(
+            first_name='Max', last_name='Mustermann', email='max@mustermann.de',
+            street='Musterstraße', zip_code=12345, city='Musterhausen',
+            country='Musterland')
+        for _ in range(2):
+            models.VenueTicket.objects.create(purchase=purchase, ticket_type=self.ticket_type)
+        models.TicketHold.objects.hold('a', {self.ticket_type: 2}, self.expires)
+        request = RequestFactory().get('/')
+        request.session = {'purchase_state': {'hold': 'a'}}
+        utils.complete_purchase(request, purchase)
+        inventory = models.TicketInventory.objects.get(ticket_type=self.ticket_type)
+        self.assertEqual((2, 0), (inventory.sold, inventory.held))
+        self.assertFalse(models.TicketHold.objects.exists())
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_checkout_holds_again(self):
+        from .views import PurchaseMixin
+
+        def create_checkout(step):
+            checkout = PurchaseMixin()
+            checkout.request = request
+            checkout.step = step
+            return checkout
+
+        request = RequestFactory().get('/')
+        request.session = {}
+        request.user = AnonymousUser()
+        checkout = create_checkout('start')
+        checkout.purchase = models.Purchase()
+        checkout.tickets = [models.VenueTicket(ticket_type=self.ticket_type),
+                            models.VenueTicket(ticket_type=self.ticket_type)]
+        checkout.hold_tickets()
+        checkout.save_state()
+        self.assertEqual(1, self.get_available())
+
+        models.TicketHold.objects.release(checkout.hold_key)
+        checkout = create_checkout('names')
+        checkout.get_previous_state()
+        self.assertEqual({self.ticket_type.pk: 2},
+                         models.TicketHold.objects.get_held(checkout.hold_key))
+        self.assertEqual(3, checkout.limited_tickets[0]['available'])
+
+        models.TicketHold.objects.release(checkout.hold_key)
+        models.TicketHold.objects.hold('other', {self.ticket_type: 2}, self.expires)
+        with self.assertRaises(exceptions.TicketNotAvailable):
+            create_checkout('names').get_previous_state()
+
+        create_checkout('names').clear_purchase_info()
+        self.assertEqual(1, self.get_available())
+
+
+@mock.patch.object(app_settings, 'WAITING_ROOM_RATE', 2)
+@mock.patch.object(app_settings, 'WAITING_ROOM_ADMISSION_DURATION', 60)
+class TestWaitingRoom(TestCase):
+    def setUp(self):
+        self.settings_override = self.settings(CACHES=LOCMEM_CACHES)
+        self.settings_override.enable()
+        cache.clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def test_enqueue_is_fifo(self):
+        with mock.patch.object(waiting_room, '_now', return_value=10000):
+            admissions = [waiting_room.enqueue('session') for i in range(3)]
+            self.assertEqual([10000, 10500, 11000],
+                             [a.admit_at for a in admissions])
+            self.assertTrue(admissions[0].is_admitted())
+            self.assertFalse(admissions[1].is_admitted())
+            self.assertEqual(1.0, admissions[2].get_wait())
+            self.assertEqual(2, waiting_room.get_queue_length())
+        # Nobody waiting anymore: the next customer is admitted right away
+        with mock.patch.object(waiting_room, '_now', return_value=20000):
+            self.assertEqual(0, waiting_room.get_queue_length())
+            self.assertEqual(20000, waiting_room.enqueue('session').admit_at)
+
+    def test_admission_expires(self):
+        admission = waiting_room.Admission('id', 10000, 'session')
+        self.assertTrue(admission.is_admitted(69999))
+        self.assertFalse(admission.is_admitted(70000))
+        self.assertTrue(admission.is_expired(70000))
+
+    def test_token(self):
+        admission = waiting_room.Admission('id', 10000, 'session')
+        token = admission.to_token()
+        self.assertEqual(admission, waiting_room.Admission.from_token(token))
+        self.assertIsNone(waiting_room.Admission.from_token(token[:-1] + 'x'))
+        self.assertIsNone(waiting_room.Admission.from_token('garbage'))
+
+    def test_admission_is_bound_to_session(self):
+        response = self.client.get(reverse('attendees_waiting_room'))
+        token = response.cookies[waiting_room.COOKIE_NAME].value
+        admission = waiting_room.Admission.from_token(token)
+        self.assertEqual(waiting_room.get_session_hash(
+            self.client.cookies[settings.SESSION_COOKIE_NAME].value), admission.session)
+        # Another client replaying the cookie is queued again
+        client = Client()
+        client.cookies[waiting_room.COOKIE_NAME] = token
+        response = client.get(reverse('attendees_waiting_room'))
+        self.assertNotEqual(admission.id, waiting_room.Admission.from_token(
+            response.cookies[waiting_room.COOKIE_NAME].value).id)
+
+    def test_entry_is_recorded_once(self):
+        admission = waiting_room.enqueue('session')
+        self.assertTrue(waiting_room.enter(admission))
+        self.assertFalse(waiting_room.enter(admission))
+        self.assertEqual(1, waiting_room.get_stats(minutes=1)['admitted'][0])
+
+    def test_purchase_redirects_to_waiting_room(self):
+        get_user_model().objects.create_user('user@example.com', 'password', username='user')
+        self.client.login(username='user', password='password')
+        response = self.client.get(reverse('attendees_purchase'))
+        self.assertRedirects(response, '{0}?next={1}'.format(
+            reverse('attendees_waiting_room'),
+            escape_redirect(reverse('attendees_purchase'))),
+            fetch_redirect_response=False)
+
+    def test_waiting_room_admits_first_customer(self):
+        get_user_model().objects.create_user('user@example.com', 'password', username='user')
+        self.client.login(username='user', password='password')
+        url = '{0}?next={1}'.format(reverse('attendees_waiting_room'),
+                                    reverse('attendees_purchase'))
+        response = self.client.get(url)
+        self.assertRedirects(response, reverse('attendees_purchase'),
+                             fetch_redirect_response=False)
+        admission = waiting_room.Admission.from_token(
+            response.cookies[waiting_room.COOKIE_NAME].value)
+        self.assertTrue(admission.is_admitted())
+        response = self.client.get(reverse('attendees_purchase'))
+        self.assertEqual(200, response.status_code)
+
+    def test_waiting_room_queues_customer(self):
+        waiting_room.enqueue('session')
+        response = self.client.get(reverse('attendees_waiting_room'))
+        self.assertEqual(200, response.status_code)
+        self.assertTemplateUsed(response, 'attendees/waiting_room.html')
+        token = response.cookies[waiting_room.COOKIE_NAME].value
+        # Reloading keeps the place in the queue
+        response = self.client.get(reverse('attendees_waiting_room'))
+        self.assertNotIn(waiting_room.COOKIE_NAME, response.cookies)
+        self.assertEqual(token, self.client.cookies[waiting_room.COOKIE_NAME].value)
+
+    def test_waiting_room_ignores_unsafe_next(self):
+        response = self.client.get(reverse('attendees_waiting_room'),
+                                   {'next': 'http://example.org/'})
+        self.assertRedirects(response, reverse('attendees_purchase'),
+                             fetch_redirect_response=False)
+
+    def test_status_without_database(self):
+        waiting_room.enqueue('session')
+        self.client.get(reverse('attendees_waiting_room'))
+        request = RequestFactory().get(reverse('attendees_waiting_room_status'))
+        request.COOKIES.update((name, cookie.value) for name, cookie in self.client.cookies.items())
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(
+            request.COOKIES[settings.SESSION_COOKIE_NAME])
+        with self.assertNumQueries(0):
+            response = views.waiting_room_status_view(request)
+        self.assertFalse(request.session.accessed)
+        status = json.loads(response.content)
+        self.assertFalse(status['admitted'])
+        self.assertFalse(status['expired'])
+        self.assertTrue(0 < status['wait'] <= 0.5)
+        self.assertEqual('no-cache', response['Cache-Control'])
+
+    def test_status_without_admission(self):
+        response = self.client.get(reverse('attendees_waiting_room_status'))
+        status = json.loads(response.content)
+        self.assertFalse(status['admitted'])
+        self.assertTrue(status['expired'])
+
+    def test_stats(self):
+        waiting_room.enter(waiting_room.enqueue('session'))
+        waiting_room.enqueue('session')
+        stats = waiting_room.get_stats(minutes=5)
+        self.assertEqual(5, len(stats['queued']))
+        self.assertEqual(2, stats['queued'][0])
+        self.assertEqual(1, stats['admitted'][0])
+        self.assertEqual(1, stats['queue_length'])
+
+    def test_stats_view_requires_staff(self):
+        get_user_model().objects.create_user('user@example.com', 'password', username='user')
+        self.client.login(username='user', password='password')
+        response = self.client.get(reverse('attendees_waiting_room_stats'))
+        self.assertEqual(403, response.status_code)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestCheckoutState(TestCase):
+    def setUp(self):
+        cache.clear()
+        now = datetime.datetime.now()
+        self.conference = Conference.objects.create(title='TestConf')
+        self.ticket_type = models.TicketType.objects.create(
+            conference=self.conference, name='TT:Standard', fee=100,
+            date_valid_from=now - datetime.timedelta(days=1),
+            date_valid_to=now + datetime.timedelta(days=1),
+            content_type=ctype(models.VenueTicket))
+        self.expires = datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
+        self.purchase = models.Purchase(
+            conference=self.conference, first_name='Max',
+            last_name='Mustermann', email='max@mustermann.de',
+            payment_total=Decimal('200.00'))
+        self.preference = models.DietaryPreference.objects.create(name='Vegan')
+
+    def create_tickets(self):
+        tickets = [models.VenueTicket(purchase=self.purchase, pk=idx,
+                                      ticket_type=self.ticket_type,
+                                      first_name='First {0}'.format(idx))
+                   for idx in range(2)]
+        tickets[1].related_data['dietary_preferences'] = [self.preference]
+        return tickets
+
+    def test_round_trip(self):
+        checkout.set_state('a', self.purchase, self.create_tickets(), self.expires)
+        purchase, tickets = checkout.get_state('a')
+        self.assertIsNone(purchase.pk)
+        self.assertEqual('Mustermann', purchase.last_name)
+        self.assertEqual(Decimal('200.00'), purchase.payment_total)
+        self.assertEqual(self.conference.pk, purchase.conference_id)
+        self.assertEqual([0, 1], [ticket.pk for ticket in tickets])
+        self.assertIsInstance(tickets[0], models.VenueTicket)
+        self.assertEqual('First 1', tickets[1].first_name)
+        self.assertIs(purchase, tickets[1].purchase)
+        self.assertEqual(self.ticket_type.pk, tickets[1].ticket_type.pk)
+        self.assertEqual({}, tickets[0].related_data)
+        self.assertEqual([self.preference],
+                         tickets[1].related_data['dietary_preferences'])
+
+    def test_state_is_compact(self):
+        checkout.set_state('a', self.purchase, self.create_tickets(), self.expires)
+        data = cache.get('checkout:a')
+        self.assertEqual(checkout.STATE_VERSION, data['version'])
+        self.assertEqual({'ticket_type_id': self.ticket_type.pk,
+                          'first_name': 'First 0'},
+                         dict((key, value) for key, value
+                              in data['tickets'][0]['fields'].items()
+                              if key != 'date_added'))
+        self.assertEqual({'dietary_preferences': [self.preference.pk]},
+                         data['tickets'][1]['related'])
+
+    def test_restore_without_queries(self):
+        checkout.set_state('a', self.purchase, self.create_tickets()[:1], self.expires)
+        checkout.get_state('a')
+        with self.assertNumQueries(0):
+            checkout.get_state('a')
+
+    def test_related_objects_loaded_at_once(self):
+        other = models.DietaryPreference.objects.create(name='Halal')
+        tickets = self.create_tickets()
+        tickets[0].related_data['dietary_preferences'] = [other, self.preference]
+        checkout.set_state('a', self.purchase, tickets, self.expires)
+        checkout.get_state('a')
+        with self.assertNumQueries(1):
+            purchase, tickets = checkout.get_state('a')
+        self.assertEqual([[other, self.preference], [self.preference]],
+                         [t.related_data['dietary_preferences'] for t in tickets])
+
+    def test_missing_state(self):
+        self.assertIsNone(checkout.get_state(None))
+        self.assertIsNone(checkout.get_state('a'))
+        checkout.set_state('a', self.purchase, [], self.expires)
+        checkout.delete_state('a')
+        self.assertIsNone(checkout.get_state('a'))
+
+    def test_other_version(self):
+        checkout.set_state('a', self.purchase, [], self.expires)
+        with mock.patch.object(checkout, 'STATE_VERSION', checkout.STATE_VERSION + 1):
+            self.assertIsNone(checkout.get_state('a'))
+
+    def test_deleted_ticket_type(self):
+        checkout.set_state('a', self.purchase, self.create_tickets(), self.expires)
+        self.ticket_type.delete()
+        self.assertIsNone(checkout.get_state('a'))
+
+    def test_ticket_type_cache(self):
+        pks = [self.ticket_type.pk]
+        ticket_type = models.TicketType.objects.get_cached(pks)[self.ticket_type.pk]
+        ticket_type.fee = 0
+        with self.assertNumQueries(0):
+            ticket_type = models.TicketType.objects.get_cached(pks)[self.ticket_type.pk]
+            self.assertEqual(100, ticket_type.fee)
+            self.assertEqual(self.conference, ticket_type.conference)
+        self.ticket_type.fee = 50
+        self.ticket_type.save()
+        self.assertEqual(50, models.TicketType.objects.get_cached(pks)[self.ticket_type.pk].fee)
+        self.assertEqual({}, models.TicketType.objects.get_cached([0]))
+
+
+class TestBulkTicketCreation(TestCase):
+    def setUp(self):
+        now = datetime.datetime.now()
+        self.conference = Conference.objects.create(title='TestConf')
+        self.ticket_types = {}
+        for model in (models.VenueTicket, models.SIMCardTicket, models.SupportTicket):
+            self.ticket_types[model] = models.TicketType.objects.create(
+                conference=self.conference, name=model.__name__, fee=10,
+                max_purchases=100,
+                date_valid_from=now - datetime.timedelta(days=1),
+                date_valid_to=now + datetime.timedelta(days=1),
+                content_type=ctype(model))
+        self.purchase = models.Purchase.objects.create(
+            conference=self.conference, first_name='Max',
+            last_name='Mustermann', email='max@mustermann.de')
+        self.vegan = models.DietaryPreference.objects.create(name='Vegan')
+        self.halal = models.DietaryPreference.objects.create(name='Halal')
+
+    def create_tickets(self, count=1):
+        tickets = []
+        for idx in range(count):
+            venue_ticket = models.VenueTicket(
+                ticket_type=self.ticket_types[models.VenueTicket],
+                first_name='First {0}'.format(idx), last_name='Last')
+            venue_ticket.related_data['dietary_preferences'] = [self.vegan, self.halal]
+            tickets.extend([
+                venue_ticket,
+                models.SIMCardTicket(
+                    ticket_type=self.ticket_types[models.SIMCardTicket],
+                    first_name='Sim {0}'.format(idx), last_name='Last',
+                    date_of_birth=datetime.date(1980, 1, 1), gender='female',
+                    email='sim@example.com'),
+                models.SupportTicket(
+                    ticket_type=self.ticket_types[models.SupportTicket]),
+            ])
+        return tickets
+
+    def test_bulk_create(self):
+        tickets = models.Ticket.objects.bulk_create_for_purchase(
+            self.purchase, self.create_tickets(2))
+        self.assertEqual(6, models.Ticket.objects.filter(purchase=self.purchase).count())
+        self.assertEqual(
+            sorted(ticket.pk for ticket in tickets),
+            sorted(models.Ticket.objects.filter(purchase=self.purchase)
+                   .values_list('pk', flat=True)))
+        venue_ticket = models.VenueTicket.objects.get(pk=tickets[3].pk)
+        self.assertEqual('First 1', venue_ticket.first_name)
+        self.assertEqual(set([self.vegan, self.halal]),
+                         set(venue_ticket.dietary_preferences.all()))
+        sim_ticket = models.SIMCardTicket.objects.get(pk=tickets[4].pk)
+        self.assertEqual('Sim 1', sim_ticket.first_name)
+        self.assertEqual(2, models.SupportTicket.objects.filter(purchase=self.purchase).count())
+        self.assertFalse(tickets[0]._state.adding)
+
+    def test_constant_number_of_queries(self):
+        # Savepoint, Ticket rows, lookup of their pks, one insert per
+        # subclass, the dietary preferences and the savepoint release
+        with self.assertNumQueries(8):
+            models.Ticket.objects.bulk_create_for_purchase(
+                self.purchase, self.create_tickets(1))
+        with self.assertNumQueries(8):
+            models.Ticket.objects.bulk_create_for_purchase(
+                self.purchase, self.create_tickets(20))
+        self.assertEqual(63, models.Ticket.objects.filter(purchase=self.purchase).count())
+
+    def test_inventory(self):
+        venue_type = self.ticket_types[models.VenueTicket]
+        models.Ticket.objects.bulk_create_for_purchase(
+            self.purchase, self.create_tickets(2))
+        self.assertEqual(0, models.TicketType.objects.get(pk=venue_type.pk).sold_tickets)
+
+        purchase = models.Purchase.objects.create(
+            conference=self.conference, state='payment_received')
+        models.Ticket.objects.bulk_create_for_purchase(
+            purchase, self.create_tickets(2))
+        self.assertEqual(2, models.TicketType.objects.get(pk=venue_type.pk).sold_tickets)
+
+    def test_delete_for_purchase(self):
+        venue_type = self.ticket_types[models.VenueTicket]
+        purchase = models.Purchase.objects.create(
+            conference=self.conference, state='payment_received')
+        models.Ticket.objects.bulk_create_for_purchase(
+            purchase, self.create_tickets(1))
+        with CaptureQueriesContext(connection) as queries:
+            models.Ticket.objects.delete_for_purchase(purchase)
+        self.assertEqual(0, models.TicketType.objects.get(pk=venue_type.pk).sold_tickets)
+        self.assertFalse(models.Ticket.objects.filter(purchase=purchase).exists())
+
+        models.Ticket.objects.bulk_create_for_purchase(
+            purchase, self.create_tickets(10))
+        with self.assertNumQueries(len(queries)):
+            models.Ticket.objects.delete_for_purchase(purchase)
+        self.assertEqual(0, models.TicketType.objects.get(pk=venue_type.pk).sold_tickets)
+        self.assertEqual(0, models.VenueTicket.dietary_preferences.through.objects.count())
+
+    def test_persist_purchase_replaces_tickets(self):
+        from .views import PurchaseMixin
+        flow = PurchaseMixin()
+        flow.purchase = self.purchase
+        flow.tickets = self.create_tickets(2)
+        for idx, ticket in enumerate(flow.tickets):
+            ticket.pk = idx
+        flow.persist_purchase()
+        flow.persist_purchase()
+        self.assertEqual(6, models.Ticket.objects.filter(purchase=self.purchase).count())
+        self.assertEqual(4, models.VenueTicket.dietary_preferences.through.objects.count())
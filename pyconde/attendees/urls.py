@@ -16,6 +16,12 @@ urlpatterns = patterns(
         name='attendees_purchase_done'),
     url(r'^payment/$', views.HandlePaymentView.as_view(),
         name='attendees_purchase_payment'),
+    url(r'^waiting/$', views.waiting_room_view,
+        name='attendees_waiting_room'),
+    url(r'^waiting/status/$', views.waiting_room_status_view,
+        name='attendees_waiting_room_status'),
+    url(r'^admin/waiting/stats/$', views.waiting_room_stats_view,
+        name='attendees_waiting_room_stats'),
     url(r'^mine/$', views.UserPurchasesView.as_view(),
         name='attendees_user_purchases'),
     url(r'^mine/tickets/$', views.UserTicketsView.as_view(),
@@ -10,6 +10,7 @@ from django.core.cache import get_cache
 from django.conf import settings
 from django.core.mail import send_mail
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.http import HttpResponseRedirect
 from django.template.loader import render_to_string
 from django.utils.translation import gettext_lazy as _
@@ -18,6 +19,7 @@ from django_redis import get_redis_connection
 
 from . import settings as app_settings
 from . import tasks
+from .models import TicketHold
 
 
 LOG = logging.getLogger(__name__)
@@ -54,7 +56,12 @@ def complete_purchase(request, purchase):
         voucher.is_used = True
         voucher.save()
         unlock_voucher(request, voucher)
-    purchase.save()
+    # The held tickets are converted to sold ones
+    hold_key = request.session.get('purchase_state', {}).get('hold')
+    with transaction.atomic():
+        purchase.save()
+        if hold_key is not None:
+            TicketHold.objects.release(hold_key)
     purchase.invoice_number = generate_invoice_number()
     purchase.save()
     send_purchase_confirmation_mail(purchase)
@@ -15,6 +15,8 @@ import datetime
 import logging
 import hashlib
 import json
+import math
+import uuid
 from collections import OrderedDict
 
 import pymill
@@ -26,9 +28,11 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.shortcuts import get_current_site
+from django.db import transaction
 from django.db.models import Q
 from django.http import HttpResponseRedirect, Http404, HttpResponseForbidden, HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.http import is_safe_url, urlencode
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import now
 from django.template.response import TemplateResponse
@@ -40,10 +44,13 @@ from wkhtmltopdf.views import PDFTemplateView
 from pyconde.conference.models import current_conference
 from braces.views import LoginRequiredMixin
 
-from .models import TicketType, Ticket, VenueTicket, SIMCardTicket, Purchase
+from .models import (TicketType, TicketHold, TicketInventory, Ticket,
+    VenueTicket, SIMCardTicket, Purchase)
+from . import checkout
 from . import forms
 from . import utils
 from . import exceptions
+from . import waiting_room
 
 
 LOG = logging.getLogger(__name__)
@@ -77,6 +84,15 @@ class PurchaseMixin(object):
     def __init__(self, *args, **kwargs):
         self.purchase = None
         self.tickets = []
+        self.hold_key = None
+        self.checkout_id = None
+        self.expires = None
+
+    def get_expires(self):
+        if self.expires is None:
+            self.expires = datetime.datetime.utcnow() + datetime.timedelta(
+                seconds=settings.MAX_CHECKOUT_DURATION)
+        return self.expires
 
     def save_state(self, step=None):
         # Warning: To keep the form interaction as simple as possible
@@ -86,53 +102,82 @@ class PurchaseMixin(object):
             for idx, ticket in enumerate(self.tickets):
                 if ticket.pk is None:
                     ticket.pk = idx
-        expires = self.request.session.get('purchase_state', {}).get('expires')
-        if expires is None:
-            expires = datetime.datetime.utcnow() + datetime.timedelta(
-                seconds=settings.MAX_CHECKOUT_DURATION)
+        # The purchase and the tickets are kept in the checkout store, the
+        # session only references them.
+        if self.checkout_id is None:
+            self.checkout_id = checkout.new_checkout_id()
+        checkout.set_state(self.checkout_id, self.purchase, self.tickets,
+                           self.get_expires())
         self.request.session['purchase_state'] = {
-            'purchase': self.purchase,
+            'checkout': self.checkout_id,
             'previous_step': step if step is not None else self.step,
-            'tickets': self.tickets,
-            'expires': expires,
+            'expires': self.get_expires(),
+            'hold': self.hold_key,
         }
 
+    def hold_tickets(self):
+        """
+        Holds the tickets of this checkout until it expires, so that they
+        can't be sold to anybody else in the meantime. Raises
+        TicketNotAvailable if they are no longer available.
+        """
+        if self.hold_key is None:
+            self.hold_key = uuid.uuid4().hex
+        ticket_types = TicketType.objects.get_cached(
+            set(ticket.ticket_type.pk for ticket in self.tickets))
+        quantities = collections.Counter(
+            ticket_types[ticket.ticket_type.pk] for ticket in self.tickets)
+        TicketHold.objects.hold(self.hold_key, quantities, self.get_expires())
+
     def get_previous_state(self):
         state = self.request.session.get('purchase_state')
         if state is None:
             return None
         if datetime.datetime.utcnow() > state['expires']:
             return None
+        # Sessions of older versions don't reference a checkout
+        restored = checkout.get_state(state.get('checkout'))
+        if restored is None:
+            return None
+        self.purchase, self.tickets = restored
+        self.checkout_id = state['checkout']
         self.previous_step = state['previous_step']
-        self.purchase = state['purchase']
-        self.tickets = state.get('tickets', [])
+        self.expires = state['expires']
+        self.hold_key = state.get('hold')
 
         self.limited_tickets = []
         if self.step != 'done':
-            # For steps before the confirmation we calculate the number of
-            # available tickets to be rendered to the user. If we at this
+            # The tickets have been held when the checkout was started. If
+            # that hold is gone, the tickets are held again. If we at this
             # point run into the situation that the requested quantity can
             # no longer be fulfilled, the checkout is aborted.
-            ticket_types = {}
-            for ticket in self.tickets:
-                if ticket.ticket_type.pk not in ticket_types:
-                    ticket_type = TicketType.objects.get(
-                        pk=ticket.ticket_type.pk)
-                    available = ticket_type.available_tickets
-                    if available is None:
-                        continue
-                    if available <= 0:
-                        raise exceptions.TicketNotAvailable(ticket_type)
-                    ticket_types[ticket_type.pk] = {
-                        'type': ticket_type,
-                        'qty': 0,
-                        'available': available
-                    }
-                ticket_types[ticket.ticket_type.pk]['qty'] += 1
-            for _, ticket_type in ticket_types.items():
-                if ticket_type['available'] - ticket_type['qty'] < 0:
-                    raise exceptions.TicketNotAvailable(ticket_type['type'])
-                self.limited_tickets.append(ticket_type)
+            quantities = collections.Counter(
+                ticket.ticket_type.pk for ticket in self.tickets)
+            if TicketHold.objects.get_held(self.hold_key) != dict(quantities):
+                self.hold_tickets()
+                state['hold'] = self.hold_key
+                self.request.session['purchase_state'] = state
+
+            # For steps before the confirmation we calculate the number of
+            # available tickets to be rendered to the user. Only the
+            # inventory has to be fetched, the ticket types are cached.
+            ticket_types = TicketType.objects.get_cached(quantities)
+            limited = [pk for pk in quantities
+                       if ticket_types[pk].max_purchases > 0]
+            inventories = TicketInventory.objects.in_bulk(limited) \
+                if limited else {}
+            for ticket_type_pk in limited:
+                ticket_type = ticket_types[ticket_type_pk]
+                if ticket_type_pk in inventories:
+                    ticket_type.inventory = inventories[ticket_type_pk]
+                qty = quantities[ticket_type_pk]
+                available = ticket_type.available_tickets
+                self.limited_tickets.append({
+                    'type': ticket_type,
+                    'qty': qty,
+                    # The held tickets of this checkout are still available
+                    'available': available + qty,
+                })
 
         if self.request.user.is_authenticated():
             self.purchase.user = self.request.user
@@ -140,32 +185,39 @@ class PurchaseMixin(object):
 
     def clear_purchase_info(self):
         if 'purchase_state' in self.request.session:
+            state = self.request.session['purchase_state']
+            if state.get('hold') is not None:
+                TicketHold.objects.release(state['hold'])
+            if state.get('checkout') is not None:
+                checkout.delete_state(state['checkout'])
             del self.request.session['purchase_state']
         if 'paymentform' in self.request.session:
             del self.request.session['paymentform']
         self.tickets = []
         self.purchase = None
         self.previous_step = None
+        self.hold_key = None
+        self.checkout_id = None
+        self.expires = None
 
     def persist_purchase(self):
         # If we get into this method a second time because of a failed CC
         # payment, we have to remove all elements attached to this purchase
         # object and also reset things like the transaction ID.
-        self.purchase.ticket_set.all().delete()
-        self.purchase.payment_transaction = ""
-        self.purchase.save()
-
-        # Now we create the actual tickets (again)
-        for ticket in self.tickets:
-            # NOTE: At this point the ticket availability is decreased.
-            #       This is corrected by the "purge_stale_purchases"
-            #       command.
+        with transaction.atomic():
+            Ticket.objects.delete_for_purchase(self.purchase)
+            self.purchase.payment_transaction = ""
+            self.purchase.save()
+
+            # Now we create the actual tickets (again)
+            # NOTE: The tickets are taken from the inventory once the
+            #       purchase leaves the "incomplete" state, stale purchases
+            #       are removed by the "purge_stale_purchases" command.
             #       Vouchers are invalidated by complete_purchase().
-            ticket.pk = None
-            ticket.purchase = self.purchase
-            LOG.warning("persisting ticket %s of purchase %d" % (str(ticket), self.purchase.pk))
-            ticket.save()
-            ticket.save_related_data()
+            for ticket in self.tickets:
+                ticket.id = ticket.pk = None
+            LOG.debug("persisting %d tickets of purchase %d", len(self.tickets), self.purchase.pk)
+            Ticket.objects.bulk_create_for_purchase(self.purchase, self.tickets)
 
     def setup(self):
         steps = self.steps.keys()
@@ -180,6 +232,20 @@ class PurchaseMixin(object):
 
     def dispatch(self, request, *args, **kwargs):
         self.request = request
+        # Customers have to pass the waiting room (if enabled) first
+        admission = None
+        if waiting_room.is_enabled():
+            admission = waiting_room.get_admission(request)
+            if admission is None or not admission.is_admitted():
+                return HttpResponseRedirect('{0}?{1}'.format(
+                    reverse('attendees_waiting_room'),
+                    urlencode({'next': request.get_full_path()})))
+        response = self.dispatch_step(request, *args, **kwargs)
+        if admission is not None:
+            waiting_room.enter(admission)
+        return response
+
+    def dispatch_step(self, request, *args, **kwargs):
         try:
             resp = self.setup()
         except exceptions.TicketNotAvailable, e:
@@ -230,7 +296,7 @@ class StartPurchaseView(LoginRequiredMixin, PurchaseMixin, generic_views.View):
 
         ticket_types = TicketType.objects.available()\
             .filter(conference=current_conference)\
-            .select_related('vouchertype_needed')
+            .select_related('vouchertype_needed', 'inventory')
         if self.quantity_forms is None:
             ticket_type_qty = collections.defaultdict(int)
             if self.tickets:
@@ -271,7 +337,7 @@ class StartPurchaseView(LoginRequiredMixin, PurchaseMixin, generic_views.View):
         all_quantity_forms_valid = True
         self.total_ticket_num = 0
         ticket_types = TicketType.objects.available().filter(
-            conference=current_conference())
+            conference=current_conference()).select_related('inventory')
         for ticket_type in ticket_types:
             quantity_form = forms.TicketQuantityForm(
                 data=self.request.POST,
@@ -309,6 +375,11 @@ class StartPurchaseView(LoginRequiredMixin, PurchaseMixin, generic_views.View):
             purchase.payment_total = purchase.calculate_payment_total(
                 tickets=self.tickets)
             self.purchase = purchase
+            try:
+                self.hold_tickets()
+            except exceptions.TicketNotAvailable, e:
+                messages.error(self.request, _("Sorry, the following ticket is no longer available in your requested quantity: %s") % e.ticket_type)
+                return self.get(*args, **kwargs)
 
             # Please note that we don't save the purchase object nor the
             # freshly created tickets yet but instead put them just into
@@ -703,3 +774,66 @@ class AdminListTicketFieldsView(generic_views.View):
         result = [{'name': name, 'label': unicode(ctype._meta.get_field(name).verbose_name)} for name in ctype.get_fields()]
         return HttpResponse(json.dumps(result),
                 content_type='text/json')
+
+
+def waiting_room_view(request):
+    """
+    Puts the customer into the queue for the purchase process and lets them
+    wait for their admission.
+    """
+    next_url = request.GET.get('next', '')
+    if not is_safe_url(next_url, host=request.get_host()):
+        next_url = reverse('attendees_purchase')
+    if not waiting_room.is_enabled():
+        return HttpResponseRedirect(next_url)
+    # Admissions are bound to the session, which therefore has to exist
+    if request.session.session_key is None:
+        request.session.save()
+    admission = waiting_room.get_admission(request)
+    queued = admission is None or admission.is_expired()
+    if queued:
+        admission = waiting_room.enqueue(request.session.session_key)
+    if admission.is_admitted():
+        response = HttpResponseRedirect(next_url)
+    else:
+        response = render(request, 'attendees/waiting_room.html', {
+            'wait': int(math.ceil(admission.get_wait())),
+            'next': next_url,
+        })
+    if queued:
+        waiting_room.set_admission(response, admission)
+    return response
+
+
+def waiting_room_status_view(request):
+    """
+    Tells a waiting customer whether they have been admitted. This is
+    polled by the waiting room, so it must neither load the session nor
+    use the database.
+    """
+    admission = waiting_room.get_admission(request)
+    result = {
+        'admitted': False,
+        'expired': admission is None or admission.is_expired(),
+        'wait': 0,
+        'queue_length': 0,
+    }
+    if waiting_room.is_enabled():
+        result['queue_length'] = waiting_room.get_queue_length()
+    if not result['expired']:
+        result['admitted'] = admission.is_admitted()
+        result['wait'] = admission.get_wait()
+    response = HttpResponse(json.dumps(result), content_type='application/json')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def waiting_room_stats_view(request):
+    """
+    Returns the length of the queue and the number of queued and admitted
+    customers per minute.
+    """
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(json.dumps(waiting_room.get_stats()),
+                        content_type='application/json')
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Admission control for the purchase process.
+
+When the waiting room is enabled, customers have to be admitted before
+they can enter the purchase process. Every customer arriving in the
+waiting room gets the next admission time, which is one interval (given
+by ``PURCHASE_WAITING_ROOM_RATE``) after the admission time of the
+customer before. This makes the waiting room a FIFO queue that admits
+customers at a constant rate.
+
+The next admission time is a single counter in the cache, so queueing is
+one atomic increment in Redis. The admission itself is stored in a signed
+cookie, which means that checking an admission neither needs the cache nor
+the database. It is bound to the session it was issued for, so copying
+the cookie to another client does not admit that client. Entering the
+purchase process is recorded in the cache under the admission's id.
+"""
+from __future__ import unicode_literals
+
+import collections
+import math
+import time
+import uuid
+
+from django.core import signing
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+
+from . import settings as app_settings
+
+
+COOKIE_NAME = 'purchase_admission'
+
+SALT = 'pyconde.attendees.waiting_room'
+
+#: Number of minutes the queued and admitted customers are counted for.
+METRICS_MINUTES = 60
+
+_NEXT_ADMISSION_KEY = 'waiting_room:next_admission'
+
+
+class Admission(collections.namedtuple('Admission', 'id admit_at session')):
+    """
+    An admission to the purchase process at ``admit_at`` (in milliseconds
+    since the epoch) for the session with the given hash (see
+    :func:`get_session_hash`).
+    """
+    __slots__ = ()
+
+    def get_wait(self, now=None):
+        """
+        Returns the number of seconds until the admission.
+        """
+        if now is None:
+            now = _now()
+        return max(0, self.admit_at - now) / 1000.0
+
+    def is_admitted(self, now=None):
+        if now is None:
+            now = _now()
+        return self.admit_at <= now < self.admit_at + \
+            app_settings.WAITING_ROOM_ADMISSION_DURATION * 1000
+
+    def is_expired(self, now=None):
+        if now is None:
+            now = _now()
+        return now >= self.admit_at + \
+            app_settings.WAITING_ROOM_ADMISSION_DURATION * 1000
+
+    def get_remaining(self, now=None):
+        """
+        Returns the number of seconds until the admission expires.
+        """
+        if now is None:
+            now = _now()
+        return max(0, self.admit_at + app_settings.WAITING_ROOM_ADMISSION_DURATION * 1000
+                   - now) / 1000.0
+
+    def to_token(self):
+        return signing.dumps(list(self), salt=SALT)
+
+    @classmethod
+    def from_token(cls, token):
+        """
+        Returns the admission of the given token or None if the token is
+        invalid.
+        """
+        try:
+            return cls(*signing.loads(token, salt=SALT))
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def _get_interval():
+    return int(1000 / app_settings.WAITING_ROOM_RATE)
+
+
+def is_enabled():
+    return app_settings.WAITING_ROOM_RATE > 0
+
+
+def get_session_hash(session_key):
+    """
+    Returns the hash of the given session key stored in admissions, so that
+    the cookie does not contain the session key itself.
+    """
+    return salted_hmac(SALT, session_key or '').hexdigest()
+
+
+def get_admission(request):
+    """
+    Returns the admission stored with the given request or None if there is
+    none or it has been issued for another session. This only reads the
+    session key, not the session itself.
+    """
+    token = request.COOKIES.get(COOKIE_NAME)
+    if not token:
+        return None
+    admission = Admission.from_token(token)
+    if admission is None or request.session.session_key is None or \
+            admission.session != get_session_hash(request.session.session_key):
+        return None
+    return admission
+
+
+def set_admission(response, admission):
+    response.set_cookie(COOKIE_NAME, admission.to_token(), httponly=True,
+                        max_age=int(admission.get_wait()) +
+                        app_settings.WAITING_ROOM_ADMISSION_DURATION)
+
+
+def enqueue(session_key):
+    """
+    Puts a new customer with the given session at the end of the queue and
+    returns the :class:`Admission`.
+    """
+    now = _now()
+    interval = _get_interval()
+    cache.add(_NEXT_ADMISSION_KEY, now, None)
+    admit_at = cache.incr(_NEXT_ADMISSION_KEY, interval) - interval
+    if admit_at < now:
+        # Nobody has been waiting. Concurrent customers might both move
+        # the counter forward here, which only admits the next ones a
+        # little later than necessary.
+        admit_at = cache.incr(_NEXT_ADMISSION_KEY, now - admit_at) - interval
+    _count('queued', now)
+    return Admission(uuid.uuid4().hex, admit_at, get_session_hash(session_key))
+
+
+def _get_entry_key(admission):
+    return 'waiting_room:entered:{0}'.format(admission.id)
+
+
+def enter(admission):
+    """
+    Records that the given admission has been used to enter the purchase
+    process. Returns whether this is the first time, only then the
+    customer is counted as admitted.
+    """
+    timeout = max(1, int(math.ceil(admission.get_remaining())))
+    if not cache.add(_get_entry_key(admission), True, timeout):
+        return False
+    _count('admitted')
+    return True
+
+
+def get_queue_length(now=None):
+    """
+    Returns the number of customers waiting for their admission.
+    """
+    if now is None:
+        now = _now()
+    next_admission = cache.get(_NEXT_ADMISSION_KEY)
+    if next_admission is None or next_admission <= now:
+        return 0
+    # The customers before the next admission are admitted one interval
+    # apart, the ones admitted by now are no longer waiting
+    return (next_admission - now - 1) // _get_interval()
+
+
+def _get_metrics_key(name, minute):
+    return 'waiting_room:{0}:{1}'.format(name, minute)
+
+
+def _count(name, now=None):
+    if now is None:
+        now = _now()
+    key = _get_metrics_key(name, now // 60000)
+    cache.add(key, 0, METRICS_MINUTES * 60)
+    cache.incr(key)
+
+
+def get_stats(minutes=10):
+    """
+    Returns the current queue length and the number of queued and admitted
+    customers in each of the last minutes (starting with the current one).
+    """
+    now = _now()
+    minutes = range(now // 60000, now // 60000 - min(minutes, METRICS_MINUTES), -1)
+    keys = [_get_metrics_key(name, minute)
+            for name in ('queued', 'admitted') for minute in minutes]
+    counts = cache.get_many(keys)
+    return {
+        'enabled': is_enabled(),
+        'rate': app_settings.WAITING_ROOM_RATE,
+        'queue_length': get_queue_length(now) if is_enabled() else 0,
+        'queued': [counts.get(_get_metrics_key('queued', m), 0) for m in minutes],
+        'admitted': [counts.get(_get_metrics_key('admitted', m), 0) for m in minutes],
+    }
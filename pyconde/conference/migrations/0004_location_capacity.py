@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0003_auto_20160319_1251'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='capacity',
+            field=models.PositiveIntegerField(help_text='Number of seats, if known.', null=True, verbose_name='capacity', blank=True),
+        ),
+    ]
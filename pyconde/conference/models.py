@@ -269,6 +269,8 @@ class Location(models.Model):
     order = models.IntegerField(_("order"), default=0)
     used_for_sessions = models.BooleanField(_("used for sessions"),
         default=True)
+    capacity = models.PositiveIntegerField(_("capacity"), null=True,
+        blank=True, help_text=_("Number of seats, if known."))
 
     objects = models.Manager()
     current_conference = CurrentConferenceManager()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the expensive parts of the site.
+
+Every benchmark is a function taking a
+:class:`~pyconde.core.synthetic.SyntheticConference` and is run with
+:func:`measure`, which reports the wall time, the number of database
+queries and the growth of the peak memory usage of the process.
+
+The benchmarks bypass all caches, so that they always measure the work
+done on a cache miss.
+"""
+from __future__ import unicode_literals
+
+import collections
+import io
+import resource
+import time
+
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+Measurement = collections.namedtuple('Measurement',
+    'name wall_time queries peak_memory')
+
+
+def measure(name, func, repeat=1):
+    """
+    Calls ``func`` ``repeat`` times and returns a :class:`Measurement` of
+    the fastest run. ``peak_memory`` is the growth of the peak resident
+    set size of the process in KiB over all runs, which is only an upper
+    bound for the memory the function itself needs.
+    """
+    wall_times = []
+    queries = None
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.time()
+            func()
+            wall_times.append(time.time() - started)
+        queries = len(captured)
+    peak_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return Measurement(name, min(wall_times), queries,
+                       peak_after - peak_before)
+
+
+def bench_schedule(data):
+    from ..schedule import utils
+    utils.create_schedule(uncached=True)
+
+
+def bench_section_schedule(data):
+    from ..schedule import utils
+    utils.create_section_schedule(data.section, uncached=True)
+
+
+def bench_dataset(data):
+    from ..schedule.dataset import load_schedule_dataset
+    load_schedule_dataset(data.conference)
+
+
+def _make_exporter_bench(name):
+    def bench_exporter(data):
+        from ..schedule import exporters
+        exporters.get_exporter(name).write(io.BytesIO())
+    return bench_exporter
+
+
+def bench_badges(data):
+    from ..attendees.exporters import BadgeExporter
+    from ..attendees.models import VenueTicket
+    BadgeExporter(VenueTicket.objects.only_valid()
+                  .filter(ticket_type=data.ticket_type),
+                  base_url='').export()
+
+
+def bench_checkin_search(data):
+    from django.contrib.auth import get_user_model
+    from ..checkin.views import search_view
+    request = RequestFactory().get('/', {
+        'query': data.attendees[0].last_name})
+    request.user = get_user_model()(is_active=True, is_superuser=True)
+    request.session = {}
+    search_view(request).render()
+
+
+#: Number of tickets bought in the purchase benchmark.
+PURCHASE_SIZE = 10
+
+
+def bench_purchase(data):
+    from ..attendees import models as attendee_models
+    from ..attendees.views import PurchaseMixin
+    buyer = data.attendees[0]
+    flow = PurchaseMixin()
+    flow.purchase = attendee_models.Purchase.objects.create(
+        conference=data.conference, user=buyer,
+        first_name=buyer.first_name, last_name=buyer.last_name,
+        email=buyer.email, street='Street 1', zip_code='12345',
+        city='City', country='Germany')
+    flow.tickets = [attendee_models.VenueTicket(
+        ticket_type=data.ticket_type, first_name=user.first_name,
+        last_name=user.last_name) for user in data.attendees[:PURCHASE_SIZE]]
+    flow.persist_purchase()
+
+
+def _get_benchmarks():
+    from ..schedule import exporters
+    benchmarks = collections.OrderedDict([
+        ('schedule', bench_schedule),
+        ('section-schedule', bench_section_schedule),
+        ('dataset', bench_dataset),
+    ])
+    for name in exporters.EXPORTERS:
+        benchmarks['export-' + name] = _make_exporter_bench(name)
+    benchmarks['badges'] = bench_badges
+    benchmarks['checkin-search'] = bench_checkin_search
+    benchmarks['purchase'] = bench_purchase
+    return benchmarks
+
+
+def get_benchmark_names():
+    return list(_get_benchmarks())
+
+
+def run_benchmarks(data, names=None, repeat=1):
+    """
+    Runs the benchmarks with the given names (or all of them) against the
+    given synthetic conference and yields their measurements.
+    """
+    benchmarks = _get_benchmarks()
+    if names is None:
+        names = list(benchmarks)
+    unknown = set(names) - set(benchmarks)
+    if unknown:
+        raise ValueError('Unknown benchmarks: {0}'.format(
+            ', '.join(sorted(unknown))))
+    with override_settings(CONFERENCE_ID=data.conference.pk,
+                           SCHEDULE_CACHE_SCHEDULE=False):
+        for name in names:
+            yield measure(name, lambda: benchmarks[name](data), repeat)
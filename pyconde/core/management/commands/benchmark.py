@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ... import benchmark
+from ...synthetic import generate_conference
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--sessions',
+            action='store', type='int', dest='sessions', default=200,
+            help='Number of sessions (default: 200)'),
+        make_option('--rooms',
+            action='store', type='int', dest='rooms', default=6,
+            help='Number of rooms (default: 6)'),
+        make_option('--days',
+            action='store', type='int', dest='days', default=3,
+            help='Number of days (default: 3)'),
+        make_option('--speakers',
+            action='store', type='int', dest='speakers', default=None,
+            help='Number of speakers (default: half the number of sessions)'),
+        make_option('--attendees',
+            action='store', type='int', dest='attendees', default=1000,
+            help='Number of attendees (default: 1000)'),
+        make_option('--tickets',
+            action='store', type='int', dest='tickets', default=None,
+            help='Number of tickets (default: one per attendee)'),
+        make_option('--seed',
+            action='store', type='int', dest='seed', default=0,
+            help='Seed of the data generator'),
+        make_option('--repeat',
+            action='store', type='int', dest='repeat', default=3,
+            help='Number of runs of each benchmark, the fastest is '
+                 'reported (default: 3)'),
+        make_option('--only',
+            action='append', dest='names', default=None,
+            help='Name of a benchmark, can be given multiple times. '
+                 'Defaults to all benchmarks: {0}'.format(
+                     ', '.join(benchmark.get_benchmark_names()))),
+        make_option('--keep',
+            action='store_true', dest='keep', default=False,
+            help='Keep the generated conference instead of rolling back'),
+        )
+
+    help = 'Generates a synthetic conference and benchmarks the schedule, ' \
+           'the exporters, the checkin search and the purchase flow'
+
+    def handle(self, *args, **options):
+        unknown = set(options['names'] or ()) - set(benchmark.get_benchmark_names())
+        if unknown:
+            raise CommandError('unknown benchmarks: {0}'.format(', '.join(sorted(unknown))))
+        try:
+            with transaction.atomic():
+                self._run(options)
+                if not options['keep']:
+                    raise Rollback()
+        except Rollback:
+            pass
+
+    def _run(self, options):
+        data = generate_conference(
+            sessions=options['sessions'], rooms=options['rooms'],
+            days=options['days'], speakers=options['speakers'],
+            attendees=options['attendees'], tickets=options['tickets'],
+            seed=options['seed'])
+        self.stdout.write('Generated conference {0}: {1} sessions, {2} rooms, '
+                          '{3} speakers, {4} attendees, {5} purchases'.format(
+                              data.conference.pk, len(data.sessions),
+                              len(data.locations), len(data.speakers),
+                              len(data.attendees), len(data.purchases)))
+        self.stdout.write('{0:<28} {1:>10} {2:>8} {3:>10}'.format(
+            'benchmark', 'time (ms)', 'queries', 'peak (KiB)'))
+        for result in benchmark.run_benchmarks(data, options['names'],
+                                               options['repeat']):
+            self.stdout.write('{0:<28} {1:>10.1f} {2:>8} {3:>10}'.format(
+                result.name, result.wall_time * 1000, result.queries,
+                result.peak_memory))
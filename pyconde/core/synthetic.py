@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Generator for synthetic conferences of arbitrary size.
+
+The generated data is meant for benchmarking, so it is created with as few
+queries as possible (mostly bulk inserts) and is deterministic for a given
+seed. Signals are not sent for bulk inserted rows, which is why the
+speaker profiles and seat counters are created here explicitly.
+"""
+from __future__ import unicode_literals
+
+import collections
+import datetime
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+
+from ..attendees import models as attendee_models
+from ..conference import models as conference_models
+from ..schedule import models as schedule_models
+from ..speakers import models as speaker_models
+
+
+FIRST_NAMES = ('Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta',
+               'Hans', 'Ida', 'Jonas', 'Karla', 'Lukas', 'Mia', 'Noah')
+
+LAST_NAMES = ('Becker', 'Fischer', 'Hoffmann', 'Koch', 'Meyer', 'Müller',
+              'Richter', 'Schäfer', 'Schmidt', 'Schneider', 'Wagner', 'Weber')
+
+#: Start of the first and length of every timeslot of a synthetic day.
+DAY_START = datetime.time(9, 0)
+SLOT_MINUTES = 30
+
+#: Every n-th session is a training with a limited number of seats.
+TRAINING_EVERY = 10
+
+#: Every n-th session has an additional speaker.
+ADDITIONAL_SPEAKER_EVERY = 5
+
+
+SyntheticConference = collections.namedtuple('SyntheticConference',
+    'conference section kinds locations speakers attendees sessions '
+    'ticket_type purchases')
+
+
+def generate_conference(sessions=100, rooms=5, days=3, speakers=None,
+                        attendees=500, tickets=None, attending=3,
+                        start_date=None, seed=None):
+    """
+    Creates a conference with the given number of sessions, rooms, days,
+    speakers, attendees and venue tickets.
+
+    Sessions are spread evenly over the rooms and days in back-to-back
+    timeslots, each attendee attends ``attending`` random sessions and
+    holds at most one ticket. By default there are half as many speakers
+    as sessions and a ticket for every attendee.
+    """
+    rnd = random.Random(seed)
+    if speakers is None:
+        speakers = max(1, sessions // 2)
+    if tickets is None:
+        tickets = attendees
+    if start_date is None:
+        start_date = datetime.date.today()
+
+    conference = conference_models.Conference.objects.create(
+        title='Synthetic conference', start_date=start_date,
+        end_date=start_date + datetime.timedelta(days=days - 1))
+    prefix = 'synthetic-{0}'.format(conference.pk)
+    section = conference_models.Section.objects.create(
+        conference=conference, name='Talks', slug='talks',
+        start_date=conference.start_date, end_date=conference.end_date)
+    # The call for proposals of a conference with a schedule is over
+    kinds = dict((slug, conference_models.SessionKind.objects.create(
+                  conference=conference, name=slug.title(), slug=slug,
+                  closed=True))
+                 for slug in ('talk', 'training'))
+    audience_level = conference_models.AudienceLevel.objects.create(
+        conference=conference, name='Novice', slug='novice', level=1)
+    duration = conference_models.SessionDuration.objects.create(
+        conference=conference, label='30 minutes', slug='30',
+        minutes=SLOT_MINUTES)
+    track = conference_models.Track.objects.create(
+        conference=conference, name='General', slug='general')
+    locations = [conference_models.Location.objects.create(
+                 conference=conference, name='Room {0}'.format(idx),
+                 slug='room-{0}'.format(idx), order=idx,
+                 capacity=rnd.choice((50, 100, 200, 400)))
+                 for idx in range(1, rooms + 1)]
+
+    users = _create_users(prefix, speakers + attendees, rnd)
+    speaker_profiles = list(speaker_models.Speaker.objects
+                            .filter(user__in=users[:speakers])
+                            .select_related('user')
+                            .order_by('user'))
+    attendee_users = users[speakers:]
+
+    session_objects = _create_sessions(
+        conference, section, kinds, audience_level, duration, track,
+        locations, speaker_profiles, sessions, days, rnd)
+    _create_attendance(attendee_users, session_objects,
+                       min(attending, len(session_objects)), rnd)
+    _create_breaks(conference, section, days)
+
+    ticket_type, purchases = _create_tickets(
+        conference, attendee_users[:tickets], rnd)
+
+    return SyntheticConference(
+        conference=conference, section=section, kinds=kinds,
+        locations=locations, speakers=speaker_profiles,
+        attendees=attendee_users, sessions=session_objects,
+        ticket_type=ticket_type, purchases=purchases)
+
+
+def _create_users(prefix, count, rnd):
+    user_model = get_user_model()
+    password = make_password(None)
+    user_model.objects.bulk_create([user_model(
+        username='{0}-{1}'.format(prefix, idx),
+        email='{0}-{1}@example.com'.format(prefix, idx),
+        first_name=rnd.choice(FIRST_NAMES),
+        last_name=rnd.choice(LAST_NAMES),
+        password=password) for idx in range(count)])
+    users = list(user_model.objects
+                 .filter(username__startswith=prefix + '-')
+                 .order_by('pk'))
+    speaker_models.Speaker.objects.bulk_create(
+        [speaker_models.Speaker(user=user) for user in users])
+    return users
+
+
+def _create_sessions(conference, section, kinds, audience_level, duration,
+                     track, locations, speakers, count, days, rnd):
+    slots_per_day = -(-count // (len(locations) * days))
+    sessions = []
+    for idx in range(count):
+        slot, room = divmod(idx, len(locations))
+        day, slot = divmod(slot, slots_per_day)
+        start = datetime.datetime.combine(
+            conference.start_date + datetime.timedelta(days=day), DAY_START) \
+            + datetime.timedelta(minutes=slot * SLOT_MINUTES)
+        is_training = idx % TRAINING_EVERY == TRAINING_EVERY - 1
+        sessions.append(schedule_models.Session(
+            conference=conference, section=section,
+            title='Session {0}'.format(idx),
+            description='Description of session {0}'.format(idx),
+            abstract='Abstract of *session {0}*'.format(idx),
+            speaker=rnd.choice(speakers),
+            kind=kinds['training' if is_training else 'talk'],
+            audience_level=audience_level, duration=duration, track=track,
+            start=start, end=start + datetime.timedelta(minutes=SLOT_MINUTES),
+            released=True,
+            max_attendees=locations[room].capacity if is_training else None))
+    schedule_models.Session.objects.bulk_create(sessions)
+    sessions = list(schedule_models.Session.objects
+                    .filter(conference=conference)
+                    .select_related('speaker')
+                    .order_by('pk'))
+
+    location_through = schedule_models.Session.location.through
+    speaker_through = schedule_models.Session.additional_speakers.through
+    location_through.objects.bulk_create([
+        location_through(session=session,
+                         location=locations[idx % len(locations)])
+        for idx, session in enumerate(sessions)])
+    speaker_through.objects.bulk_create([
+        speaker_through(session=session, speaker=rnd.choice(speakers))
+        for idx, session in enumerate(sessions)
+        if idx % ADDITIONAL_SPEAKER_EVERY == ADDITIONAL_SPEAKER_EVERY - 1])
+    return sessions
+
+
+def _create_attendance(users, sessions, attending, rnd):
+    schedule_models.Attendee.objects.bulk_create([
+        schedule_models.Attendee(user=user, session=session)
+        for user in users
+        for session in rnd.sample(sessions, attending)])
+    schedule_models.SeatCounter.objects.reconcile(
+        [session.pk for session in sessions])
+
+
+def _create_breaks(conference, section, days):
+    for day in range(days):
+        start = datetime.datetime.combine(
+            conference.start_date + datetime.timedelta(days=day),
+            datetime.time(12, 30))
+        schedule_models.SideEvent.objects.create(
+            conference=conference, section=section, name='Lunch',
+            start=start, end=start + datetime.timedelta(hours=1),
+            is_global=True, is_pause=True)
+
+
+def _create_tickets(conference, users, rnd):
+    ticket_type = attendee_models.TicketType.objects.create(
+        conference=conference, name='Conference ticket', fee=100,
+        is_active=True,
+        date_valid_from=datetime.datetime.combine(
+            conference.start_date - datetime.timedelta(days=90),
+            datetime.time()),
+        date_valid_to=datetime.datetime.combine(
+            conference.end_date, datetime.time()),
+        content_type=ContentType.objects.get_for_model(
+            attendee_models.VenueTicket))
+
+    # Most purchases contain a single ticket, some are group purchases
+    groups = []
+    remaining = list(users)
+    while remaining:
+        size = rnd.choice((1, 1, 1, 2, 3, 5))
+        groups.append(remaining[:size])
+        remaining = remaining[size:]
+
+    purchases = []
+    for group in groups:
+        buyer = group[0]
+        purchase = attendee_models.Purchase.objects.create(
+            conference=conference, user=buyer,
+            first_name=buyer.first_name, last_name=buyer.last_name,
+            email=buyer.email, street='Street 1', zip_code='12345',
+            city='City', country='Germany', state='payment_received',
+            payment_total=ticket_type.fee * len(group))
+        for user in group:
+            attendee_models.VenueTicket.objects.create(
+                purchase=purchase, ticket_type=ticket_type, user=user,
+                first_name=user.first_name, last_name=user.last_name)
+        purchases.append(purchase)
+    return ticket_type, purchases
@@ -0,0 +1,74 @@
+import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..conference import models as conference_models
+from ..schedule import models as schedule_models
+from . import benchmark
+from .synthetic import generate_conference
+
+
+class SyntheticConferenceTests(TestCase):
+    def test_generate(self):
+        data = generate_conference(sessions=20, rooms=3, days=2,
+                                   attendees=12, tickets=10, seed=1)
+        self.assertEqual(20, schedule_models.Session.objects.filter(
+            conference=data.conference).count())
+        self.assertEqual(3, len(data.locations))
+        self.assertEqual(10, len(data.speakers))
+        self.assertEqual(12, len(data.attendees))
+        self.assertEqual(10, sum(p.ticket_set.count() for p in data.purchases))
+        self.assertEqual(36, schedule_models.Attendee.objects.filter(
+            session__conference=data.conference).count())
+        days = set(s.start.date() for s in data.sessions)
+        self.assertEqual([data.conference.start_date, data.conference.end_date],
+                         sorted(days))
+        for session in data.sessions:
+            self.assertEqual(1, session.location.count())
+        self.assertEqual(20, schedule_models.SeatCounter.objects.filter(
+            session__conference=data.conference).count())
+
+    def test_seed(self):
+        def speakers(data):
+            return [s.speaker.user.username.rsplit('-', 1)[-1]
+                    for s in data.sessions]
+        self.assertEqual(speakers(generate_conference(sessions=10, attendees=2, seed=3)),
+                         speakers(generate_conference(sessions=10, attendees=2, seed=3)))
+
+
+class BenchmarkTests(TestCase):
+    def test_run_all(self):
+        data = generate_conference(sessions=12, rooms=2, days=2,
+                                   attendees=15, seed=1)
+        results = list(benchmark.run_benchmarks(data))
+        self.assertEqual(benchmark.get_benchmark_names(),
+                         [r.name for r in results])
+        for result in results:
+            self.assertGreater(result.queries, 0, result.name)
+            self.assertGreaterEqual(result.wall_time, 0)
+
+    def test_unknown(self):
+        data = generate_conference(sessions=1, attendees=1)
+        with self.assertRaises(ValueError):
+            list(benchmark.run_benchmarks(data, ['unknown']))
+
+    def test_dataset_queries_independent_of_size(self):
+        def count_queries(**kwargs):
+            data = generate_conference(seed=1, **kwargs)
+            result, = benchmark.run_benchmarks(data, ['dataset'])
+            return result.queries
+        # Fills the content type cache
+        count_queries(sessions=1, attendees=1)
+        self.assertEqual(count_queries(sessions=5, attendees=5),
+                         count_queries(sessions=40, attendees=5))
+
+    def test_command(self):
+        out = StringIO.StringIO()
+        call_command('benchmark', sessions=6, rooms=2, days=1, attendees=5,
+                     repeat=1, names=['schedule', 'purchase'], stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('Generated conference'))
+        self.assertEqual(['schedule', 'purchase'],
+                         [line.split()[0] for line in lines[2:]])
+        self.assertFalse(conference_models.Conference.objects.exists())
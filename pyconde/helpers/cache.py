@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for caching values that are expensive to compute.
+"""
+import collections
+import logging
+import random
+import time
+
+from django.core.cache import cache
+
+
+LOG = logging.getLogger(__name__)
+
+#: Relative amount by which the expiry of cached values is randomly shortened
+#: so that values cached at the same time do not all expire at once.
+TIMEOUT_JITTER = 0.1
+
+#: Interval in seconds in which a worker waiting for another worker to
+#: compute a missing value checks the cache.
+WAIT_INTERVAL = 0.05
+
+
+CachedValue = collections.namedtuple('CachedValue', 'value fresh_until')
+
+
+def get_or_compute(key, compute, timeout=None, stale_timeout=None,
+                   lock_timeout=30, wait_timeout=5):
+    """
+    Returns the value cached for the given key or computes and caches it
+    using the given callable.
+
+    Only one worker computes a value at a time (using a lock stored in the
+    cache). Once a value is older than ``timeout`` it is considered stale:
+    The first worker noticing that recomputes it while all other workers
+    keep on serving the stale value for up to ``stale_timeout`` seconds
+    (defaults to ``timeout``). If there is no value at all, other workers
+    wait up to ``wait_timeout`` seconds for the value to become available
+    before computing it themselves.
+
+    @param timeout seconds the value is considered fresh. Defaults to the
+        cache's default timeout. If that is None, the value never becomes
+        stale and is cached without expiry.
+    @param lock_timeout seconds after which the lock is released in case
+        the computing worker died
+    """
+    if timeout is None:
+        timeout = cache.default_timeout
+    if stale_timeout is None:
+        stale_timeout = timeout
+    lock_key = key + ':lock'
+
+    cached = cache.get(key)
+    if isinstance(cached, CachedValue):
+        if cached.fresh_until is None or cached.fresh_until > time.time():
+            return cached.value
+        if not cache.add(lock_key, True, lock_timeout):
+            return cached.value
+    elif not cache.add(lock_key, True, lock_timeout):
+        waited = 0
+        while waited < wait_timeout:
+            time.sleep(WAIT_INTERVAL)
+            waited += WAIT_INTERVAL
+            cached = cache.get(key)
+            if isinstance(cached, CachedValue):
+                return cached.value
+        LOG.warning("Computing %s without holding the lock", key)
+
+    try:
+        value = compute()
+        if timeout is None:
+            cache.set(key, CachedValue(value, None), None)
+        else:
+            fresh_for = timeout * (1 - random.uniform(0, TIMEOUT_JITTER))
+            cache.set(key, CachedValue(value, time.time() + fresh_for),
+                      timeout + stale_timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+A shared HTTP session for talking to external services.
+
+Connections are pooled between requests and failed requests (connection
+errors and server errors) are retried with a backoff. Every request has a
+timeout, so that a hanging service cannot block a worker forever.
+"""
+import threading
+
+import requests
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+
+_local = threading.local()
+
+
+def get_session():
+    """
+    Returns the HTTP session of the current thread.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        retries = Retry(total=settings.HTTP_RETRIES, backoff_factor=0.5,
+                        status_forcelist=(500, 502, 503, 504))
+        adapter = HTTPAdapter(max_retries=retries)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+
+def get(url, **kwargs):
+    """
+    Fetches the given URL and raises an exception for error responses.
+    """
+    kwargs.setdefault('timeout', settings.HTTP_TIMEOUT)
+    response = get_session().get(url, **kwargs)
+    response.raise_for_status()
+    return response
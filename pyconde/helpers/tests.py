@@ -1,5 +1,13 @@
+import time
 import unittest
 
+import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from . import cache as cache_utils
 from .templatetags import helper_tags
 
 
@@ -24,5 +32,55 @@ class DomainFilterTests(unittest.TestCase):
         self.assertEquals("invalid", helper_tags.domain("invalid"))
 
 
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'helpers-tests',
+    }
+})
+class GetOrComputeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def compute(self):
+        self.calls.append(True)
+        return len(self.calls)
+
+    def test_value_is_cached(self):
+        self.assertEqual(1, cache_utils.get_or_compute('key', self.compute, 60))
+        self.assertEqual(1, cache_utils.get_or_compute('key', self.compute, 60))
+        self.assertEqual(1, len(self.calls))
+
+    def test_stale_value_while_locked(self):
+        cache.set('key', cache_utils.CachedValue('stale', time.time() - 1), 60)
+        cache.add('key:lock', True, 60)
+        self.assertEqual('stale', cache_utils.get_or_compute('key', self.compute, 60))
+        self.assertEqual([], self.calls)
+
+    def test_stale_value_is_recomputed(self):
+        cache.set('key', cache_utils.CachedValue('stale', time.time() - 1), 60)
+        self.assertEqual(1, cache_utils.get_or_compute('key', self.compute, 60))
+        self.assertIsNone(cache.get('key:lock'))
+        self.assertEqual(1, cache_utils.get_or_compute('key', self.compute, 60))
+
+    def test_missing_value_while_locked(self):
+        cache.add('key:lock', True, 60)
+        self.assertEqual(1, cache_utils.get_or_compute('key', self.compute, 60,
+                                                       wait_timeout=0.1))
+
+    def test_jittered_timeout(self):
+        cache_utils.get_or_compute('key', self.compute, 100)
+        fresh_for = cache.get('key').fresh_until - time.time()
+        self.assertTrue(100 * (1 - cache_utils.TIMEOUT_JITTER) - 1 < fresh_for <= 100)
+
+    def test_default_timeout_without_expiry(self):
+        with mock.patch.object(cache_utils.cache, 'default_timeout', None):
+            self.assertEqual(1, cache_utils.get_or_compute('key', self.compute))
+            self.assertEqual(1, cache_utils.get_or_compute('key', self.compute))
+        self.assertIsNone(cache.get('key').fresh_until)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -14,6 +14,7 @@ from django.utils.translation import ugettext_lazy as _
 
 from pyconde.conference import models as conference_models
 from pyconde.accounts import utils as account_utils
+from pyconde.helpers.cache import get_or_compute
 
 EMAIL_REGEX = re.compile(r"[^@]+@[^@]+\.[^@]+")
 
@@ -28,17 +29,21 @@ def get_review_permission():
 
 def can_review_proposal(user, proposal=None, reset_cache=False):
     cache_key = 'reviewer_pks'
-    reviewer_pks = cache.get(cache_key)
     if user.is_anonymous() or not hasattr(user, 'pk'):
         return False
-    if reset_cache or reviewer_pks is None:
-        perm = get_review_permission()
-        reviewer_pks = set(u['pk'] for u in get_user_model().objects.filter(Q(is_superuser=True) | Q(user_permissions=perm) | Q(groups__permissions=perm)).values('pk'))
-        cache.set(cache_key, reviewer_pks)
-        logger.debug("reviewer_pks cache has been rebuilt")
+    if reset_cache:
+        cache.delete(cache_key)
+    reviewer_pks = get_or_compute(cache_key, _get_reviewer_pks)
     return user.pk in reviewer_pks
 
 
+def _get_reviewer_pks():
+    perm = get_review_permission()
+    reviewer_pks = set(u['pk'] for u in get_user_model().objects.filter(Q(is_superuser=True) | Q(user_permissions=perm) | Q(groups__permissions=perm)).values('pk'))
+    logger.debug("reviewer_pks cache has been rebuilt")
+    return reviewer_pks
+
+
 def can_participate_in_review(user, proposal):
     if can_review_proposal(user, proposal):
         return True
@@ -6,7 +6,7 @@ from django.contrib import admin
 from django.contrib import messages
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 
 from ..proposals import models as proposal_models
 from ..proposals import admin as proposal_admin
@@ -16,6 +16,7 @@ from ..speakers import models as speaker_models
 
 from . import models
 from . import exporters
+from . import tasks
 from . import utils
 
 
@@ -54,15 +55,15 @@ schedule_multiple_proposals.short_description = _("convert to sessions")
 
 
 def create_simple_session_export(modeladmin, request, queryset):
-    return HttpResponse(exporters.SimpleSessionExporter(queryset)().csv,
-        mimetype='text/csv')
+    return StreamingHttpResponse(exporters.SimpleSessionExporter(queryset).iter_csv(),
+        content_type='text/csv')
 create_simple_session_export.short_description = _("create simple export")
 
 
 def episodes_export(modeladmin, request, queryset):
     exporter = exporters.SessionForEpisodesExporter()
     return HttpResponse(json.dumps(exporter(), indent=4),
-                        mimetype='application/json')
+                        content_type='application/json')
 episodes_export.short_description = _("episodes export")
 
 
@@ -157,6 +158,51 @@ class SideEventAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
 
 
+def retry_embeds(modeladmin, request, queryset):
+    for kind, url in queryset.values_list('kind', 'url'):
+        tasks.resolve_embed.delay(kind, url)
+    messages.success(request, _("%(counter)s link(s) will be resolved again") % {
+        'counter': len(queryset)
+        })
+retry_embeds.short_description = _("resolve again")
+
+
+class EmbedAdmin(admin.ModelAdmin):
+    list_display = ['url', 'kind', 'state', 'failures', 'retry_at', 'resolved']
+    list_filter = ['state', 'kind']
+    search_fields = ['url']
+    readonly_fields = ['state', 'failures', 'retry_at', 'resolved']
+    actions = [retry_embeds]
+
+
+def apply_schedule_drafts(modeladmin, request, queryset):
+    for draft in queryset:
+        draft.apply()
+    messages.success(request, _("%(counter)s draft(s) applied") % {
+        'counter': len(queryset)
+        })
+apply_schedule_drafts.short_description = _("apply to the sessions")
+
+
+class ScheduleDraftItemInline(admin.TabularInline):
+    model = models.ScheduleDraftItem
+    fields = ['session', 'location', 'start', 'end']
+    readonly_fields = ['session']
+    extra = 0
+
+    def get_queryset(self, request):
+        return super(ScheduleDraftItemInline, self).get_queryset(request) \
+            .select_related('session', 'location')
+
+
+class ScheduleDraftAdmin(admin.ModelAdmin):
+    list_display = ['__unicode__', 'conference', 'cost', 'applied']
+    list_filter = ['conference']
+    readonly_fields = ['created', 'cost', 'applied']
+    inlines = [ScheduleDraftItemInline]
+    actions = [apply_schedule_drafts]
+
+
 class ProposalAdmin(proposal_admin.ProposalAdmin):
     actions = proposal_admin.ProposalAdmin.actions + [schedule_multiple_proposals]
     list_display = list(proposal_admin.ProposalAdmin.list_display) + ['is_scheduled']
@@ -184,3 +230,5 @@ admin.site.register(models.Session, SessionAdmin)
 admin.site.register(proposal_models.Proposal, ProposalAdmin)
 admin.site.register(review_models.ProposalMetaData, ProposalMetaDataAdmin)
 admin.site.register(models.SideEvent, SideEventAdmin)
+admin.site.register(models.ScheduleDraft, ScheduleDraftAdmin)
+admin.site.register(models.Embed, EmbedAdmin)
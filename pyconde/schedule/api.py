@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Data of the public JSON schedule API.
+
+Clients first fetch the complete schedule and then only ask for the events
+changed since the version they got with it. Versions are the primary keys
+of the :class:`~pyconde.schedule.models.ScheduleChange` log.
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db.models import Max
+
+from ..conference import models as conference_models
+from ..helpers.cache import get_or_compute
+from . import models
+from .dataset import SessionData, load_schedule_dataset
+
+
+def get_schedule_version(conference):
+    return models.ScheduleChange.objects.filter(conference=conference) \
+        .aggregate(version=Max('pk'))['version'] or 0
+
+
+def get_schedule_data():
+    """
+    Returns all public events of the current conference.
+    """
+    conference = conference_models.current_conference()
+    version = get_schedule_version(conference)
+    return get_or_compute(
+        'schedule_api:{0}:{1}'.format(conference.pk, version),
+        lambda: _create_schedule_data(conference, version),
+        settings.SCHEDULE_CACHE_TIMEOUT)
+
+
+def _create_schedule_data(conference, version):
+    dataset = load_schedule_dataset(conference)
+    return {
+        'version': version,
+        'locations': [_serialize_location(loc) for loc in dataset.locations],
+        'events': _serialize_events(dataset),
+    }
+
+
+def get_schedule_delta(since):
+    """
+    Returns the public events of the current conference that changed after
+    the given version. Events that were deleted or are not public anymore
+    are listed in ``deleted``.
+    """
+    conference = conference_models.current_conference()
+    version = get_schedule_version(conference)
+    changed = set(models.ScheduleChange.objects
+                  .filter(conference=conference, pk__gt=since, pk__lte=version)
+                  .values_list('event_type', 'event_id')
+                  .distinct())
+    session_pks = [pk for type_, pk in changed if type_ == models.ScheduleChange.EVENT_TYPE_SESSION]
+    side_event_pks = [pk for type_, pk in changed if type_ == models.ScheduleChange.EVENT_TYPE_SIDEEVENT]
+    dataset = load_schedule_dataset(conference, session_pks=session_pks,
+                                    side_event_pks=side_event_pks)
+    events = _serialize_events(dataset)
+    deleted = changed - set((evt['type'], evt['id']) for evt in events)
+    return {
+        'version': version,
+        'since': since,
+        'locations': [_serialize_location(loc) for loc in dataset.locations],
+        'events': events,
+        'deleted': [{'type': type_, 'id': pk} for type_, pk in sorted(deleted)],
+    }
+
+
+def _serialize_events(dataset):
+    events = [_serialize_session(session) for session in dataset.sessions
+              if session.released and session.start is not None]
+    events += [_serialize_side_event(evt) for evt in dataset.side_events
+               if evt.start is not None]
+    return events
+
+
+def serialize_event(evt):
+    """
+    Serializes a session or side event of a schedule dataset.
+    """
+    if isinstance(evt, SessionData):
+        return _serialize_session(evt)
+    return _serialize_side_event(evt)
+
+
+def _serialize_location(location):
+    return {'id': location.pk, 'name': location.name}
+
+
+def _serialize_datetime(value):
+    return value.isoformat() if value is not None else None
+
+
+def _serialize_session(session):
+    return {
+        'type': models.ScheduleChange.EVENT_TYPE_SESSION,
+        'id': session.pk,
+        'title': session.title,
+        'abstract': session.abstract,
+        'start': _serialize_datetime(session.start),
+        'end': _serialize_datetime(session.end),
+        'locations': [loc.pk for loc in session.locations],
+        'speakers': [speaker.display_name for speaker
+                     in ((session.speaker,) + session.additional_speakers)
+                     if speaker is not None],
+        'kind': session.kind.slug if session.kind else None,
+        'track': session.track,
+        'audience_level': session.audience_level,
+        'language': session.language,
+        'is_global': session.is_global,
+        'url': session.url,
+    }
+
+
+def _serialize_side_event(evt):
+    return {
+        'type': models.ScheduleChange.EVENT_TYPE_SIDEEVENT,
+        'id': evt.pk,
+        'title': evt.name,
+        'start': _serialize_datetime(evt.start),
+        'end': _serialize_datetime(evt.end),
+        'locations': [loc.pk for loc in evt.locations],
+        'is_global': evt.is_global,
+        'is_pause': evt.is_pause,
+        'url': evt.url,
+    }
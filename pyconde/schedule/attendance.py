@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Cached per-user attendance state.
+
+The schedule itself is the same for everybody and cached globally. The
+little personal state on top of it (the sessions a user attends and the
+number of taken seats of limited sessions) is cached separately, so that
+it can be looked up with a single cache read per request.
+
+The cached values are dropped whenever an attendance changes and rebuilt
+from the database on the next lookup. Seat counts are read from the
+:class:`~pyconde.schedule.models.SeatCounter` rows.
+"""
+from __future__ import unicode_literals
+
+import collections
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import models
+from .conflicts import IntervalTree
+
+
+class IntervalIndex(object):
+    """
+    The sessions attended by a user in an interval tree, for checking
+    overlaps without a database query.
+    """
+
+    def __init__(self, intervals=()):
+        """
+        @param intervals iterable of (session id, start, end) tuples
+        """
+        self.intervals = tuple(intervals)
+        self.session_ids = frozenset(pk for pk, start, end in self.intervals)
+        self.tree = IntervalTree((start, end, pk) for pk, start, end in self.intervals
+                                 if start is not None and end is not None)
+
+    def without(self, session_id):
+        return IntervalIndex(interval for interval in self.intervals
+                             if interval[0] != session_id)
+
+    def overlaps(self, start, end):
+        return bool(self.tree.overlapping(start, end))
+
+
+class Attendance(collections.namedtuple('Attendance', 'sessions seats')):
+    """
+    ``sessions`` is the :class:`IntervalIndex` of the sessions the user
+    attends and ``seats`` maps session ids to their number of taken seats.
+    """
+    __slots__ = ()
+
+    @property
+    def session_ids(self):
+        return self.sessions.session_ids
+
+    def is_attending(self, session):
+        return session.pk in self.session_ids
+
+    def overlaps(self, session):
+        """
+        Returns True if the user attends another session overlapping the
+        given one.
+        """
+        if session.start is None or session.end is None:
+            return False
+        sessions = self.sessions
+        if self.is_attending(session):
+            sessions = sessions.without(session.pk)
+        return sessions.overlaps(session.start, session.end)
+
+    def has_free_seats(self, session):
+        if session.max_attendees in (None, 0):
+            return True
+        return self.seats.get(session.pk, 0) < session.max_attendees
+
+
+def _get_user_key(user_pk):
+    return 'schedule_attendance:{0}'.format(user_pk)
+
+
+def _get_seats_key(session_pk):
+    return 'schedule_seats:{0}'.format(session_pk)
+
+
+def get_attendance(user, sessions=()):
+    """
+    Returns the :class:`Attendance` of the given user including the seat
+    counts of the given sessions. Anonymous users don't attend anything.
+    """
+    user_pk = user.pk if user is not None and user.is_authenticated() else None
+    session_pks = [session.pk for session in sessions]
+    keys = [_get_seats_key(pk) for pk in session_pks]
+    if user_pk is not None:
+        keys.append(_get_user_key(user_pk))
+    cached = cache.get_many(keys)
+
+    attended = IntervalIndex()
+    if user_pk is not None:
+        attended = cached.get(_get_user_key(user_pk))
+        if attended is None:
+            attended = IntervalIndex(models.Attendee.objects
+                                     .filter(user=user_pk)
+                                     .values_list('session', 'session__start', 'session__end'))
+            cache.set(_get_user_key(user_pk), attended,
+                      settings.SCHEDULE_CACHE_TIMEOUT)
+
+    seats = dict((pk, cached[_get_seats_key(pk)]) for pk in session_pks
+                 if _get_seats_key(pk) in cached)
+    missing = [pk for pk in session_pks if pk not in seats]
+    if missing:
+        counters = models.SeatCounter.objects.filter(session__in=missing)
+        counted = dict(counters.values_list('session', 'taken'))
+        if len(counted) < len(missing):
+            models.SeatCounter.objects.reconcile(set(missing) - set(counted))
+            counted = dict(counters.values_list('session', 'taken'))
+        cache.set_many(dict((_get_seats_key(pk), count)
+                            for pk, count in counted.items()),
+                       settings.SCHEDULE_CACHE_TIMEOUT)
+        seats.update(counted)
+    return Attendance(attended, seats)
+
+
+def get_seat_count(session):
+    return get_attendance(None, [session]).seats[session.pk]
+
+
+def invalidate(user_pks=(), session_pks=()):
+    """
+    Drops the cached attendance of the given users and the seat counts of
+    the given sessions.
+    """
+    cache.delete_many([_get_user_key(pk) for pk in user_pks] +
+                      [_get_seats_key(pk) for pk in session_pks])
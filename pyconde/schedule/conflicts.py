@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Detection of time conflicts in the schedule.
+
+All released sessions of a conference are loaded once into an interval
+tree that answers which sessions overlap a given time span. Double-booked
+speakers, rooms and attendees are found by sweeping over the events of
+each of them ordered by their start, so that checking a whole conference
+takes O(n log n) (plus the number of conflicts found).
+"""
+from __future__ import unicode_literals
+
+import collections
+import heapq
+
+from operator import attrgetter, itemgetter
+
+from . import models
+from .dataset import load_schedule_dataset
+
+
+Conflict = collections.namedtuple('Conflict', 'key first second')
+
+
+class IntervalTree(object):
+    """
+    A static interval tree over (start, end, value) tuples. Intervals are
+    half-open, so that back-to-back intervals don't overlap.
+
+    The tree is stored as a sorted list: The root of each range is its
+    middle element and every node knows the latest end within its subtree.
+    """
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals, key=itemgetter(0, 1))
+        self.max_ends = [None] * len(self.intervals)
+        self._build(0, len(self.intervals))
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self.intervals[mid][1]
+        for child_end in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child_end is not None and child_end > max_end:
+                max_end = child_end
+        self.max_ends[mid] = max_end
+        return max_end
+
+    def overlapping(self, start, end):
+        """
+        Returns the values of all intervals overlapping the given one
+        ordered by their start.
+        """
+        result = []
+        self._find(0, len(self.intervals), start, end, result)
+        return result
+
+    def _find(self, lo, hi, start, end, result):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_ends[mid] <= start:
+            return
+        self._find(lo, mid, start, end, result)
+        mid_start, mid_end, value = self.intervals[mid]
+        if mid_start >= end:
+            return
+        if mid_end > start:
+            result.append(value)
+        self._find(mid + 1, hi, start, end, result)
+
+
+def find_overlaps(events):
+    """
+    Yields all pairs of overlapping events (having ``start`` and ``end``
+    attributes) ordered by the start of the later one.
+    """
+    active = []
+    for idx, evt in enumerate(sorted(events, key=attrgetter('start', 'end'))):
+        while active and active[0][0] <= evt.start:
+            heapq.heappop(active)
+        for _, _, other in sorted(active, key=itemgetter(1)):
+            yield other, evt
+        heapq.heappush(active, (evt.end, idx, evt))
+
+
+def _is_scheduled(evt):
+    return evt.start is not None and evt.end is not None
+
+
+class ScheduleConflicts(object):
+    """
+    Answers conflict queries for the released sessions (and side events
+    occupying rooms) of a conference.
+    """
+
+    def __init__(self, dataset=None):
+        if dataset is None:
+            dataset = load_schedule_dataset()
+        self.dataset = dataset
+        self.sessions = [session for session in dataset.sessions
+                         if session.released and _is_scheduled(session)]
+        self.tree = IntervalTree((session.start, session.end, session)
+                                 for session in self.sessions)
+
+    def overlapping(self, start, end, exclude=None):
+        """
+        Returns the sessions overlapping the given time span. A session
+        (or its primary key) given as ``exclude`` is left out.
+        """
+        exclude_pk = getattr(exclude, 'pk', exclude)
+        return [session for session in self.tree.overlapping(start, end)
+                if session.pk != exclude_pk]
+
+    def speaker_conflicts(self):
+        """
+        Returns the sessions held by the same speaker at the same time.
+        """
+        by_speaker = collections.defaultdict(list)
+        for session in self.sessions:
+            for speaker in (session.speaker,) + session.additional_speakers:
+                if speaker is not None:
+                    by_speaker[speaker].append(session)
+        return _find_conflicts(by_speaker)
+
+    def room_conflicts(self):
+        """
+        Returns the events taking place in the same room at the same time.
+        Global side events (e.g. breaks) are not bound to rooms.
+        """
+        by_location = collections.defaultdict(list)
+        side_events = [evt for evt in self.dataset.side_events
+                       if _is_scheduled(evt) and not evt.is_global]
+        for evt in self.sessions + side_events:
+            for location in evt.locations:
+                by_location[location].append(evt)
+        return _find_conflicts(by_location)
+
+    def attendee_conflicts(self):
+        """
+        Returns the sessions attended by the same user at the same time.
+        The keys of the conflicts are the ids of the users.
+        """
+        sessions = dict((session.pk, session) for session in self.sessions)
+        by_user = collections.defaultdict(list)
+        for user_pk, session_pk in models.Attendee.objects \
+                .filter(session__in=list(sessions)) \
+                .values_list('user', 'session'):
+            by_user[user_pk].append(sessions[session_pk])
+        return _find_conflicts(by_user)
+
+
+def _find_conflicts(events_by_key):
+    conflicts = []
+    for key in sorted(events_by_key, key=lambda key: getattr(key, 'pk', key)):
+        conflicts.extend(Conflict(key, first, second)
+                         for first, second in find_overlaps(events_by_key[key]))
+    return conflicts
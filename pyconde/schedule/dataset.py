@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+An immutable, in-memory snapshot of everything the schedule exporters need.
+
+All sessions, side events, speakers, locations, tags and kinds of a
+conference are loaded with a fixed number of queries and converted into
+plain named tuples. Exporters are then only formatting this data, so that
+any number of them can be run over the same dataset without touching the
+database again.
+"""
+from __future__ import unicode_literals
+
+import collections
+import logging
+
+from itertools import chain
+from operator import attrgetter
+
+from django.core.urlresolvers import reverse
+from django.db.models import Prefetch
+from django.utils.encoding import force_text
+
+from ..accounts.utils import get_display_name, get_full_name
+from ..conference import models as conference_models
+from ..speakers import models as speaker_models
+from . import models
+
+
+LOG = logging.getLogger(__name__)
+
+
+ConferenceData = collections.namedtuple('ConferenceData',
+    'pk title slug start_date end_date')
+
+LocationData = collections.namedtuple('LocationData', 'pk name order')
+
+KindData = collections.namedtuple('KindData', 'pk name slug')
+
+SpeakerData = collections.namedtuple('SpeakerData',
+    'pk user_pk username full_name display_name email short_info '
+    'short_info_rendered avatar_url avatar_path url')
+
+
+class EventDataMixin(object):
+    __slots__ = ()
+
+    @property
+    def location_pretty(self):
+        return ', '.join(loc.name for loc in self.locations)
+
+    @property
+    def location_guidebook(self):
+        return ';'.join(loc.name for loc in self.locations)
+
+
+class SessionData(EventDataMixin, collections.namedtuple('SessionData',
+        'pk title abstract abstract_rendered description description_rendered '
+        'language language_display start end is_global released '
+        'accept_recording kind audience_level track speaker '
+        'additional_speakers locations tags url')):
+    __slots__ = ()
+
+    def __unicode__(self):
+        return self.title
+
+
+class SideEventData(EventDataMixin, collections.namedtuple('SideEventData',
+        'pk name description description_rendered start end is_global '
+        'is_pause is_recordable locations url')):
+    __slots__ = ()
+
+    def __unicode__(self):
+        return self.name
+
+
+class ScheduleDataset(collections.namedtuple('ScheduleDataset',
+        'conference locations speakers sessions side_events')):
+    """
+    Sessions and side events are ordered by their start and primary key.
+    Speakers and locations are shared between the events referencing them.
+    """
+    __slots__ = ()
+
+    @property
+    def events(self):
+        """
+        All sessions and side events ordered by their start and end.
+        """
+        return sorted(chain(self.sessions, self.side_events),
+                      key=attrgetter('start', 'end'))
+
+
+def load_schedule_dataset(conference=None, start=None, end=None,
+                          session_pks=None, side_event_pks=None):
+    """
+    Loads the schedule data of the given (or the current) conference. If
+    ``start`` and ``end`` are given, only events starting in that range are
+    included. The events can also be limited to the given primary keys.
+    """
+    if conference is None:
+        conference = conference_models.current_conference()
+    LOG.debug("Loading schedule dataset of %s", conference)
+    event_filter = {'conference': conference.pk}
+    if start is not None and end is not None:
+        event_filter.update(start__gte=start, start__lt=end)
+    locations = collections.OrderedDict(
+        (loc.pk, LocationData(loc.pk, loc.name, loc.order))
+        for loc in conference_models.Location.objects.filter(conference=conference))
+    speakers = {}
+    kinds = {}
+
+    def _get_speaker(speaker):
+        if speaker.pk not in speakers:
+            speakers[speaker.pk] = _create_speaker_data(speaker)
+        return speakers[speaker.pk]
+
+    def _get_kind(kind):
+        if kind.pk not in kinds:
+            kinds[kind.pk] = KindData(kind.pk, kind.name, kind.slug)
+        return kinds[kind.pk]
+
+    def _get_locations(event):
+        return tuple(locations.get(loc.pk) or LocationData(loc.pk, loc.name, loc.order)
+                     for loc in event.location.all())
+
+    sessions = models.Session.objects \
+        .filter(**event_filter) \
+        .filter(**_get_pk_filter(session_pks)) \
+        .select_related('kind', 'audience_level', 'track', 'speaker__user') \
+        .prefetch_related(
+            Prefetch('additional_speakers',
+                     queryset=speaker_models.Speaker.objects.select_related('user')),
+            'location', 'tags') \
+        .order_by('start', 'pk')
+    session_data = tuple(SessionData(
+        pk=session.pk,
+        title=session.title,
+        abstract=session.abstract,
+        abstract_rendered=session.abstract_rendered,
+        description=session.description,
+        description_rendered=session.description_rendered,
+        language=session.language,
+        language_display=force_text(session.get_language_display()),
+        start=session.start,
+        end=session.end,
+        is_global=session.is_global,
+        released=session.released,
+        accept_recording=session.accept_recording,
+        kind=_get_kind(session.kind) if session.kind_id else None,
+        audience_level=session.audience_level.name if session.audience_level_id else None,
+        track=session.track.name if session.track_id else None,
+        speaker=_get_speaker(session.speaker) if session.speaker_id else None,
+        additional_speakers=tuple(_get_speaker(s) for s in session.additional_speakers.all()),
+        locations=_get_locations(session),
+        tags=tuple(tag.name for tag in session.tags.all()),
+        url=session.get_absolute_url(),
+        ) for session in sessions)
+
+    side_events = models.SideEvent.objects \
+        .filter(**event_filter) \
+        .filter(**_get_pk_filter(side_event_pks)) \
+        .prefetch_related('location') \
+        .order_by('start', 'pk')
+    side_event_data = tuple(SideEventData(
+        pk=evt.pk,
+        name=evt.name,
+        description=evt.description,
+        description_rendered=evt.description_rendered,
+        start=evt.start,
+        end=evt.end,
+        is_global=evt.is_global,
+        is_pause=evt.is_pause,
+        is_recordable=evt.is_recordable,
+        locations=_get_locations(evt),
+        url=evt.get_absolute_url(),
+        ) for evt in side_events)
+
+    return ScheduleDataset(
+        conference=ConferenceData(conference.pk, conference.title,
+                                  conference.slug, conference.start_date,
+                                  conference.end_date),
+        locations=tuple(locations.values()),
+        speakers=tuple(sorted(speakers.values(), key=attrgetter('pk'))),
+        sessions=session_data,
+        side_events=side_event_data)
+
+
+def _get_pk_filter(pks):
+    if pks is None:
+        return {}
+    return {'pk__in': pks}
+
+
+def _create_speaker_data(speaker):
+    user = speaker.user
+    avatar_url = avatar_path = None
+    if user.avatar:
+        avatar_url = user.avatar.url
+        avatar_path = user.avatar.path
+    return SpeakerData(
+        pk=speaker.pk,
+        user_pk=user.pk,
+        username=user.username,
+        full_name=get_full_name(user),
+        display_name=get_display_name(user),
+        email=user.email,
+        short_info=user.short_info,
+        short_info_rendered=user.short_info_rendered,
+        avatar_url=avatar_url,
+        avatar_path=avatar_path,
+        url=reverse('account_profile', kwargs={'uid': user.pk}))
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Embed codes of the slides and videos linked from sessions and side events.
+
+Resolving a link means requesting external services, so it is done in a
+Celery task once a link is added or changed. Rendering a page only reads
+the stored embed code and never waits for an external service.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import hashlib
+import logging
+
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from . import models
+from . import slides
+from . import videos
+
+
+LOG = logging.getLogger(__name__)
+
+#: Generates the embed code of a link by the kind of the link
+GENERATORS = {
+    models.Embed.KIND_SLIDES: slides.generate_embed_code,
+    models.Embed.KIND_VIDEO: videos.generate_embed_code,
+}
+
+#: Checks whether any service supports a link by the kind of the link
+SUPPORT_CHECKS = {
+    models.Embed.KIND_SLIDES: slides.is_supported,
+    models.Embed.KIND_VIDEO: videos.is_supported,
+}
+
+#: Seconds during which a link is not requested to be resolved again
+PENDING_TIMEOUT = 300
+
+#: Seconds to wait before retrying a failed link for the first time. The
+#: delay doubles with every further failure up to ``MAX_RETRY_DELAY``.
+RETRY_DELAY = 300
+MAX_RETRY_DELAY = 24 * 60 * 60
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def _hash_url(url):
+    return hashlib.md5(url.encode('utf-8')).hexdigest()
+
+
+def _get_pending_key(kind, url):
+    return 'embed_pending:{0}:{1}'.format(kind, _hash_url(url))
+
+
+def _get_cache_key(kind, url):
+    return 'embed:{0}:{1}'.format(kind, _hash_url(url))
+
+
+def get_retry_delay(failures):
+    """
+    Returns the seconds to wait after the given number of failures.
+    """
+    return min(RETRY_DELAY * 2 ** (max(failures, 1) - 1), MAX_RETRY_DELAY)
+
+
+def resolve_embed(kind, url):
+    """
+    Fetches and stores the embed code of the given link.
+    """
+    LOG.debug("Resolving %s embed of %s", kind, url)
+    current_time = now()
+    if not SUPPORT_CHECKS[kind](url):
+        defaults = {
+            'state': models.Embed.STATE_UNSUPPORTED,
+            'html': '',
+            'failures': 0,
+            'resolved': current_time,
+            'retry_at': None,
+        }
+    else:
+        html = GENERATORS[kind](url)
+        if html:
+            defaults = {
+                'state': models.Embed.STATE_RESOLVED,
+                'html': html,
+                'failures': 0,
+                'resolved': current_time,
+                'retry_at': None,
+            }
+        else:
+            # A formerly resolved embed code is kept until a retry succeeds.
+            failures = (models.Embed.objects.filter(kind=kind, url=url)
+                        .values_list('failures', flat=True).first() or 0) + 1
+            LOG.warning("Failed to resolve %s embed of %s (%d failure(s))",
+                        kind, url, failures)
+            defaults = {
+                'state': models.Embed.STATE_FAILED,
+                'failures': failures,
+                'retry_at': current_time + datetime.timedelta(
+                    seconds=get_retry_delay(failures)),
+            }
+    embed, _ = models.Embed.objects.update_or_create(kind=kind, url=url,
+                                                     defaults=defaults)
+    cache.set(_get_cache_key(kind, url),
+              (embed.state, embed.html, embed.retry_at), CACHE_TIMEOUT)
+    cache.delete(_get_pending_key(kind, url))
+    return embed
+
+
+def request_embed(kind, url):
+    """
+    Resolves the embed code of the given link in the background unless
+    that has been requested recently.
+    """
+    from . import tasks
+    if cache.add(_get_pending_key(kind, url), True, PENDING_TIMEOUT):
+        tasks.resolve_embed.delay(kind, url)
+
+
+def get_embed_code(kind, url):
+    """
+    Returns the stored embed code of the given link or None if there is
+    none (yet). Unknown links and failed links that are due for a retry
+    are resolved in the background.
+    """
+    if not url:
+        return None
+    key = _get_cache_key(kind, url)
+    cached = cache.get(key)
+    if cached is None:
+        cached = models.Embed.objects.filter(kind=kind, url=url) \
+            .values_list('state', 'html', 'retry_at').first()
+        if cached is None:
+            # Links stored before embeds were resolved in the background.
+            request_embed(kind, url)
+            return None
+        cache.set(key, cached, CACHE_TIMEOUT)
+    state, html, retry_at = cached
+    if state == models.Embed.STATE_FAILED and retry_at is not None and retry_at <= now():
+        request_embed(kind, url)
+    return html or None
+
+
+def get_failing_embeds():
+    """
+    Returns the embeds of links that currently fail to resolve.
+    """
+    return models.Embed.objects.filter(state=models.Embed.STATE_FAILED) \
+        .order_by('-failures', 'url')
@@ -3,6 +3,8 @@ from __future__ import unicode_literals
 
 import collections
 import datetime
+import heapq
+import json
 import logging
 import os
 import shutil
@@ -10,12 +12,13 @@ import sys
 import tablib
 import StringIO
 
-from itertools import chain, groupby
-from operator import attrgetter
+from itertools import chain, count, groupby
+from operator import attrgetter, itemgetter
 
 from lxml import etree
+from tablib.compat import csv
 
-from django.core.urlresolvers import reverse
+from django.conf import settings
 from django.contrib.sites import models as site_models
 from django.template.defaultfilters import slugify
 from django.utils.encoding import force_text
@@ -24,14 +27,15 @@ from django.utils import timezone
 from django.utils.text import slugify
 
 from . import models
+from .dataset import LocationData, SessionData, SideEventData, load_schedule_dataset
 from pyconde.sponsorship import models as sponsorship_models
 from pyconde.conference import models as conference_models
-from pyconde.accounts.utils import get_full_name
-from pyconde.accounts.utils import get_display_name
 
 
 LOG = logging.getLogger('pyconde.schedule.exporters')
 
+CSV_ENCODING = 'utf-8'
+
 
 def _format_cospeaker(s):
     """
@@ -41,7 +45,50 @@ def _format_cospeaker(s):
     return force_text(s).replace('|', ' ')
 
 
+#: Number of objects loaded at once by :func:`iter_queryset`
+EXPORT_CHUNK_SIZE = 200
+
+
+def iter_queryset(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields all objects of the queryset while only loading ``chunk_size``
+    objects at a time. Other than ``queryset.iterator()`` this still
+    applies ``prefetch_related`` lookups (once per chunk).
+    """
+    offset = 0
+    while True:
+        chunk = list(queryset[offset:offset + chunk_size])
+        if not chunk:
+            break
+        for obj in chunk:
+            yield obj
+        offset += chunk_size
+
+
+def _merge_sorted(iterables, key):
+    """
+    Merges the given iterables, which already have to be sorted by the given
+    key. Items with the same key are returned in the order of the iterables.
+    """
+    counter = count()
+
+    def decorate(iterable, idx):
+        for item in iterable:
+            yield key(item), idx, next(counter), item
+
+    decorated = [decorate(iterable, idx) for idx, iterable in enumerate(iterables)]
+    for item in heapq.merge(*decorated):
+        yield item[-1]
+
+
 class AbstractExporter(object):
+    """
+    Base class for CSV exporters. Subclasses define the ``headers`` and
+    yield the rows one by one in ``get_rows``, so that an export can either
+    be streamed (:meth:`iter_csv`) or be returned as a tablib dataset.
+    """
+    headers = ()
+
     def as_csv_value(self, value):
         """
         If a value is None, returns it as empty string instead of 'None'.
@@ -50,18 +97,47 @@ class AbstractExporter(object):
             return ''
         return value
 
+    def get_rows(self):
+        raise NotImplementedError()
+
+    def __call__(self):
+        data = tablib.Dataset(headers=list(self.headers))
+        for row in self.get_rows():
+            data.append(row)
+        return data
+
+    def iter_csv(self):
+        """
+        Yields the export as CSV line by line.
+        """
+        buf = StringIO.StringIO()
+        writer = csv.writer(buf, encoding=CSV_ENCODING)
+        for row in chain([self.headers], self.get_rows()):
+            writer.writerow(row)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    def write(self, fp):
+        for line in self.iter_csv():
+            fp.write(line)
+
 
 class SimpleSessionExporter(AbstractExporter):
+    headers = ['ID', 'ProposalID', 'Title', 'SpeakerUsername', 'SpeakerName',
+               'CoSpeakers', 'AudienceLevel', 'Duration', 'Start', 'End',
+               'Track', 'Timeslots']
+
     def __init__(self, queryset):
         self.queryset = queryset
 
-    def __call__(self):
+    def get_rows(self):
         queryset = self.queryset.select_related('duration', 'track', 'proposal',
-            'speaker', 'latest_proposalversion__track', 'audience_level')
-        data = tablib.Dataset(headers=['ID', 'ProposalID', 'Title',
-            'SpeakerUsername', 'SpeakerName', 'CoSpeakers', 'AudienceLevel',
-            'Duration', 'Start', 'End', 'Track', 'Timeslots'])
-        for session in queryset:
+            'speaker__user', 'audience_level') \
+            .prefetch_related('additional_speakers__user',
+                              'proposal__available_timeslots') \
+            .order_by('pk')
+        for session in iter_queryset(queryset):
             duration = session.duration
             audience_level = session.audience_level
             track = session.track
@@ -85,210 +161,231 @@ class SimpleSessionExporter(AbstractExporter):
                     for slot in session.proposal.available_timeslots.all()))
             else:
                 row.append('')
-            data.append(row)
-        return data
+            yield row
 
 
 class GuidebookExporterSections(AbstractExporter):
-    def __call__(self):
-        data = tablib.Dataset(headers=['name', 'start', 'end', 'description'])
-        for section in conference_models.Section.objects.order_by('start_date').all():
-            data.append([
+    headers = ['name', 'start', 'end', 'description']
+
+    def get_rows(self):
+        for section in conference_models.Section.objects.order_by('start_date').iterator():
+            yield [
                 self.as_csv_value(section.name),
                 self.as_csv_value(section.start_date),
                 self.as_csv_value(section.end_date),
                 self.as_csv_value(section.description)
-                ])
-        return data
+                ]
 
 
-class GuidebookExporterSessions(object):
-    def get_speaker_url(self, speaker):
-        site = site_models.Site.objects.get_current()
-        url = ''
-        if speaker.user is not None:
-            url = reverse('account_profile', kwargs={'uid': speaker.user.pk})
-        return '<https://{0}{1}>'.format(site.domain, url)
+def _iter_chunks(items, chunk_size):
+    for offset in range(0, len(items), chunk_size):
+        yield items[offset:offset + chunk_size]
 
-    def __call__(self):
-        result = []
-        sessions = models.Session.objects \
-            .select_related('kind', 'audience_level', 'track',
-                            'speaker__user') \
-            .prefetch_related('additional_speakers__user',
-                              'location') \
-            .filter(released=True, start__isnull=False, end__isnull=False) \
-            .exclude(kind__slug__in=('poster')) \
-            .order_by('start') \
-            .only('end', 'start', 'title', 'abstract', 'description', 'is_global',
-                  'kind__name',
-                  'audience_level__name',
-                  'track__name',
-                  'speaker__user__username',
-                  'speaker__user__avatar',
-                  'speaker__user__full_name',
-                  'speaker__user__display_name',
-                  'speaker__user__short_info',
-                  'speaker__user__user') \
-            .all()
-        for session in sessions:
-            additional_speakers = list(session.additional_speakers.all())
-            cospeakers = [_format_cospeaker(s) for s in additional_speakers]
-            result.append([
-                session.title,
-                session.start.date(),
-                session.start.time(),
-                session.end.time(),
-                session.location_guidebook or '',
-                session.track.name if session.track else '',
-                session.abstract_rendered.encode('utf-8'),
-                session.kind.name if session.kind else '',
-                session.audience_level.name if session.audience_level else '',
-                force_text(session.speaker),
-                '|'.join(cospeakers),
-                self.get_speaker_url(session.speaker),
-                ' '.join([self.get_speaker_url(s) for s in additional_speakers]),
-                session.description_rendered.encode('utf-8'),
-                ])
-        side_events = models.SideEvent.objects \
-            .prefetch_related('location') \
-            .filter(start__isnull=False, end__isnull=False) \
-            .order_by('start') \
-            .all()
-        for evt in side_events:
-            loc = evt.location_guidebook or ''
-            if evt.is_pause:
-                loc = ''
-            result.append([
-                evt.name,
-                evt.start.date() if evt.start else '',
-                evt.start.time() if evt.start else '',
-                evt.end.time() if evt.end else '',
-                loc,
-                '',
-                evt.description_rendered.encode('utf-8'),
-                'Break' if evt.is_pause else '',  # kind
-                '',  # audience level
-                '',  # speaker
-                '',  # co-speakers
-                '',  # speaker url
-                '',  # cospeaker urls
-                '',  # abstract
-                ])
-        # Now sort by start date and time
-        result.sort(cmp=self._sort_events)
-
-        data = tablib.Dataset(headers=['Session Title', 'Date', 'Time Start',
-            'Time End', 'Room/Location', 'Schedule Track (Optional)',
-            'Description (Optional)', 'type', 'audience', 'speaker',
-            'cospeakers', 'speaker_url', 'cospeaker_urls', 'description'])
-        for evt in result:
-            data.append(evt)
-        return data
 
-    def _sort_events(self, a, b):
+class DatasetExporter(object):
+    """
+    Base class for exporters that only format the data of a
+    :class:`~pyconde.schedule.dataset.ScheduleDataset`. The dataset can be
+    shared between exporters and is otherwise loaded for the current
+    conference on first access.
+    """
+
+    def __init__(self, dataset=None):
+        self._dataset = dataset
+
+    @property
+    def dataset(self):
+        if self._dataset is None:
+            self._dataset = load_schedule_dataset()
+        return self._dataset
+
+    def iter_datasets(self):
         """
-        Sort events by their start datetime. If these are similar, use the location
-        name.
+        Yields the shared dataset or, if there is none, one dataset per day
+        with events in chronological order. Streamed exports use this to
+        only hold the events of a single day in memory.
         """
-        res = cmp(a[1], b[1])
-        if res == 0:
-            res = cmp(a[2], b[2])
-        if res == 0:
-            res = cmp(a[4], b[4])
-        return res
+        if self._dataset is not None:
+            yield self._dataset
+            return
+        conference = conference_models.current_conference()
+        days = set(chain(
+            models.Session.objects.filter(conference=conference).datetimes('start', 'day'),
+            models.SideEvent.objects.filter(conference=conference).datetimes('start', 'day')))
+        for day in sorted(days):
+            yield load_schedule_dataset(conference, start=day,
+                                        end=day + datetime.timedelta(days=1))
 
 
-class GuidebookExporterSpeakers(object):
-    def __call__(self):
-        data = tablib.Dataset(headers=['Name',
-            'Sub-Title (i.e. Location, Table/Booth, or Title/Sponsorship Level)',
-            'Description (Optional)', 'Location/Room'])
+def _is_guidebook_session(session):
+    return session.released and session.start is not None \
+        and session.end is not None and session.kind.slug != 'poster'
+
+
+class GuidebookExporterSessions(AbstractExporter, DatasetExporter):
+    headers = ['Session Title', 'Date', 'Time Start', 'Time End',
+               'Room/Location', 'Schedule Track (Optional)',
+               'Description (Optional)', 'type', 'audience', 'speaker',
+               'cospeakers', 'speaker_url', 'cospeaker_urls', 'description']
+
+    def get_speaker_url(self, speaker):
+        return '<https://{0}{1}>'.format(self.domain, speaker.url)
+
+    def get_rows(self):
+        self.domain = site_models.Site.objects.get_current().domain
+        # The days are yielded in order, so the rows of each day only have
+        # to be sorted among themselves.
+        for dataset in self.iter_datasets():
+            for row in self._get_day_rows(dataset):
+                yield row
+
+    def _get_day_rows(self, dataset):
+        sessions = (s for s in dataset.sessions if _is_guidebook_session(s))
+        side_events = (e for e in dataset.side_events
+                       if e.start is not None and e.end is not None)
+        # Both are sorted by their start already. Sorting by the location as
+        # well only requires the events starting at the same time to be
+        # sorted again.
+        streams = [
+            self._sort_by_location(self._get_session_row(s) for s in sessions),
+            self._sort_by_location(self._get_side_event_row(e) for e in side_events),
+        ]
+        return _merge_sorted(streams, key=itemgetter(1, 2, 4))
+
+    def _sort_by_location(self, rows):
+        for start, rows_at_start in groupby(rows, itemgetter(1, 2)):
+            for row in sorted(rows_at_start, key=itemgetter(4)):
+                yield row
+
+    def _get_session_row(self, session):
+        cospeakers = [_format_cospeaker(s.display_name) for s in session.additional_speakers]
+        return [
+            session.title,
+            session.start.date(),
+            session.start.time(),
+            session.end.time(),
+            session.location_guidebook,
+            session.track or '',
+            session.abstract_rendered.encode('utf-8'),
+            session.kind.name if session.kind else '',
+            session.audience_level or '',
+            session.speaker.display_name if session.speaker else '',
+            '|'.join(cospeakers),
+            self.get_speaker_url(session.speaker),
+            ' '.join([self.get_speaker_url(s) for s in session.additional_speakers]),
+            session.description_rendered.encode('utf-8'),
+            ]
+
+    def _get_side_event_row(self, evt):
+        loc = evt.location_guidebook
+        if evt.is_pause:
+            loc = ''
+        return [
+            evt.name,
+            evt.start.date() if evt.start else '',
+            evt.start.time() if evt.start else '',
+            evt.end.time() if evt.end else '',
+            loc,
+            '',
+            evt.description_rendered.encode('utf-8'),
+            'Break' if evt.is_pause else '',  # kind
+            '',  # audience level
+            '',  # speaker
+            '',  # co-speakers
+            '',  # speaker url
+            '',  # cospeaker urls
+            '',  # abstract
+            ]
+
+
+class GuidebookExporterSpeakers(AbstractExporter, DatasetExporter):
+    headers = ['Name',
+               'Sub-Title (i.e. Location, Table/Booth, or Title/Sponsorship Level)',
+               'Description (Optional)', 'Location/Room']
+
+    def get_rows(self):
+        # Only the speakers are kept while going through the days, as they
+        # have to be sorted and deduplicated across all of them.
         speakers = set()
-        sessions = models.Session.objects \
-            .select_related('speaker__user') \
-            .prefetch_related('additional_speakers__user') \
-            .filter(released=True, start__isnull=False, end__isnull=False) \
-            .exclude(kind__slug__in=('poster')) \
-            .only('speaker__user__username',
-                  'speaker__user__avatar',
-                  'speaker__user__full_name',
-                  'speaker__user__display_name',
-                  'speaker__user__short_info',
-                  'speaker__user__user') \
-            .all()
-        for session in sessions:
-            user = session.speaker.user
-            speakers.add((get_full_name(user), user.short_info_rendered))
-            for speaker in session.additional_speakers.all():
-                user = speaker.user
-                speakers.add((get_full_name(user), user.short_info_rendered))
-
-        speakers = sorted(speakers)
-        for speaker in speakers:
-            data.append([
+        for dataset in self.iter_datasets():
+            for session in dataset.sessions:
+                if not _is_guidebook_session(session):
+                    continue
+                for speaker in chain([session.speaker], session.additional_speakers):
+                    speakers.add((speaker.full_name, speaker.short_info_rendered))
+
+        for speaker in sorted(speakers):
+            yield [
                 speaker[0],
                 '',
                 speaker[1].encode('utf-8'),
                 ''
-                ])
-        return data
+                ]
 
 
-class GuidebookExporterLinks(object):
-    def __call__(self):
-        data = tablib.Dataset(headers=['Session ID (Optional)',
-            'Session Name (Optional)', 'Link To Session ID (Optional)',
-            'Link To Session Name (Optional)', 'Link To Item ID (Optional)',
-            'Link To Item Name (Optional)', 'Link To Form Name (Optional)'])
-        sessions = models.Session.objects \
-            .select_related('kind', 'speaker__user') \
-            .prefetch_related('additional_speakers__user') \
-            .filter(released=True, start__isnull=False, end__isnull=False) \
-            .exclude(kind__slug__in=('poster')) \
-            .only('title',
-                  'kind__slug',
-                  'speaker__user__username',
-                  'speaker__user__avatar',
-                  'speaker__user__full_name',
-                  'speaker__user__display_name',
-                  'speaker__user__user') \
-            .all()
-
-        for session in sessions:
-            user = session.speaker.user
-            speakers = set([get_full_name(user)])
-            for speaker in session.additional_speakers.all():
-                speakers.add(get_full_name(user))
-            form = 'Talk Feedback' if session.kind.slug in ('talk', 'keynote', 'sponsored') else ''
-            data.append([
-                '',
-                session.title,
-                '',
-                '',
-                '',
-                ';'.join(speakers),
-                form
-                ])
-        return data
+class GuidebookExporterLinks(AbstractExporter, DatasetExporter):
+    headers = ['Session ID (Optional)', 'Session Name (Optional)',
+               'Link To Session ID (Optional)', 'Link To Session Name (Optional)',
+               'Link To Item ID (Optional)', 'Link To Item Name (Optional)',
+               'Link To Form Name (Optional)']
 
+    def get_rows(self):
+        for dataset in self.iter_session_datasets():
+            sessions = sorted((s for s in dataset.sessions if _is_guidebook_session(s)),
+                              key=attrgetter('pk'))
+            for session in sessions:
+                yield self._get_row(session)
 
-class GuidebookExporterSponsors(object):
-    def __call__(self):
-        data = tablib.Dataset(headers=['name', 'website', 'description',
-            'level_code', 'level_name'])
-        for sponsor in sponsorship_models.Sponsor.objects.filter(active=True).all():
-            data.append([
+    def iter_session_datasets(self):
+        """
+        Yields the shared dataset or datasets of ``EXPORT_CHUNK_SIZE``
+        guidebook sessions each, ordered by their primary key.
+        """
+        if self._dataset is not None:
+            yield self._dataset
+            return
+        conference = conference_models.current_conference()
+        pks = list(models.Session.objects
+                   .filter(conference=conference, released=True,
+                           start__isnull=False, end__isnull=False)
+                   .exclude(kind__slug='poster')
+                   .order_by('pk').values_list('pk', flat=True))
+        for chunk in _iter_chunks(pks, EXPORT_CHUNK_SIZE):
+            yield load_schedule_dataset(conference, session_pks=chunk,
+                                        side_event_pks=())
+
+    def _get_row(self, session):
+        speakers = set(s.full_name for s in chain([session.speaker],
+                                                   session.additional_speakers))
+        form = 'Talk Feedback' if session.kind.slug in ('talk', 'keynote', 'sponsored') else ''
+        return [
+            '',
+            session.title,
+            '',
+            '',
+            '',
+            ';'.join(speakers),
+            form
+            ]
+
+
+class GuidebookExporterSponsors(AbstractExporter):
+    headers = ['name', 'website', 'description', 'level_code', 'level_name']
+
+    def get_rows(self):
+        sponsors = sponsorship_models.Sponsor.objects.select_related('level') \
+            .filter(active=True).order_by('pk')
+        for sponsor in iter_queryset(sponsors):
+            yield [
                 sponsor.name if sponsor.name else '',
                 sponsor.external_url if sponsor.external_url else '',
                 sponsor.description_rendered if sponsor.description else '',
                 sponsor.level.slug if sponsor.level else '',
                 sponsor.level.name if sponsor.level else '',
-                ])
-        return data
+                ]
 
 
-class SessionForEpisodesExporter(object):
+class SessionForEpisodesExporter(DatasetExporter):
     """
     This exporter creates a JSON file that is used by the video team in order
     to add metadata to the created media files.
@@ -298,14 +395,13 @@ class SessionForEpisodesExporter(object):
         Speaker = collections.namedtuple('Speaker', 'name email')
         result = []
         if session.speaker is not None:
-            result.append(Speaker(force_text(session.speaker), session.speaker.user.email))
-        for speaker in session.additional_speakers.all():
-            result.append(Speaker(force_text(speaker), speaker.user.email))
+            result.append(Speaker(session.speaker.display_name, session.speaker.email))
+        for speaker in session.additional_speakers:
+            result.append(Speaker(speaker.display_name, speaker.email))
         return result
 
     def create_episode_data(self, session):
-        site = site_models.Site.objects.get_current()
-        is_sideevent = isinstance(session, models.SideEvent)
+        is_sideevent = isinstance(session, SideEventData)
         if is_sideevent:
             title = session.name
             speakers = []
@@ -319,7 +415,7 @@ class SessionForEpisodesExporter(object):
 
         ep = {
             'name': title,
-            'room': session.location.name,
+            'room': session.location_pretty,
             'start': session.start.isoformat(),
             'duration': (session.end - session.start).total_seconds() / 60.0,
             'end': session.end.isoformat(),
@@ -329,21 +425,29 @@ class SessionForEpisodesExporter(object):
             'license': None,  # TODO: Add license information
             'description': description,
             'conf_key': '{0}:{1}'.format('session' if not is_sideevent else 'event', session.pk),
-            'conf_url': 'https://{domain}{path}'.format(domain=site.domain, path=session.get_absolute_url()),
-            'tags': ', '.join([t.name for t in session.tags.all()]) if not is_sideevent else ''
+            'conf_url': 'https://{domain}{path}'.format(domain=self.domain, path=session.url),
+            'tags': ', '.join(session.tags) if not is_sideevent else ''
         }
         return ep
 
     def __call__(self):
-        items = [self.create_episode_data(session) for session in models.Session.current_conference.select_related('location', 'speaker').all()]
+        self.domain = site_models.Site.objects.get_current().domain
+        items = [self.create_episode_data(session) for session in self.dataset.sessions
+                 if session.start is not None and session.end is not None]
         # Also export all side-events that are not pauses
-        items += [self.create_episode_data(evt) for evt in models.SideEvent.current_conference.filter(is_recordable=True).exclude(is_pause=True).select_related('location').all()]
+        items += [self.create_episode_data(evt) for evt in self.dataset.side_events
+                  if evt.is_recordable and not evt.is_pause]
         return items
 
+    def write(self, fp):
+        json.dump(self(), fp, indent=4)
+
 
-class XMLExporter(object):
+class XMLExporter(DatasetExporter):
 
-    def __init__(self, outfile, base_url=None, pretty=False, export_avatars=False):
+    def __init__(self, outfile=None, base_url=None, pretty=False, export_avatars=False,
+                 dataset=None):
+        super(XMLExporter, self).__init__(dataset)
         if base_url is None:
             self.base_url = 'http://%s' % site_models.Site.objects.get_current().domain
         else:
@@ -353,6 +457,7 @@ class XMLExporter(object):
         self.day_grouper = lambda evt: evt.start.date()
         self.pretty = pretty
         self.export_avatars = export_avatars
+        self.avatar_dir = None
 
     def export(self):
         if self.export_avatars:
@@ -360,80 +465,65 @@ class XMLExporter(object):
             if not os.path.exists(self.avatar_dir):
                 os.makedirs(self.avatar_dir)
         with open(self.outfile, 'w') as fp:
-            with etree.xmlfile(fp) as xf:
-                sessions = models.Session.objects \
-                    .select_related('kind', 'audience_level', 'track',
-                                    'speaker__user') \
-                    .prefetch_related('additional_speakers__user',
-                                      'location') \
-                    .filter(released=True, start__isnull=False, end__isnull=False) \
-                    .order_by('start') \
-                    .only('end', 'start', 'title', 'abstract', 'description', 'is_global',
-                          'kind__name',
-                          'audience_level__name',
-                          'track__name',
-                          'speaker__user__username',
-                          'speaker__user__avatar',
-                          'speaker__user__full_name',
-                          'speaker__user__display_name',
-                          'speaker__user__short_info',
-                          'speaker__user__user') \
-                    .all()
-                side_events = models.SideEvent.objects \
-                    .prefetch_related('location') \
-                    .filter(start__isnull=False, end__isnull=False) \
-                    .order_by('start') \
-                    .all()
-                all_events = sorted(chain(sessions, side_events), key=self.event_sorter)
-                all_events = groupby(all_events, self.day_grouper)
-                with xf.element('schedule', created=now().isoformat()):
-                    for day, events in all_events:
-                        self._export_day(fp, xf, day, events)
+            self.write(fp)
+
+    def write(self, fp):
+        with etree.xmlfile(fp) as xf:
+            sessions = (s for s in self.dataset.sessions
+                        if s.released and s.start is not None and s.end is not None)
+            side_events = (e for e in self.dataset.side_events
+                           if e.start is not None and e.end is not None)
+            all_events = sorted(chain(sessions, side_events), key=self.event_sorter)
+            all_events = groupby(all_events, self.day_grouper)
+            with xf.element('schedule', created=now().isoformat()):
+                for day, events in all_events:
+                    self._export_day(fp, xf, day, events)
 
     def _export_day(self, fp, xf, day, events):
         with xf.element('day', date=day.isoformat()):
             for event in events:
                 try:
-                    if isinstance(event, models.Session):
+                    if isinstance(event, SessionData):
                         self._export_session(fp, xf, event)
-                    elif isinstance(event, models.SideEvent):
+                    elif isinstance(event, SideEventData):
                         self._export_side_event(fp, xf, event)
                 except Exception as e:
                     LOG.fatal('Error exporting %s(%d) %s' % (
-                        event.__class__.__name__, event.id, event) + force_text(e))
+                        event.__class__.__name__, event.pk, force_text(event)) + force_text(e))
                     import traceback
                     traceback.print_exc()
 
+    def _export_room(self, xf, event):
+        rooms = event.locations
+        if len(rooms) > 1:
+            with xf.element('room'):
+                xf.write(event.location_pretty, pretty_print=self.pretty)
+        elif len(rooms) == 1:
+            with xf.element('room', id=force_text(rooms[0].pk)):
+                xf.write(event.location_pretty, pretty_print=self.pretty)
+        elif event.is_global:
+            with xf.element('room'):
+                xf.write('ALL', pretty_print=self.pretty)
+        else:
+            with xf.element('room'):
+                pass
+
     def _export_session(self, fp, xf, event):
-        with xf.element('entry', id=force_text(event.id)):
+        with xf.element('entry', id=force_text(event.pk)):
             with xf.element('category'):
-                xf.write(force_text(event.kind), pretty_print=self.pretty)
+                xf.write(force_text(event.kind.name if event.kind else None), pretty_print=self.pretty)
             with xf.element('audience'):
                 xf.write(force_text(event.audience_level), pretty_print=self.pretty)
             with xf.element('topics'):
                 if event.track:
                     with xf.element('topic'):
-                        xf.write(force_text(event.track), pretty_print=self.pretty)
+                        xf.write(event.track, pretty_print=self.pretty)
             with xf.element('start'):
                 xf.write(event.start.strftime('%H%M'), pretty_print=self.pretty)
             with xf.element('duration'):
                 dur = int((event.end - event.start).total_seconds() / 60)
                 xf.write(force_text(dur), pretty_print=self.pretty)
-
-            rooms = event.location.all()
-            if len(rooms) > 1:
-                with xf.element('room'):
-                    xf.write(event.location_pretty, pretty_print=self.pretty)
-            elif len(rooms) == 1:
-                with xf.element('room', id=force_text(rooms[0].id)):
-                    xf.write(event.location_pretty, pretty_print=self.pretty)
-            elif event.is_global:
-                with xf.element('room'):
-                    xf.write('ALL', pretty_print=self.pretty)
-            else:
-                with xf.element('room'):
-                    pass
-
+            self._export_room(xf, event)
             with xf.element('title'):
                 xf.write(force_text(event.title), pretty_print=self.pretty)
             with xf.element('abstract'):
@@ -441,12 +531,12 @@ class XMLExporter(object):
             with xf.element('description'):
                 xf.write(force_text(event.description), pretty_print=self.pretty)
             with xf.element('speakers'):
-                self._export_speaker(fp, xf, event.speaker.user)
-                for speaker in event.additional_speakers.all():
-                    self._export_speaker(fp, xf, speaker.user)
+                self._export_speaker(fp, xf, event.speaker)
+                for speaker in event.additional_speakers:
+                    self._export_speaker(fp, xf, speaker)
 
     def _export_side_event(self, fp, xf, event):
-        with xf.element('entry', id=force_text(event.id)):
+        with xf.element('entry', id=force_text(event.pk)):
             with xf.element('category'):
                 pass
             with xf.element('audience'):
@@ -458,84 +548,51 @@ class XMLExporter(object):
             with xf.element('duration'):
                 dur = int((event.end - event.start).total_seconds() / 60)
                 xf.write(force_text(dur), pretty_print=self.pretty)
-
-            rooms = event.location.all()
-            if len(rooms) > 1:
-                with xf.element('room'):
-                    xf.write(event.location_pretty, pretty_print=self.pretty)
-            elif len(rooms) == 1:
-                with xf.element('room', id=force_text(rooms[0].id)):
-                    xf.write(event.location_pretty, pretty_print=self.pretty)
-            elif event.is_global:
-                with xf.element('room'):
-                    xf.write('ALL', pretty_print=self.pretty)
-            else:
-                with xf.element('room'):
-                    pass
-
+            self._export_room(xf, event)
             with xf.element('title'):
                 xf.write(event.name, pretty_print=self.pretty)
             with xf.element('description'):
-                xf.write(event.description, pretty_print=self.pretty)
+                xf.write(event.description or '', pretty_print=self.pretty)
             with xf.element('speakers'):
                 pass
 
-    def _export_speaker(self, fp, xf, user):
-        with xf.element('speaker', id=force_text(user.id)):
+    def _export_speaker(self, fp, xf, speaker):
+        with xf.element('speaker', id=force_text(speaker.user_pk)):
             with xf.element('name'):
-                name = get_full_name(user)
-                xf.write(name, pretty_print=self.pretty)
+                xf.write(speaker.full_name, pretty_print=self.pretty)
             with xf.element('profile'):
-                xf.write(self.base_url + reverse('account_profile',
-                                                 kwargs={'uid': user.id}), pretty_print=self.pretty)
+                xf.write(self.base_url + speaker.url, pretty_print=self.pretty)
             with xf.element('description'):
-                xf.write(user.short_info, pretty_print=self.pretty)
+                xf.write(speaker.short_info, pretty_print=self.pretty)
             with xf.element('image'):
-                if user.avatar:
-                    avatar_url = self.base_url + user.avatar.url
-                    xf.write(avatar_url, pretty_print=self.pretty)
-                if self.export_avatars:
-                    filename, ext = os.path.splitext(user.avatar.file.name)
-                    dest = os.path.join(self.avatar_dir, str(user.id)) + ext
-                    shutil.copy(user.avatar.file.name, dest)
+                if speaker.avatar_url:
+                    xf.write(self.base_url + speaker.avatar_url, pretty_print=self.pretty)
+                if self.avatar_dir and speaker.avatar_path:
+                    filename, ext = os.path.splitext(speaker.avatar_path)
+                    dest = os.path.join(self.avatar_dir, str(speaker.user_pk)) + ext
+                    shutil.copy(speaker.avatar_path, dest)
 
 
-class XMLExporterPentabarf(object):
+class XMLExporterPentabarf(DatasetExporter):
 
-    def __init__(self):
+    def __init__(self, dataset=None):
+        super(XMLExporterPentabarf, self).__init__(dataset)
         self.domain = site_models.Site.objects.get_current().domain
         self.base_url = 'http://%s' % self.domain
 
     def export(self):
         output = StringIO.StringIO()
-        with etree.xmlfile(output) as xf:
-            sessions = models.Session.objects \
-                .select_related('kind', 'audience_level', 'track',
-                                'speaker__user') \
-                .prefetch_related('additional_speakers__user',
-                                  'location') \
-                .filter(released=True, start__isnull=False, end__isnull=False,
-                        kind__slug__in=('talk', 'keynote', 'sponsored')) \
-                .order_by('start') \
-                .only('end', 'start', 'title', 'abstract', 'description', 'language',
-                      'kind__name',
-                      'audience_level__name',
-                      'track__name',
-                      'speaker__user__username',
-                      'speaker__user__avatar',
-                      'speaker__user__full_name',
-                      'speaker__user__display_name',
-                      'speaker__user__short_info',
-                      'speaker__user__user') \
-                .all()
-            side_events = models.SideEvent.objects \
-                .select_related() \
-                .prefetch_related('location') \
-                .filter(start__isnull=False, end__isnull=False, is_recordable=True) \
-                .order_by('start') \
-                .only('end', 'start', 'name') \
-                .all()
-            self.conference = force_text(conference_models.current_conference())
+        self.write(output)
+        return output
+
+    def write(self, fp):
+        with etree.xmlfile(fp) as xf:
+            sessions = (s for s in self.dataset.sessions
+                        if s.released and s.start is not None and s.end is not None
+                        and s.kind.slug in ('talk', 'keynote', 'sponsored'))
+            side_events = (e for e in self.dataset.side_events
+                           if e.start is not None and e.end is not None and e.is_recordable)
+            self.conference = self.dataset.conference.title
             self._duration_base = datetime.datetime.combine(datetime.date.today(), datetime.time(0, 0, 0))
             with xf.element('iCalendar'):
                 with xf.element('vcalendar'):
@@ -551,16 +608,15 @@ class XMLExporterPentabarf(object):
                         self._export_session(xf, session)
                     for session in side_events:
                         self._export_side_event(xf, session)
-        return output
 
     def _export_session(self, xf, session):
         with xf.element('vevent'):
             with xf.element('method'):
                 xf.write('PUBLISH')
             with xf.element('uid'):
-                xf.write('%d@%s@%s' % (session.id, self.conference, self.domain))
+                xf.write('%d@%s@%s' % (session.pk, self.conference, self.domain))
             with xf.element('{http://pentabarf.org}event-id'):
-                xf.write(force_text(session.id))
+                xf.write(force_text(session.pk))
             with xf.element('{http://pentabarf.org}event-slug'):
                 xf.write(slugify(session.title))
             with xf.element('{http://pentabarf.org}title'):
@@ -568,7 +624,7 @@ class XMLExporterPentabarf(object):
             with xf.element('{http://pentabarf.org}subtitle'):
                 xf.write('')
             with xf.element('{http://pentabarf.org}language'):
-                xf.write(session.get_language_display())
+                xf.write(session.language_display)
             with xf.element('{http://pentabarf.org}language-code'):
                 xf.write(session.language)
             with xf.element('dtstart'):
@@ -587,26 +643,26 @@ class XMLExporterPentabarf(object):
             with xf.element('status'):
                 xf.write('CONFIRMED')
             with xf.element('category'):
-                xf.write(force_text(session.kind))
+                xf.write(session.kind.name)
             with xf.element('url'):
-                xf.write(session.get_absolute_url())
-            for location in session.location.all():
+                xf.write(session.url)
+            for location in session.locations:
                 with xf.element('location'):
-                    xf.write(force_text(location))
+                    xf.write(location.name)
             with xf.element('attendee'):
-                xf.write(get_full_name(session.speaker.user))
-            for cospeaker in session.additional_speakers.all():
+                xf.write(session.speaker.full_name)
+            for cospeaker in session.additional_speakers:
                 with xf.element('attendee'):
-                    xf.write(get_full_name(session.speaker.user))
+                    xf.write(cospeaker.full_name)
 
     def _export_side_event(self, xf, session):
         with xf.element('vevent'):
             with xf.element('method'):
                 xf.write('PUBLISH')
             with xf.element('uid'):
-                xf.write('%d@%s@%s' % (10000 + session.id, self.conference, self.domain))
+                xf.write('%d@%s@%s' % (10000 + session.pk, self.conference, self.domain))
             with xf.element('{http://pentabarf.org}event-id'):
-                xf.write(force_text(10000 + session.id))
+                xf.write(force_text(10000 + session.pk))
             with xf.element('{http://pentabarf.org}event-slug'):
                 xf.write(slugify(session.name))
             with xf.element('{http://pentabarf.org}title'):
@@ -635,28 +691,54 @@ class XMLExporterPentabarf(object):
             with xf.element('category'):
                 xf.write('Side Event')
             with xf.element('url'):
-                xf.write(session.get_absolute_url())
-            for location in session.location.all():
+                xf.write(session.url)
+            for location in session.locations:
                 with xf.element('location'):
-                    xf.write(force_text(location))
+                    xf.write(location.name)
             with xf.element('attendee'):
                 xf.write('')
 
 
-class FrabExporter(object):
-    def __init__(self, output=None, conference=None):
+class FrabExporter(DatasetExporter):
+    def __init__(self, output=None, conference=None, dataset=None):
+        super(FrabExporter, self).__init__(dataset)
         self.output = output
         self.conference = conference
         if self.output is None:
             self.output = sys.stdout
         if self.conference is None:
-            self.conference = conference_models.current_conference()
+            if dataset is not None:
+                self.conference = dataset.conference
+            else:
+                self.conference = conference_models.current_conference()
+
+    @property
+    def dataset(self):
+        if self._dataset is None:
+            start = end = None
+            if self.conference.start_date and self.conference.end_date:
+                start = datetime.datetime.combine(self.conference.start_date, datetime.time.min)
+                end = datetime.datetime.combine(self.conference.end_date, datetime.time.min) \
+                    + datetime.timedelta(days=1)
+                if settings.USE_TZ:
+                    start = timezone.make_aware(start, timezone.get_current_timezone())
+                    end = timezone.make_aware(end, timezone.get_current_timezone())
+            self._dataset = load_schedule_dataset(self.conference, start=start, end=end)
+        return self._dataset
 
     def __call__(self):
-        doc = etree.Element('schedule')
-        doc.append(self._create_conference_information(self.conference))
-        self._add_days(doc)
-        self.output.write(etree.tostring(doc, encoding='unicode', xml_declaration=False, pretty_print=True))
+        self.write(self.output)
+
+    def write(self, fp):
+        """
+        Streams the schedule into the given binary file object. Only the
+        element of the event currently being written is kept in memory.
+        """
+        with etree.xmlfile(fp, encoding='utf-8') as xf:
+            with xf.element('schedule'):
+                xf.write(self._create_conference_information(self.conference),
+                         pretty_print=True)
+                self._write_days(xf)
 
     def _create_conference_information(self, conference):
         elem = etree.Element('conference')
@@ -669,57 +751,55 @@ class FrabExporter(object):
         etree.SubElement(elem, 'timeslot_duration').text = '00:15'
         return elem
 
-    def _add_days(self, root_element):
+    def _write_days(self, xf):
         day = self.conference.start_date
         end_date = self.conference.end_date + datetime.timedelta(days=1)
 
-        locations = list(conference_models.Location.objects.filter(conference=self.conference).all()) + [conference_models.Location(pk='other', name="Other")]
+        locations = list(self.dataset.locations) + [LocationData(pk='other', name="Other", order=None)]
+        events_by_day = self._group_events()
         day_index = 1
 
         while day < end_date:
-            self._add_day(root_element, day, locations, day_index)
+            self._write_day(xf, day, locations, day_index, events_by_day[day])
             day = day + datetime.timedelta(days=1)
             day_index += 1
 
-    def _add_day(self, root_element, day, locations, index):
-        conference = self.conference
-        elem = etree.SubElement(root_element, 'day', date=self._format_date(day), index=unicode(index))
-        sessions_in_location = collections.defaultdict(list)
-        sessions = models.Session.objects\
-            .select_related('kind', 'audience_level', 'track',
-                            'speaker__user')\
-            .prefetch_related('additional_speakers__user',
-                              'location')\
-            .filter(released=True, start__year=day.year, start__month=day.month, start__day=day.day, conference=conference)\
-            .order_by('start')\
-            .all()
-        side_events = models.SideEvent.objects\
-            .filter(start__year=day.year, start__month=day.month, start__day=day.day, conference=conference)\
-            .order_by('start')\
-            .all()
-        for session in (list(sessions) + list(side_events)):
-            for loc in session.location.all():
-                sessions_in_location[loc.pk].append(session)
-            else:
-                sessions_in_location['other'].append(session)
-        for location in locations:
-            room_element = etree.SubElement(elem, 'room', name=location.name)
-            for session in sessions_in_location[location.pk]:
-                event_elem = self._create_event(session, location)
-                if event_elem is not None:
-                    room_element.append(event_elem)
+    def _group_events(self):
+        """
+        Groups all events by their local date and the room they take place
+        in. Events without a location are put into the "other" room.
+        """
+        events_by_day = collections.defaultdict(lambda: collections.defaultdict(list))
+        sessions = (s for s in self.dataset.sessions if s.released)
+        events = (e for e in chain(sessions, self.dataset.side_events) if e.start is not None)
+        for event in sorted(events, key=attrgetter('start')):
+            rooms = events_by_day[self._local_date(event.start)]
+            for loc in event.locations:
+                rooms[loc.pk].append(event)
+            if not event.locations:
+                rooms['other'].append(event)
+        return events_by_day
+
+    def _write_day(self, xf, day, locations, index, events_in_location):
+        with xf.element('day', date=self._format_date(day), index=unicode(index)):
+            for location in locations:
+                with xf.element('room', name=location.name):
+                    for session in events_in_location[location.pk]:
+                        event_elem = self._create_event(session, location)
+                        if event_elem is not None:
+                            xf.write(event_elem, pretty_print=True)
 
     def _create_event(self, session, location):
-        if isinstance(session, models.Session):
+        if isinstance(session, SessionData):
             return self._create_event_from_session(session, location)
-        elif isinstance(session, models.SideEvent):
+        elif isinstance(session, SideEventData):
             return self._create_event_from_sideevent(session, location)
 
     def _create_event_from_session(self, session, location):
-        element = etree.Element('event', id=unicode(session.id))
+        element = etree.Element('event', id=unicode(session.pk))
         etree.SubElement(element, 'title').text = session.title
         if session.track:
-            etree.SubElement(element, 'track').text = session.track.name
+            etree.SubElement(element, 'track').text = session.track
         if session.start:
             etree.SubElement(element, 'date').text = self._format_datetime(session.start)
             etree.SubElement(element, 'start').text = self._format_time(session.start)
@@ -735,9 +815,9 @@ class FrabExporter(object):
             etree.SubElement(element, 'type').text = 'workshop' if session.kind.slug == 'training' else 'lecture'
         persons_element = etree.SubElement(element, 'persons')
         if session.speaker:
-            etree.SubElement(persons_element, 'person', id=unicode(session.speaker.user.pk)).text = get_display_name(session.speaker.user)
-        for speaker in session.additional_speakers.all():
-            etree.SubElement(persons_element, 'person', id=unicode(speaker.user.pk)).text = get_display_name(speaker.user)
+            etree.SubElement(persons_element, 'person', id=unicode(session.speaker.user_pk)).text = session.speaker.display_name
+        for speaker in session.additional_speakers:
+            etree.SubElement(persons_element, 'person', id=unicode(speaker.user_pk)).text = speaker.display_name
         return element
 
     def _create_event_from_sideevent(self, sideevent, location):
@@ -745,7 +825,7 @@ class FrabExporter(object):
         # schedule. Since both are not part of the same model type, we leave
         # place for 9999 sessions before counting side event IDs.
         # TODO: Find better solution for exported side event ids
-        element = etree.Element('event', id='{0}'.format(sideevent.id + 10000))
+        element = etree.Element('event', id='{0}'.format(sideevent.pk + 10000))
         etree.SubElement(element, 'title').text = sideevent.name
         etree.SubElement(element, 'description').text = sideevent.description
         if sideevent.start:
@@ -767,10 +847,44 @@ class FrabExporter(object):
         return u'{0:02d}:{1:02d}'.format(hours, minutes)
 
     def _format_time(self, dtime):
+        if timezone.is_aware(dtime):
+            dtime = timezone.localtime(dtime)
         return dtime.strftime('%H:%M')
 
     def _format_datetime(self, dtime):
-        return timezone.make_aware(dtime, timezone.get_current_timezone()).strftime('%Y-%m-%dT%H:%M:%S%z')
+        if timezone.is_naive(dtime):
+            dtime = timezone.make_aware(dtime, timezone.get_current_timezone())
+        else:
+            dtime = timezone.localtime(dtime)
+        return dtime.strftime('%Y-%m-%dT%H:%M:%S%z')
+
+    def _local_date(self, dtime):
+        if timezone.is_aware(dtime):
+            dtime = timezone.localtime(dtime)
+        return dtime.date()
 
     def _format_date(self, date):
         return date.strftime('%Y-%m-%d')
+
+
+ExportFormat = collections.namedtuple('ExportFormat', 'exporter_class extension')
+
+#: Exporters that only format a :class:`~pyconde.schedule.dataset.ScheduleDataset`
+#: by their name. Each of them accepts a ``dataset`` and writes its output
+#: to a binary file object with ``write(fp)``.
+EXPORTERS = collections.OrderedDict([
+    ('guidebook-sessions', ExportFormat(GuidebookExporterSessions, 'csv')),
+    ('guidebook-speakers', ExportFormat(GuidebookExporterSpeakers, 'csv')),
+    ('guidebook-links', ExportFormat(GuidebookExporterLinks, 'csv')),
+    ('episodes', ExportFormat(SessionForEpisodesExporter, 'json')),
+    ('schedule', ExportFormat(XMLExporter, 'xml')),
+    ('pentabarf', ExportFormat(XMLExporterPentabarf, 'xml')),
+    ('frab', ExportFormat(FrabExporter, 'xml')),
+])
+
+
+def get_exporter(name, dataset=None):
+    """
+    Returns the exporter registered as ``name`` for the given dataset.
+    """
+    return EXPORTERS[name].exporter_class(dataset=dataset)
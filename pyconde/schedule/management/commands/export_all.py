@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import exporters
+from ...dataset import load_schedule_dataset
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--out-dir', '-o',
+            action='store',
+            dest='outdir',
+            default='',
+            help='Output directory'),
+        make_option('--format', '-f',
+            action='append',
+            dest='formats',
+            default=None,
+            help='Name of an export format, can be given multiple times. '
+                 'Defaults to all formats: {0}'.format(', '.join(exporters.EXPORTERS))),
+        )
+
+    help = 'Export the schedule in all formats while loading it only once'
+
+    def handle(self, *args, **options):
+        outdir = options['outdir']
+        if not outdir:
+            raise CommandError('expected an output directory')
+        formats = options['formats'] or list(exporters.EXPORTERS)
+        unknown = set(formats) - set(exporters.EXPORTERS)
+        if unknown:
+            raise CommandError('unknown export formats: {0}'.format(', '.join(sorted(unknown))))
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+        dataset = load_schedule_dataset()
+        for name in formats:
+            filename = os.path.join(outdir, '{0}.{1}'.format(
+                name, exporters.EXPORTERS[name].extension))
+            with open(filename, 'wb') as fp:
+                exporters.get_exporter(name, dataset).write(fp)
+            self.stdout.write('Exported {0} to {1}'.format(name, filename))
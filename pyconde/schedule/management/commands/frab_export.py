@@ -1,5 +1,3 @@
-import codecs
-
 from optparse import make_option
 
 from django.core.management.base import BaseCommand
@@ -19,7 +17,7 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         output_file = kwargs.get('outfile')
         if output_file:
-            with codecs.open(output_file, 'w+', encoding='utf-8') as fp:
+            with open(output_file, 'wb') as fp:
                 exporters.FrabExporter(fp)()
         else:
             exporters.FrabExporter()()
@@ -23,4 +23,5 @@ class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
         exporter = exporters.GuidebookExporterSessions()
-        self.stdout.write(exporter().csv)
+        for line in exporter.iter_csv():
+            self.stdout.write(line, ending='')
@@ -22,5 +22,6 @@ class Command(BaseCommand):
     """
 
     def handle(self, *args, **kwargs):
-        exporter = exporters.GuidebookExporterSpeakerLinks()
-        self.stdout.write(exporter().csv)
+        exporter = exporters.GuidebookExporterLinks()
+        for line in exporter.iter_csv():
+            self.stdout.write(line, ending='')
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from ... import attendance
+from ... import models
+
+
+class Command(BaseCommand):
+    help = 'Recounts the attendees of all sessions and fixes the seat counters'
+
+    def handle(self, *args, **options):
+        fixed = models.SeatCounter.objects.reconcile()
+        for session_pk, taken in sorted(fixed.items()):
+            self.stdout.write('Fixed seat counter of session {0} (was {1})'.format(
+                session_pk, 'missing' if taken is None else taken))
+        attendance.invalidate(session_pks=fixed.keys())
+        self.stdout.write('{0} seat counter(s) fixed'.format(len(fixed)))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from ... import embeds
+from ... import models
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--all',
+            action='store_true',
+            dest='all',
+            default=False,
+            help='Also resolve links that have already been resolved'),
+        make_option('--failing',
+            action='store_true',
+            dest='failing',
+            default=False,
+            help='Only list the links that currently fail to resolve'),
+        )
+
+    help = 'Resolves the embed codes of the slides and videos of all sessions ' \
+        'and side events. By default only new links and failed links that ' \
+        'are due for a retry are resolved.'
+
+    def handle(self, *args, **options):
+        if options['failing']:
+            for embed in embeds.get_failing_embeds():
+                self.stdout.write('{0} {1}: {2} failure(s), next retry at {3}'.format(
+                    embed.kind, embed.url, embed.failures, embed.retry_at))
+            return
+        links = set()
+        for kind, field, model in [(models.Embed.KIND_SLIDES, 'slides_url', models.Session),
+                                   (models.Embed.KIND_VIDEO, 'video_url', models.Session),
+                                   (models.Embed.KIND_VIDEO, 'video_url', models.SideEvent)]:
+            urls = model.objects.exclude(**{field: ''}).exclude(**{field + '__isnull': True}) \
+                .values_list(field, flat=True)
+            links.update((kind, url) for url in urls)
+        if not options['all']:
+            links -= set(models.Embed.objects
+                         .exclude(state=models.Embed.STATE_FAILED, retry_at__lte=now())
+                         .values_list('kind', 'url'))
+        for kind, url in sorted(links):
+            embed = embeds.resolve_embed(kind, url)
+            self.stdout.write('{0} {1}: {2}'.format(kind, url, embed.state))
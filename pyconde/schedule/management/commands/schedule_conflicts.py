@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils.encoding import force_text
+
+from ...conflicts import ScheduleConflicts
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--speakers',
+            action='append_const',
+            const='speakers',
+            dest='kinds',
+            help='List double-booked speakers'),
+        make_option('--rooms',
+            action='append_const',
+            const='rooms',
+            dest='kinds',
+            help='List double-booked rooms'),
+        make_option('--attendees',
+            action='append_const',
+            const='attendees',
+            dest='kinds',
+            help='List attendees attending overlapping sessions'),
+        )
+
+    help = 'Lists time conflicts in the schedule of the current conference. ' \
+        'Lists all kinds of conflicts if none is selected.'
+
+    def handle(self, *args, **options):
+        kinds = options['kinds'] or ['speakers', 'rooms', 'attendees']
+        conflicts = ScheduleConflicts()
+        for kind in kinds:
+            if kind == 'speakers':
+                found = conflicts.speaker_conflicts()
+                label = lambda speaker: speaker.display_name
+            elif kind == 'rooms':
+                found = conflicts.room_conflicts()
+                label = lambda location: location.name
+            else:
+                found = conflicts.attendee_conflicts()
+                label = lambda user_pk: 'User {0}'.format(user_pk)
+            self.stdout.write('{0} conflicting {1}'.format(len(found), kind))
+            for conflict in found:
+                self.stdout.write('  {0}: {1} overlaps {2}'.format(
+                    label(conflict.key), _format_event(conflict.first),
+                    _format_event(conflict.second)))
+
+
+def _format_event(evt):
+    return '"{0}" ({1:%Y-%m-%d %H:%M}-{2:%H:%M})'.format(
+        force_text(evt), evt.start, evt.end)
@@ -8,4 +8,6 @@ class Command(BaseCommand):
     help = """Exports proposals with their scores"""
 
     def handle(self, *args, **kwargs):
-        print exporters.SimpleSessionExporter(models.Session.objects.all())().csv
+        exporter = exporters.SimpleSessionExporter(models.Session.objects.all())
+        for line in exporter.iter_csv():
+            self.stdout.write(line, ending='')
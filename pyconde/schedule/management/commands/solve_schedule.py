@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ....conference import models as conference_models
+from ... import models
+from ... import solver
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--section',
+            action='store',
+            dest='section',
+            default=None,
+            help='Only schedule the sessions of the section with this slug'),
+        make_option('--reschedule',
+            action='store_true',
+            dest='reschedule',
+            default=False,
+            help='Also reschedule sessions that have a time but are not released yet'),
+        make_option('--iterations',
+            action='store',
+            dest='iterations',
+            type='int',
+            default=None,
+            help='Number of local search iterations (default: 20 per session)'),
+        make_option('--time-limit',
+            action='store',
+            dest='time_limit',
+            type='float',
+            default=None,
+            help='Stop improving the schedule after this many seconds'),
+        make_option('--seed',
+            action='store',
+            dest='seed',
+            type='int',
+            default=None,
+            help='Seed of the random number generator for reproducible drafts'),
+        )
+
+    help = 'Creates a draft schedule for the unscheduled sessions of the ' \
+        'current conference'
+
+    def handle(self, *args, **options):
+        conference = conference_models.current_conference()
+        sessions = models.Session.objects.filter(conference=conference)
+        if options['section']:
+            try:
+                section = conference.sections.get(slug=options['section'])
+            except conference_models.Section.DoesNotExist:
+                raise CommandError('unknown section: {0}'.format(options['section']))
+            sessions = sessions.filter(section=section)
+        if options['reschedule']:
+            sessions = sessions.filter(released=False)
+        else:
+            sessions = sessions.filter(start__isnull=True)
+        if not sessions.exists():
+            raise CommandError('there are no sessions to schedule')
+        started = time.time()
+        draft = solver.create_draft(sessions, conference,
+                                    iterations=options['iterations'],
+                                    time_limit=options['time_limit'],
+                                    seed=options['seed'])
+        items = draft.items.select_related('session', 'location')
+        placed = [item for item in items if item.start is not None]
+        unplaced = [item for item in items if item.start is None]
+        self.stdout.write('Created draft {0} in {1:.1f}s: {2} session(s) placed, '
+                          '{3} unplaced, cost {4}'.format(
+                              draft.pk, time.time() - started, len(placed),
+                              len(unplaced), draft.cost))
+        for item in unplaced:
+            self.stdout.write('  Could not place "{0}"'.format(item.session.title))
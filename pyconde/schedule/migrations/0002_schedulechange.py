@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0003_auto_20160319_1251'),
+        ('schedule', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleChange',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('event_type', models.CharField(max_length=20, verbose_name='event type', choices=[(b'session', 'Session'), (b'sideevent', 'Side event')])),
+                ('event_id', models.PositiveIntegerField(verbose_name='event ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+                ('conference', models.ForeignKey(verbose_name='conference', to='conference.Conference')),
+            ],
+            options={
+                'verbose_name': 'schedule change',
+                'verbose_name_plural': 'schedule changes',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_seat_counters(apps, schema_editor):
+    Session = apps.get_model('schedule', 'Session')
+    SeatCounter = apps.get_model('schedule', 'SeatCounter')
+    SeatCounter.objects.bulk_create([
+        SeatCounter(session_id=pk, taken=num_attendees)
+        for pk, num_attendees in Session.objects
+        .annotate(num_attendees=models.Count('attendees'))
+        .values_list('pk', 'num_attendees')])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_sessions_attending'),
+        ('schedule', '0002_schedulechange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatCounter',
+            fields=[
+                ('session', models.OneToOneField(related_name='seat_counter', primary_key=True, serialize=False, to='schedule.Session', verbose_name='session')),
+                ('taken', models.PositiveIntegerField(default=0, verbose_name='taken seats')),
+            ],
+            options={
+                'verbose_name': 'seat counter',
+                'verbose_name_plural': 'seat counters',
+            },
+        ),
+        migrations.RunPython(create_seat_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conference', '0004_location_capacity'),
+        ('schedule', '0003_seatcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleDraft',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+                ('cost', models.IntegerField(default=0, verbose_name='cost')),
+                ('applied', models.DateTimeField(null=True, verbose_name='applied', blank=True)),
+                ('conference', models.ForeignKey(verbose_name='conference', to='conference.Conference')),
+            ],
+            options={
+                'ordering': ['-created'],
+                'verbose_name': 'schedule draft',
+                'verbose_name_plural': 'schedule drafts',
+            },
+        ),
+        migrations.CreateModel(
+            name='ScheduleDraftItem',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('start', models.DateTimeField(null=True, verbose_name='start time', blank=True)),
+                ('end', models.DateTimeField(null=True, verbose_name='end time', blank=True)),
+                ('draft', models.ForeignKey(related_name='items', verbose_name='draft', to='schedule.ScheduleDraft')),
+                ('location', models.ForeignKey(verbose_name='location', blank=True, to='conference.Location', null=True)),
+                ('session', models.ForeignKey(verbose_name='session', to='schedule.Session')),
+            ],
+            options={
+                'ordering': ['start', 'location'],
+                'verbose_name': 'schedule draft item',
+                'verbose_name_plural': 'schedule draft items',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0004_scheduledraft'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Embed',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=10, verbose_name='kind', choices=[(b'slides', 'Slides'), (b'video', 'Video')])),
+                ('url', models.URLField(verbose_name='URL')),
+                ('html', models.TextField(verbose_name='embed code', blank=True)),
+                ('resolved', models.DateTimeField(null=True, verbose_name='resolved', blank=True)),
+            ],
+            options={
+                'verbose_name': 'embed',
+                'verbose_name_plural': 'embeds',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='embed',
+            unique_together=set([('kind', 'url')]),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def mark_failed_embeds(apps, schema_editor):
+    Embed = apps.get_model('schedule', 'Embed')
+    Embed.objects.filter(html='').update(state='failed', failures=1,
+                                         retry_at=models.F('resolved'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0005_embed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='embed',
+            name='failures',
+            field=models.PositiveIntegerField(default=0, help_text='Number of failed attempts since the last success', verbose_name='failures'),
+        ),
+        migrations.AddField(
+            model_name='embed',
+            name='retry_at',
+            field=models.DateTimeField(null=True, verbose_name='retry at', blank=True),
+        ),
+        migrations.AddField(
+            model_name='embed',
+            name='state',
+            field=models.CharField(default=b'resolved', max_length=20, verbose_name='state', choices=[(b'resolved', 'resolved'), (b'failed', 'failed'), (b'unsupported', 'unsupported')]),
+        ),
+        migrations.RunPython(mark_failed_embeds, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,12 @@
 import logging
 
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from markup_deprecated.templatetags.markup import markdown
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.db.models import Q, signals as model_signals
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max, Q, signals as model_signals
 from django.utils.encoding import force_text
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
@@ -13,10 +14,13 @@ from django.utils.timezone import now
 
 from cms.models import CMSPlugin
 from sortedm2m.fields import SortedManyToManyField
+from taggit.models import TaggedItem
 
+from ..accounts import models as account_models
 from ..proposals import models as proposal_models
 from ..reviews import models as review_models
 from ..conference import models as conference_models
+from ..speakers import models as speaker_models
 
 from .exceptions import AttendingError
 
@@ -119,18 +123,16 @@ class Session(LocationMixin, proposal_models.AbstractProposal):
         return reverse('session', kwargs={'session_pk': self.pk})
 
     def can_attend(self, user):
-        other = Session.objects.filter(attendees=user).exclude(id=self.pk)
-        q_overlap = (
-            Q(start__range=(self.start, self.end)) |
-            Q(end__range=(self.start, self.end))
-        )
-        other = other.filter(q_overlap)
-        return not other.exists()
+        """
+        Returns False if the user attends another session overlapping this
+        one.
+        """
+        from . import attendance
+        return not attendance.get_attendance(user).overlaps(self)
 
     def is_attending(self, user):
-        if user.pk:
-            return self.attendees.filter(id=user.id).exists()
-        return False
+        from . import attendance
+        return attendance.get_attendance(user).is_attending(self)
 
     def attend(self, user):
         if self.kind.slug not in settings.SCHEDULE_ATTENDING_POSSIBLE:
@@ -143,12 +145,21 @@ class Session(LocationMixin, proposal_models.AbstractProposal):
                 raise AttendingError(_('You cannot attend this session anymore. The session already ended.'))
             else:
                 raise AttendingError(_('You cannot attend this session anymore. The session already started.'))
-        elif not self.has_free_seats():
-            raise AttendingError(_('You cannot attend right now. There are no free seats left.'))
-        elif not self.can_attend(user):
+        if self.is_attending(user):
+            return
+        if not self.can_attend(user):
             raise AttendingError(_('You cannot attend this session because you are already attending another one at that time.'))
-        else:
-            self.attendees.add(user.id)
+        try:
+            with transaction.atomic():
+                if not SeatCounter.objects.reserve(self):
+                    raise AttendingError(_('You cannot attend right now. There are no free seats left.'))
+                # The seat is already counted, so the attendance is stored
+                # without going through the relation's signals.
+                Attendee.objects.create(user_id=user.id, session_id=self.pk)
+        except IntegrityError:
+            # A concurrent request of the same user won.
+            LOG.info("%s is already attending %s", user, self)
+        _attendance_changed([user.id], [self.pk])
 
     def leave(self, user):
         current_time = now()
@@ -157,13 +168,20 @@ class Session(LocationMixin, proposal_models.AbstractProposal):
                 raise AttendingError(_('You cannot leave this session anymore. The session already ended.'))
             else:
                 raise AttendingError(_('You cannot leave this session anymore. The session already started.'))
-        else:
-            self.attendees.remove(user.id)
+        with transaction.atomic():
+            # Locking the counter serializes concurrent leaves of a session.
+            list(SeatCounter.objects.select_for_update().filter(session=self))
+            attendees = Attendee.objects.filter(user=user.id, session=self.pk)
+            if attendees.exists():
+                attendees.delete()
+                SeatCounter.objects.release(self)
+        _attendance_changed([user.id], [self.pk])
 
     def has_free_seats(self):
+        from . import attendance
         if self.max_attendees in (None, 0):
             return True
-        return self.attendees.count() < self.max_attendees
+        return attendance.get_seat_count(self) < self.max_attendees
 
     class Meta(object):
         verbose_name = _('session')
@@ -238,24 +256,407 @@ class CompleteSchedulePlugin(CMSPlugin):
         self.sections = oldinstance.sections.all()
 
 
-def clear_schedule_caches(sender, *args, **kwargs):
+class ScheduleChangeManager(models.Manager):
+
+    def prune(self, cutoff):
+        """
+        Deletes the entries created before ``cutoff`` except for the latest
+        entry of every event. Delta syncs since any version still return
+        the same events, as an event's latest entry is never older than the
+        ones that are deleted.
+        """
+        latest = list(self.values('conference', 'event_type', 'event_id')
+                      .annotate(latest=Max('pk')).values_list('latest', flat=True))
+        return self.filter(created__lt=cutoff).exclude(pk__in=latest).delete()
+
+
+class ScheduleChange(models.Model):
+    """
+    Every change of a session or side event is logged with an entry. The
+    primary key of the latest entry is used as version of the schedule for
+    clients that only want to fetch the events changed since their last
+    sync.
+    """
+    EVENT_TYPE_SESSION = 'session'
+    EVENT_TYPE_SIDEEVENT = 'sideevent'
+    EVENT_TYPE_CHOICES = (
+        (EVENT_TYPE_SESSION, _('Session')),
+        (EVENT_TYPE_SIDEEVENT, _('Side event')),
+    )
+
+    conference = models.ForeignKey(conference_models.Conference,
+        verbose_name=_("conference"))
+    event_type = models.CharField(_("event type"), max_length=20,
+        choices=EVENT_TYPE_CHOICES)
+    event_id = models.PositiveIntegerField(_("event ID"))
+    created = models.DateTimeField(_("created"), default=now)
+
+    objects = ScheduleChangeManager()
+
+    class Meta(object):
+        verbose_name = _('schedule change')
+        verbose_name_plural = _('schedule changes')
+
+
+class SeatCounterManager(models.Manager):
+
+    def reserve(self, session):
+        """
+        Takes a seat of the given session if there is one left and returns
+        whether that was possible. The counter is checked and incremented
+        by a single UPDATE, so concurrent reservations cannot overbook.
+        """
+        free = Q(session__max_attendees__isnull=True) | Q(session__max_attendees=0) | \
+            Q(taken__lt=F('session__max_attendees'))
+        reserved = self.filter(free, session=session).update(taken=F('taken') + 1)
+        if not reserved and not self.filter(session=session).exists():
+            self.reconcile([session.pk])
+            return self.reserve(session)
+        return bool(reserved)
+
+    def release(self, session, seats=1):
+        if not self.filter(session=session, taken__gte=seats).update(taken=F('taken') - seats):
+            self.filter(session=session).update(taken=0)
+
+    def reconcile(self, session_pks=None):
+        """
+        Recounts the attendees of the given (or all) sessions and fixes
+        the counters that are off. Returns a dictionary mapping the
+        affected session ids to their former counts (``None`` if there was
+        no counter yet).
+        """
+        sessions = Session.objects.all()
+        if session_pks is not None:
+            sessions = sessions.filter(pk__in=session_pks)
+        actual = dict(sessions.annotate(num_attendees=models.Count('attendees'))
+                      .values_list('pk', 'num_attendees'))
+        stored = dict(self.filter(session__in=actual.keys()).values_list('session', 'taken'))
+        fixed = {}
+        for session_pk, num_attendees in actual.items():
+            if session_pk not in stored:
+                _, created = self.get_or_create(session_id=session_pk,
+                                                defaults={'taken': num_attendees})
+                if created:
+                    fixed[session_pk] = None
+            elif stored[session_pk] != num_attendees:
+                self.filter(session=session_pk).update(taken=num_attendees)
+                fixed[session_pk] = stored[session_pk]
+        return fixed
+
+
+class SeatCounter(models.Model):
+    """
+    Number of attendees of a session, maintained by
+    :meth:`Session.attend` and :meth:`Session.leave`. The attendees
+    relation stays the source of truth; counters can be fixed using the
+    ``reconcile_seats`` management command.
+    """
+    session = models.OneToOneField(Session, primary_key=True,
+        related_name='seat_counter', verbose_name=_('session'))
+    taken = models.PositiveIntegerField(_('taken seats'), default=0)
+
+    objects = SeatCounterManager()
+
+    class Meta(object):
+        verbose_name = _('seat counter')
+        verbose_name_plural = _('seat counters')
+
+
+class Embed(models.Model):
+    """
+    The embed code of slides or a video as resolved in the background by
+    :func:`pyconde.schedule.embeds.resolve_embed`. Links that could not be
+    resolved are retried with an exponential backoff, links no service
+    supports are never retried.
+    """
+    KIND_SLIDES = 'slides'
+    KIND_VIDEO = 'video'
+    KIND_CHOICES = (
+        (KIND_SLIDES, _('Slides')),
+        (KIND_VIDEO, _('Video')),
+    )
+
+    STATE_RESOLVED = 'resolved'
+    STATE_FAILED = 'failed'
+    STATE_UNSUPPORTED = 'unsupported'
+    STATE_CHOICES = (
+        (STATE_RESOLVED, _('resolved')),
+        (STATE_FAILED, _('failed')),
+        (STATE_UNSUPPORTED, _('unsupported')),
+    )
+
+    kind = models.CharField(_('kind'), max_length=10, choices=KIND_CHOICES)
+    url = models.URLField(_('URL'))
+    html = models.TextField(_('embed code'), blank=True)
+    state = models.CharField(_('state'), max_length=20, choices=STATE_CHOICES,
+        default=STATE_RESOLVED)
+    failures = models.PositiveIntegerField(_('failures'), default=0,
+        help_text=_('Number of failed attempts since the last success'))
+    resolved = models.DateTimeField(_('resolved'), null=True, blank=True)
+    retry_at = models.DateTimeField(_('retry at'), null=True, blank=True)
+
+    class Meta(object):
+        unique_together = (('kind', 'url'),)
+        verbose_name = _('embed')
+        verbose_name_plural = _('embeds')
+
+    def __unicode__(self):
+        return self.url
+
+
+class ScheduleDraft(models.Model):
+    """
+    A schedule proposed by the solver (see :mod:`pyconde.schedule.solver`)
+    that planners can review before applying it to the sessions.
+    """
+    conference = models.ForeignKey(conference_models.Conference,
+        verbose_name=_('conference'))
+    created = models.DateTimeField(_('created'), default=now)
+    cost = models.IntegerField(_('cost'), default=0)
+    applied = models.DateTimeField(_('applied'), null=True, blank=True)
+
+    class Meta(object):
+        ordering = ['-created']
+        verbose_name = _('schedule draft')
+        verbose_name_plural = _('schedule drafts')
+
+    def __unicode__(self):
+        return _('Schedule draft of %(created)s') % {'created': self.created}
+
+    def apply(self):
+        """
+        Moves the sessions to the rooms and times of this draft. Sessions
+        that could not be placed are left unchanged.
+        """
+        with transaction.atomic():
+            for item in self.items.filter(start__isnull=False).select_related('session'):
+                session = item.session
+                session.start = item.start
+                session.end = item.end
+                session.save()
+                session.location = [item.location_id]
+            self.applied = now()
+            self.save()
+
+
+class ScheduleDraftItem(models.Model):
+    """
+    The place of a session in a draft. Sessions the solver could not place
+    have no location and times.
+    """
+    draft = models.ForeignKey(ScheduleDraft, related_name='items',
+        verbose_name=_('draft'))
+    session = models.ForeignKey(Session, verbose_name=_('session'))
+    location = models.ForeignKey(conference_models.Location, null=True,
+        blank=True, verbose_name=_('location'))
+    start = models.DateTimeField(_('start time'), null=True, blank=True)
+    end = models.DateTimeField(_('end time'), null=True, blank=True)
+
+    class Meta(object):
+        ordering = ['start', 'location']
+        verbose_name = _('schedule draft item')
+        verbose_name_plural = _('schedule draft items')
+
+
+#: Fields of sessions and side events that have an effect on the schedule
+SCHEDULE_FIELDS = frozenset([
+    'title', 'name', 'start', 'end', 'section', 'released', 'is_global',
+    'is_pause', 'icon', 'language', 'speaker', 'kind', 'track',
+    'audience_level', 'location', 'additional_speakers',
+])
+
+
+#: Fields of users and speakers that are shown for the speakers of sessions
+SPEAKER_FIELDS = frozenset([
+    'user', 'username', 'email', 'first_name', 'last_name', 'display_name',
+    'short_info', 'avatar',
+])
+
+
+def clear_schedule_caches(sender, instance=None, *args, **kwargs):
     from itertools import product
-    # We have to clear the cache for every section of the current conference as
-    # well as the global cache itself.
+    from . import utils
+    # Detail pages also show fields that don't affect the schedule itself.
+    utils.bump_schedule_version()
     conf = conference_models.current_conference()
-    cache_keys = [
-        'schedule:guidebook:events'
-    ]
+    cache_keys = []
+    update_fields = kwargs.get('update_fields')
     section_ids = list(conf.sections.values_list('id', flat=True)) + ['__merged__']
+    if instance is None:
+        changed_sections = section_ids
+        cache_keys.extend('section_cells:{0}'.format(sec) for sec in section_ids)
+    elif update_fields is not None and not SCHEDULE_FIELDS.intersection(update_fields):
+        changed_sections = []
+    else:
+        # Only the sections (and days within them) whose interval model
+        # actually changed have to be rebuilt.
+        changed_sections = utils.update_section_cells(instance,
+            removed=kwargs.get('signal') is model_signals.post_delete)
     durations = dict(CompleteSchedulePlugin.ROW_DURATION_CHOICES).keys()
-    prod = product(section_ids, durations)
-    for sec, dur in prod:
-        cache_keys.append('schedule:{0}:{1}'.format(conf.pk, dur))
+    for sec, dur in product(changed_sections, durations):
+        if sec == '__merged__':
+            cache_keys.append('schedule:{0}:{1}:merged'.format(conf.pk, dur))
+        else:
+            cache_keys.append('schedule:{0}:{1}'.format(conf.pk, dur))
         cache_keys.append('section_schedule:{0}:{1}'.format(sec, dur))
     LOG.debug("Clearing following cache keys: " + unicode(cache_keys))
     cache.delete_many(cache_keys)
+    if changed_sections:
+        utils.request_schedule_snapshot()
+
+
+def clear_schedule_caches_for_relation(sender, instance, action, reverse, *args, **kwargs):
+    """
+    Locations and speakers are stored after the event itself has been saved
+    and therefor also have to update the cached schedule.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        instance = None
+    clear_schedule_caches(sender, instance)
+
+
+def bump_schedule_version(sender, *args, **kwargs):
+    """
+    Changes of related data that is only shown on the session pages and
+    listings have to change the content version of the schedule as well.
+    """
+    from . import utils
+    if sender is TaggedItem and kwargs.get('instance') is not None:
+        if kwargs['instance'].content_type_id != ContentType.objects.get_for_model(Session).pk:
+            return
+    utils.bump_schedule_version()
+
+
+def clear_schedule_caches_for_speaker(sender, instance, created=False, raw=False,
+                                      update_fields=None, **kwargs):
+    """
+    Speakers are shown on the schedule, the session pages and the exports,
+    so changing them has to update the sessions they speak at. Saves that
+    don't touch any of the shown fields (e.g. logging in) are ignored.
+    """
+    if created or raw:
+        return
+    if update_fields is not None and not SPEAKER_FIELDS.intersection(update_fields):
+        return
+    user_pk = instance.user_id if sender is speaker_models.Speaker else instance.pk
+    sessions = Session.objects.filter(Q(speaker__user=user_pk) |
+                                      Q(additional_speakers__user=user_pk)).distinct()
+    for session in sessions:
+        clear_schedule_caches(Session, session)
+        record_schedule_change(Session, session)
+
+
+def record_schedule_change(sender, instance, *args, **kwargs):
+    """
+    Logs changes of sessions and side events (including their locations
+    and speakers) for the delta sync of the schedule API.
+    """
+    action = kwargs.get('action')
+    event_model = type(instance)
+    events = [(instance.pk, instance.conference_id)]
+    if action is not None:
+        if action not in ('post_add', 'post_remove'):
+            return
+        if kwargs['reverse']:
+            event_model = kwargs['model']
+            events = event_model.objects.filter(pk__in=kwargs['pk_set']) \
+                .values_list('pk', 'conference_id')
+    event_type = ScheduleChange.EVENT_TYPE_SESSION if issubclass(event_model, Session) \
+        else ScheduleChange.EVENT_TYPE_SIDEEVENT
+    ScheduleChange.objects.bulk_create([
+        ScheduleChange(conference_id=conference_id, event_type=event_type, event_id=event_id)
+        for event_id, conference_id in events if conference_id is not None])
+
+
+#: The relation between sessions and their attendees
+Attendee = account_models.User.sessions_attending.through
+
+
+def _attendance_changed(user_pks, session_pks):
+    from . import attendance
+    from . import utils
+    attendance.invalidate(user_pks=user_pks, session_pks=session_pks)
+    utils.bump_schedule_version()
+
+
+def request_embeds(sender, instance, update_fields=None, **kwargs):
+    """
+    Links to slides and videos that haven't been resolved yet are resolved
+    in the background.
+    """
+    from . import embeds
+    links = [(Embed.KIND_SLIDES, 'slides_url'), (Embed.KIND_VIDEO, 'video_url')]
+    for kind, field in links:
+        if update_fields is not None and field not in update_fields:
+            continue
+        url = getattr(instance, field, None)
+        if url and not Embed.objects.filter(kind=kind, url=url).exists():
+            embeds.request_embed(kind, url)
+
+
+def clear_attendees_caches(sender, instance, update_fields=None, **kwargs):
+    """
+    The cached attendances include the times of the attended sessions.
+    """
+    from . import attendance
+    if update_fields is not None and not {'start', 'end'}.intersection(update_fields):
+        return
+    attendance.invalidate(user_pks=Attendee.objects.filter(session=instance.pk)
+                          .values_list('user', flat=True))
+
+
+def update_attendance(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Keeps the seat counters and cached attendances up to date if
+    attendances are changed outside of :meth:`Session.attend` and
+    :meth:`Session.leave` (e.g. in the admin).
+    """
+    if action == 'pre_clear':
+        # The related objects are not known anymore once they are removed.
+        if reverse:
+            pk_set = set(instance.attendees.values_list('pk', flat=True))
+        else:
+            pk_set = set(instance.sessions_attending.values_list('pk', flat=True))
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+    if reverse:
+        user_pks, session_pks = pk_set, [instance.pk]
+    else:
+        user_pks, session_pks = [instance.pk], pk_set
+    seats = len(user_pks)
+    if action == 'post_add':
+        SeatCounter.objects.filter(session__in=session_pks).update(taken=F('taken') + seats)
+    else:
+        for session_pk in session_pks:
+            SeatCounter.objects.release(session_pk, seats)
+    _attendance_changed(user_pks, session_pks)
+
 
 model_signals.post_save.connect(clear_schedule_caches, sender=SideEvent)
 model_signals.post_save.connect(clear_schedule_caches, sender=Session)
 model_signals.post_delete.connect(clear_schedule_caches, sender=SideEvent)
 model_signals.post_delete.connect(clear_schedule_caches, sender=Session)
+model_signals.m2m_changed.connect(clear_schedule_caches_for_relation, sender=SideEvent.location.through)
+model_signals.m2m_changed.connect(clear_schedule_caches_for_relation, sender=Session.location.through)
+model_signals.m2m_changed.connect(clear_schedule_caches_for_relation, sender=Session.additional_speakers.through)
+
+for sender in (Session, SideEvent):
+    model_signals.post_save.connect(record_schedule_change, sender=sender)
+    model_signals.post_delete.connect(record_schedule_change, sender=sender)
+for sender in (Session.location.through, SideEvent.location.through, Session.additional_speakers.through):
+    model_signals.m2m_changed.connect(record_schedule_change, sender=sender)
+
+for sender in (conference_models.Location, conference_models.SessionKind, TaggedItem):
+    model_signals.post_save.connect(bump_schedule_version, sender=sender)
+    model_signals.post_delete.connect(bump_schedule_version, sender=sender)
+model_signals.m2m_changed.connect(bump_schedule_version, sender=SideEvent.lightning_talks.through)
+for sender in (account_models.User, speaker_models.Speaker):
+    model_signals.post_save.connect(clear_schedule_caches_for_speaker, sender=sender)
+model_signals.m2m_changed.connect(update_attendance, sender=Attendee)
+model_signals.post_save.connect(request_embeds, sender=Session)
+model_signals.post_save.connect(request_embeds, sender=SideEvent)
+model_signals.post_save.connect(clear_attendees_caches, sender=Session)
@@ -5,13 +5,14 @@ SpeakerDeck and provides functionality to extract embed-code from a document's
 perma-link.
 """
 
-import requests
 from bs4 import BeautifulSoup
 import urllib
 import re
 import abc
 import logging
 
+from ..helpers import http
+
 
 LOG = logging.getLogger(__name__)
 RE_PREZI_URL = re.compile(r'^http://prezi.com/([a-zA-z0-9]+)/.*/$')
@@ -47,7 +48,7 @@ class AbstractOEmbedEnabledService(AbstractSlideService):
 
     def generate_embed_code(self, link):
         oembed_url = self.get_oembed_url(link)
-        return requests.get(oembed_url).json()['html']
+        return http.get(oembed_url).json()['html']
 
 
 class SlideShareService(AbstractOEmbedEnabledService):
@@ -92,7 +93,7 @@ class SpeakerDeckService(AbstractSlideService):
         way by parsing the actual website.
         """
         if doc is None:
-            doc = requests.get(link).text
+            doc = http.get(link).text
         soup = BeautifulSoup(doc)
         container = soup.find('section', {'id': 'presentation'})
         if container is None:
@@ -128,6 +129,10 @@ class PreziService(AbstractSlideService):
 _SERVICES = [SlideShareService(), SpeakerDeckService(), SpeakerDeckOEmbedService(), PreziService()]
 
 
+def is_supported(link):
+    return any(service.matches_link(link) for service in _SERVICES)
+
+
 def generate_embed_code(link):
     for service in _SERVICES:
         if service.matches_link(link):
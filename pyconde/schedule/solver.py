@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Heuristic solver creating draft schedules.
+
+Sessions are placed one after another (the most constrained ones first) in
+the room and at the time where they cost the least. The result is then
+improved by a local search that repeatedly takes a session out and puts it
+back at its best position, and that tries to make room for sessions that
+could not be placed by moving the sessions blocking them.
+
+Hard constraints are never violated:
+
+* sessions only take place in the timeslots selected in their proposal
+  (or in any timeslot of their section if none were selected)
+* speakers hold only one session at a time
+* rooms host only one event at a time and have enough seats for the
+  maximum number of attendees of a session
+
+Soft constraints are that sessions of a track should be held in the same
+room during a day and that sessions should start as early as possible
+within a timeslot, so that the free time is kept together.
+
+The solver itself only works on plain data. :func:`create_draft` loads
+the sessions from the database and stores the result as a
+:class:`~pyconde.schedule.models.ScheduleDraft` for the planners to review.
+"""
+from __future__ import unicode_literals
+
+import collections
+import datetime
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from ..conference import models as conference_models
+from . import models
+
+
+LOG = logging.getLogger(__name__)
+
+Room = collections.namedtuple('Room', 'pk capacity')
+
+#: A continuous time span sessions can be scheduled in, i.e. a timeslot
+#: (see :class:`pyconde.proposals.models.TimeSlot`) of a day
+Period = collections.namedtuple('Period', 'date slot start end')
+
+#: A session to be scheduled. ``periods`` are the indices of the periods
+#: it may be scheduled in.
+Task = collections.namedtuple('Task',
+    'pk minutes speakers track max_attendees periods')
+
+Placement = collections.namedtuple('Placement', 'room start end')
+
+Solution = collections.namedtuple('Solution', 'placements unplaced cost')
+
+#: Marks units of rooms and speakers that are occupied by events which are
+#: not scheduled by the solver
+FIXED = object()
+
+UNPLACED_WEIGHT = 10000
+
+
+class ScheduleSolver(object):
+    """
+    Time is measured in units of ``granularity`` minutes since the start of
+    the first period, so that occupied rooms and speakers can be kept in
+    dictionaries keyed by their unit.
+
+    @param busy_rooms (room pk, start, end) tuples of events that are
+        already scheduled. A room pk of ``None`` blocks all rooms.
+    @param busy_speakers (speaker pk, start, end) tuples of sessions that
+        are already scheduled
+    @param track_weight cost of holding sessions of a track in an
+        additional room during a day, in units of time the start of a
+        session could be moved instead
+    """
+
+    def __init__(self, tasks, rooms, periods, busy_rooms=(), busy_speakers=(),
+                 granularity=15, track_weight=20, seed=None):
+        self.tasks = dict((task.pk, task) for task in tasks)
+        self.rooms = list(rooms)
+        self.periods = list(periods)
+        self.granularity = granularity
+        self.track_weight = track_weight
+        self.random = random.Random(seed)
+        self.origin = min(period.start for period in self.periods) \
+            if self.periods else datetime.datetime.min
+        self.room_units = {}
+        self.speaker_units = {}
+        self.placements = {}
+        self.track_rooms = collections.defaultdict(collections.Counter)
+        for room_pk, start, end in busy_rooms:
+            room_pks = [room.pk for room in self.rooms] if room_pk is None else [room_pk]
+            for unit in self._units(start, end):
+                for pk in room_pks:
+                    self.room_units[pk, unit] = FIXED
+        for speaker_pk, start, end in busy_speakers:
+            for unit in self._units(start, end):
+                self.speaker_units[speaker_pk, unit] = FIXED
+        self.period_starts = [self._to_unit(period.start, round_up=True)
+                              for period in self.periods]
+        self.lengths = dict((task.pk, -(-task.minutes // granularity)) for task in tasks)
+        self.candidates = dict((task.pk, self._get_candidates(task)) for task in tasks)
+
+    def _to_unit(self, value, round_up=False):
+        minutes, seconds = divmod(int((value - self.origin).total_seconds()), 60)
+        if round_up and seconds:
+            minutes += 1
+        units, rest = divmod(minutes, self.granularity)
+        if round_up and rest:
+            units += 1
+        return units
+
+    def _units(self, start, end):
+        return range(self._to_unit(start), self._to_unit(end, round_up=True))
+
+    def _get_candidates(self, task):
+        """
+        Returns all (room pk, start unit, period index) tuples the task
+        could be placed at if nothing else was scheduled.
+        """
+        length = self.lengths[task.pk]
+        rooms = [room for room in self.rooms
+                 if not task.max_attendees or room.capacity is None or
+                 room.capacity >= task.max_attendees]
+        candidates = []
+        for idx in task.periods:
+            period = self.periods[idx]
+            first = self.period_starts[idx]
+            last = self._to_unit(period.end) - length
+            for start in range(first, last + 1):
+                candidates.extend((room.pk, start, idx) for room in rooms)
+        return candidates
+
+    def _is_free(self, task, room_pk, start):
+        room_units = self.room_units
+        speaker_units = self.speaker_units
+        for unit in range(start, start + self.lengths[task.pk]):
+            if (room_pk, unit) in room_units:
+                return False
+            for speaker in task.speakers:
+                if (speaker, unit) in speaker_units:
+                    return False
+        return True
+
+    def _cost(self, task, room_pk, start, idx):
+        cost = start - self.period_starts[idx]
+        if task.track is not None:
+            rooms = self.track_rooms[task.track, self.periods[idx].date]
+            if not rooms[room_pk] and any(rooms.values()):
+                cost += self.track_weight
+        return cost
+
+    def _place(self, task, room_pk, start, idx):
+        for unit in range(start, start + self.lengths[task.pk]):
+            self.room_units[room_pk, unit] = task.pk
+            for speaker in task.speakers:
+                self.speaker_units[speaker, unit] = task.pk
+        if task.track is not None:
+            self.track_rooms[task.track, self.periods[idx].date][room_pk] += 1
+        self.placements[task.pk] = (room_pk, start, idx)
+
+    def _remove(self, task):
+        room_pk, start, idx = self.placements.pop(task.pk)
+        for unit in range(start, start + self.lengths[task.pk]):
+            del self.room_units[room_pk, unit]
+            for speaker in task.speakers:
+                del self.speaker_units[speaker, unit]
+        if task.track is not None:
+            self.track_rooms[task.track, self.periods[idx].date][room_pk] -= 1
+        return room_pk, start, idx
+
+    def _place_best(self, task):
+        """
+        Places the task where it costs the least. Returns False if there is
+        no free place left.
+        """
+        best = best_cost = None
+        candidates = self.candidates[task.pk]
+        offset = self.random.randrange(len(candidates)) if candidates else 0
+        # Starting at a random candidate breaks ties randomly.
+        for candidate in candidates[offset:] + candidates[:offset]:
+            room_pk, start, idx = candidate
+            if not self._is_free(task, room_pk, start):
+                continue
+            cost = self._cost(task, room_pk, start, idx)
+            if best is None or cost < best_cost:
+                best, best_cost = candidate, cost
+        if best is None:
+            return False
+        self._place(task, *best)
+        return True
+
+    def _blockers(self, task, room_pk, start):
+        """
+        Returns the pks of the tasks that have to be moved to place the
+        task at the given position or None if a fixed event is in the way.
+        """
+        blockers = set()
+        for unit in range(start, start + self.lengths[task.pk]):
+            owners = [self.room_units.get((room_pk, unit))]
+            owners.extend(self.speaker_units.get((speaker, unit))
+                          for speaker in task.speakers)
+            for owner in owners:
+                if owner is FIXED:
+                    return None
+                if owner is not None:
+                    blockers.add(owner)
+        return blockers
+
+    def _make_room(self, task):
+        """
+        Tries to place an unplaced task by moving the tasks blocking one of
+        its candidates elsewhere. Everything is reverted if that fails.
+        """
+        candidates = self.candidates[task.pk]
+        if not candidates:
+            return False
+        room_pk, start, idx = self.random.choice(candidates)
+        blockers = self._blockers(task, room_pk, start)
+        if blockers is None:
+            return False
+        previous = dict((pk, self._remove(self.tasks[pk])) for pk in blockers)
+        self._place(task, room_pk, start, idx)
+        moved = []
+        for pk in blockers:
+            if not self._place_best(self.tasks[pk]):
+                break
+            moved.append(pk)
+        else:
+            return True
+        for pk in moved:
+            self._remove(self.tasks[pk])
+        self._remove(task)
+        for pk, placement in previous.items():
+            self._place(self.tasks[pk], *placement)
+        return False
+
+    def cost(self):
+        cost = sum(start - self.period_starts[idx]
+                   for room_pk, start, idx in self.placements.values())
+        cost += self.track_weight * sum(
+            max(len([room for room, count in rooms.items() if count]) - 1, 0)
+            for rooms in self.track_rooms.values())
+        cost += UNPLACED_WEIGHT * (len(self.tasks) - len(self.placements))
+        return cost
+
+    def solve(self, iterations=None, time_limit=None):
+        """
+        Places all tasks and improves the placement for the given number of
+        iterations (defaults to 20 per task) or seconds.
+        """
+        if iterations is None:
+            iterations = 20 * len(self.tasks)
+        started = time.time()
+        # The sessions with the fewest options are placed first.
+        for task in sorted(self.tasks.values(), key=lambda task: (
+                len(self.candidates[task.pk]) // max(self.lengths[task.pk], 1), task.pk)):
+            if task.pk not in self.placements:
+                self._place_best(task)
+        LOG.debug("Initial schedule costs %d", self.cost())
+        for iteration in range(iterations):
+            if time_limit is not None and time.time() - started > time_limit:
+                break
+            unplaced = [pk for pk in self.tasks if pk not in self.placements]
+            if unplaced and self.random.random() < 0.5:
+                self._make_room(self.tasks[self.random.choice(unplaced)])
+            elif self.placements:
+                task = self.tasks[self.random.choice(list(self.placements))]
+                self._remove(task)
+                self._place_best(task)
+        LOG.debug("Improved schedule costs %d after %d iteration(s)",
+                  self.cost(), iteration + 1 if iterations else 0)
+        return self.solution()
+
+    def solution(self):
+        placements = {}
+        for pk, (room_pk, start, idx) in self.placements.items():
+            start = self.origin + datetime.timedelta(minutes=start * self.granularity)
+            placements[pk] = Placement(room_pk, start,
+                start + datetime.timedelta(minutes=self.tasks[pk].minutes))
+        unplaced = sorted(pk for pk in self.tasks if pk not in self.placements)
+        return Solution(placements, unplaced, self.cost())
+
+
+def _parse_time(value):
+    return datetime.datetime.strptime(value, '%H:%M').time()
+
+
+def _get_days(section, conference):
+    start = section.start_date if section and section.start_date else conference.start_date
+    end = section.end_date if section and section.end_date else conference.end_date
+    if start is None or end is None:
+        return []
+    return [start + datetime.timedelta(days=offset)
+            for offset in range((end - start).days + 1)]
+
+
+def create_solver(sessions, conference=None, **kwargs):
+    """
+    Creates a solver for the given sessions of the given (or the current)
+    conference. All other scheduled sessions and side events of the
+    conference stay where they are.
+    """
+    if conference is None:
+        conference = conference_models.current_conference()
+    slot_times = dict((int(slot), (_parse_time(start), _parse_time(end)))
+                      for slot, (start, end) in settings.SCHEDULE_SOLVER_TIMESLOTS.items())
+    sessions = list(sessions.select_related('duration', 'section')
+                    .prefetch_related('additional_speakers', 'available_timeslots'))
+    periods = []
+    period_indices = {}
+
+    def _get_period(date, slot):
+        if (date, slot) not in period_indices:
+            start, end = slot_times[slot]
+            period_indices[date, slot] = len(periods)
+            periods.append(Period(date, slot, datetime.datetime.combine(date, start),
+                                  datetime.datetime.combine(date, end)))
+        return period_indices[date, slot]
+
+    tasks = []
+    for session in sessions:
+        timeslots = [(ts.date, ts.slot) for ts in session.available_timeslots.all()
+                     if ts.slot in slot_times]
+        if not timeslots:
+            timeslots = [(day, slot) for day in _get_days(session.section, conference)
+                         for slot in sorted(slot_times)]
+        speakers = set(speaker.pk for speaker in session.additional_speakers.all())
+        if session.speaker_id is not None:
+            speakers.add(session.speaker_id)
+        tasks.append(Task(pk=session.pk,
+                          minutes=session.duration.minutes,
+                          speakers=frozenset(speakers),
+                          track=session.track_id,
+                          max_attendees=session.max_attendees,
+                          periods=tuple(sorted(set(_get_period(date, slot)
+                                                   for date, slot in timeslots)))))
+
+    rooms = [Room(loc.pk, loc.capacity) for loc in conference_models.Location.objects
+             .filter(conference=conference, used_for_sessions=True)]
+    busy_rooms = []
+    busy_speakers = []
+    fixed_sessions = models.Session.objects \
+        .filter(conference=conference, start__isnull=False, end__isnull=False) \
+        .exclude(pk__in=[session.pk for session in sessions]) \
+        .prefetch_related('location', 'additional_speakers')
+    for session in fixed_sessions:
+        busy_rooms.extend((loc.pk, session.start, session.end)
+                          for loc in session.location.all())
+        speakers = [session.speaker_id] + [speaker.pk for speaker
+                                           in session.additional_speakers.all()]
+        busy_speakers.extend((pk, session.start, session.end) for pk in speakers
+                             if pk is not None)
+    for evt in models.SideEvent.objects \
+            .filter(conference=conference, start__isnull=False, end__isnull=False) \
+            .prefetch_related('location'):
+        if evt.is_global:
+            busy_rooms.append((None, evt.start, evt.end))
+        else:
+            busy_rooms.extend((loc.pk, evt.start, evt.end) for loc in evt.location.all())
+    kwargs.setdefault('granularity', settings.SCHEDULE_SOLVER_GRANULARITY)
+    return ScheduleSolver(tasks, rooms, periods, busy_rooms, busy_speakers, **kwargs)
+
+
+def create_draft(sessions, conference=None, iterations=None, time_limit=None,
+                 seed=None):
+    """
+    Schedules the given sessions and stores the result as a new draft.
+    """
+    if conference is None:
+        conference = conference_models.current_conference()
+    solver = create_solver(sessions, conference, seed=seed)
+    solution = solver.solve(iterations=iterations, time_limit=time_limit)
+    with transaction.atomic():
+        draft = models.ScheduleDraft.objects.create(conference=conference,
+                                                    cost=solution.cost)
+        items = [models.ScheduleDraftItem(draft=draft, session_id=pk,
+                                          location_id=placement.room,
+                                          start=placement.start,
+                                          end=placement.end)
+                 for pk, placement in solution.placements.items()]
+        items.extend(models.ScheduleDraftItem(draft=draft, session_id=pk)
+                     for pk in solution.unplaced)
+        models.ScheduleDraftItem.objects.bulk_create(items)
+    return draft
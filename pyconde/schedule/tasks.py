@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.conf import settings
+from django.utils.timezone import now
+
+from pyconde.celery import app
+
+
+@app.task(ignore_result=True)
+def build_schedule_snapshot():
+    from .utils import build_schedule_snapshot as build_snapshot
+
+    build_snapshot()
+
+
+@app.task(ignore_result=True)
+def resolve_embed(kind, url):
+    from .embeds import resolve_embed as resolve
+
+    resolve(kind, url)
+
+
+@app.task(ignore_result=True)
+def prune_schedule_changes():
+    from .models import ScheduleChange
+
+    ScheduleChange.objects.prune(
+        now() - datetime.timedelta(days=settings.SCHEDULE_CHANGE_RETENTION_DAYS))
@@ -1,19 +1,47 @@
+# -*- coding: utf-8 -*-
 import unittest
 import datetime
 from datetime import datetime as dt
+import json
 import logging
+import os
+import pickle
+import random
+import shutil
+import SimpleHTTPServer
+import SocketServer
+import StringIO
+import tempfile
+import threading
+import time
 
-from django.contrib.auth.models import User
+import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.encoding import force_text
 
+from . import attendance
+from . import conflicts
+from . import embeds
 from . import models
+from . import solver
 from . import slides
 from . import utils
 from . import videos
 from . import exporters
+from .exceptions import AttendingError
 
 from ..accounts import models as account_models
+from ..conference import models as conference_models
+from ..proposals import models as proposal_models
+from ..conference.test_utils import ConferenceTestingMixin
 
 
 logging.disable(logging.CRITICAL)
@@ -342,4 +370,1171 @@ class FrabExporterTest(TestCase):
             end=datetime.datetime(2014, 7, 1, 17, 30)
         )
         self.assertEqual(u'01:30', exporter._calculate_event_duration(event))
-    pass
\ No newline at end of file
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'schedule-tests',
+    }
+}
+
+
+class ScheduleTestingMixin(ConferenceTestingMixin):
+    """
+    Sets up a conference with a single section, two locations and a speaker
+    for creating sessions in the schedule tests.
+    """
+
+    def setUp(self):
+        self.create_test_conference()
+        self.section = conference_models.Section.objects.create(
+            conference=self.conference, name='Talks')
+        self.location_1 = conference_models.Location.objects.create(
+            conference=self.conference, name='Room 1', order=1)
+        self.location_2 = conference_models.Location.objects.create(
+            conference=self.conference, name='Room 2', order=2)
+        user = get_user_model().objects.create_user(
+            'speaker@example.com', 'speaker', username='speaker')
+        self.speaker = user.speaker_profile
+        self.settings_override = self.settings(
+            CONFERENCE_ID=self.conference.pk, CACHES=LOCMEM_CACHES,
+            SCHEDULE_CACHE_SCHEDULE=True)
+        self.settings_override.enable()
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+        self.settings_override.disable()
+        models.Session.objects.all().delete()
+        self.destroy_all_test_conferences()
+
+    def create_session(self, title, start, end, locations):
+        session = models.Session.objects.create(
+            conference=self.conference, title=title, description='',
+            abstract='', speaker=self.speaker, kind=self.kind,
+            audience_level=self.audience_level, duration=self.duration,
+            section=self.section, start=start, end=end, released=True)
+        session.location = locations
+        return session
+
+
+class IncrementalScheduleTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(IncrementalScheduleTests, self).setUp()
+        self.session_1 = self.create_session('Day 1', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 10, 30), [self.location_1])
+        self.session_2 = self.create_session('Day 2', dt(2014, 7, 22, 10, 0),
+            dt(2014, 7, 22, 11, 0), [self.location_2])
+
+    def day_cache_key(self, day):
+        return 'section_schedule_day:{0}:{1}:30'.format(self.section.pk,
+                                                        day.isoformat())
+
+    def get_cell_names(self, days):
+        return [[[c.name for c in row.get_renderable_cells()] for row in day.rows]
+                for day in days]
+
+    @mock.patch('pyconde.schedule.utils.request_schedule_snapshot')
+    def test_update_only_drops_affected_day(self, mock_request_snapshot):
+        utils.create_section_schedule(self.section, row_duration=30)
+        self.assertIsNotNone(cache.get(self.day_cache_key(datetime.date(2014, 7, 21))))
+        self.assertIsNotNone(cache.get(self.day_cache_key(datetime.date(2014, 7, 22))))
+
+        self.session_2.title = 'Day 2 (updated)'
+        self.session_2.save()
+
+        self.assertIsNotNone(cache.get(self.day_cache_key(datetime.date(2014, 7, 21))))
+        self.assertIsNone(cache.get(self.day_cache_key(datetime.date(2014, 7, 22))))
+        locations, days = utils.create_section_schedule(self.section, row_duration=30)
+        self.assertEqual([[['Day 1', None]], [[None, 'Day 2 (updated)'], [None]]],
+                         self.get_cell_names(days))
+
+    def test_patched_schedule_matches_full_rebuild(self):
+        utils.create_section_schedule(self.section, row_duration=30)
+        self.session_1.start = dt(2014, 7, 22, 11, 0)
+        self.session_1.end = dt(2014, 7, 22, 11, 30)
+        self.session_1.save()
+        self.session_1.location = [self.location_1, self.location_2]
+
+        locations, days = utils.create_section_schedule(self.section, row_duration=30)
+        expected_locations, expected_days = utils.create_section_schedule(
+            self.section, row_duration=30, uncached=True)
+        self.assertEqual(expected_locations, locations)
+        self.assertEqual([datetime.date(2014, 7, 22)], [d.day for d in days])
+        self.assertEqual(self.get_cell_names(expected_days), self.get_cell_names(days))
+
+    def test_removed_session(self):
+        utils.create_section_schedule(self.section, row_duration=30)
+        self.session_1.delete()
+        locations, days = utils.create_section_schedule(self.section, row_duration=30)
+        self.assertEqual([self.location_2.pk], [loc.pk for loc in locations])
+        self.assertEqual([datetime.date(2014, 7, 22)], [d.day for d in days])
+
+
+class CompactGridTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(CompactGridTests, self).setUp()
+        self.session = self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+
+    def test_cell_holds_no_models(self):
+        cell = utils.GridCell(self.session, 2)
+        self.assertEqual('session:{0}'.format(self.session.pk), cell.repr())
+        self.assertFalse(hasattr(cell, '__dict__'))
+        self.assertEqual((utils.GridLocation(self.location_1.pk, 'Room 1', 1),),
+                         cell.location)
+        self.assertEqual((u'speaker@example.com',), cell.speakers)
+
+    def test_schedule_pickle_roundtrip(self):
+        locations, days = utils.create_section_schedule(self.section, row_duration=30)
+        data = pickle.dumps((locations, days), pickle.HIGHEST_PROTOCOL)
+        self.assertNotIn('django.db.models', data)
+        self.assertNotIn('pyconde.schedule.models', data)
+        loaded_locations, loaded_days = pickle.loads(data)
+        self.assertEqual(locations, loaded_locations)
+        self.assertEqual(1, len(loaded_days))
+        self.assertEqual([[u'Talk'], []],
+                         [[c.name for c in row.get_renderable_cells()]
+                          for row in loaded_days[0].rows])
+        self.assertEqual(2, loaded_days[0].rows[0].cells[0].rowspan)
+
+
+class ScheduleQueryCountTests(ScheduleTestingMixin, TestCase):
+    def create_sessions(self, first, last):
+        for idx in range(first, last):
+            start = dt(2014, 7, 21, 9, 0) + datetime.timedelta(hours=idx)
+            session = self.create_session('Talk {0}'.format(idx), start,
+                start + datetime.timedelta(minutes=45),
+                [self.location_1, self.location_2])
+            speaker = get_user_model().objects.create_user(
+                'speaker{0}@example.com'.format(idx), 'speaker',
+                username='speaker{0}'.format(idx)).speaker_profile
+            session.additional_speakers.add(speaker)
+        models.SideEvent.objects.create(
+            name='Lunch', start=dt(2014, 7, 21, 12, 0),
+            end=dt(2014, 7, 21, 13, 0), section=self.section,
+            conference=self.conference, is_global=True, is_pause=True)
+
+    def test_constant_number_of_queries(self):
+        self.create_sessions(0, 2)
+        with self.assertNumQueries(6):
+            utils.create_section_schedule(self.section, uncached=True)
+        self.create_sessions(2, 8)
+        with self.assertNumQueries(6):
+            locations, days = utils.create_section_schedule(self.section, uncached=True)
+        cell = days[0].rows[0].cells[0]
+        self.assertEqual(u'Talk 0', cell.name)
+        self.assertEqual((u'speaker@example.com', u'speaker0@example.com'), cell.speakers)
+        self.assertEqual(reverse('session', kwargs={'session_pk': cell.pk}), cell.url)
+        self.assertEqual(u'English', cell.language)
+
+
+class SweepLineIncrementalScheduleTests(IncrementalScheduleTests):
+    def setUp(self):
+        super(SweepLineIncrementalScheduleTests, self).setUp()
+        self.layout_override = self.settings(SCHEDULE_LAYOUT='sweepline')
+        self.layout_override.enable()
+
+    def tearDown(self):
+        self.layout_override.disable()
+        super(SweepLineIncrementalScheduleTests, self).tearDown()
+
+
+class LayoutBuilderTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(LayoutBuilderTests, self).setUp()
+        self.location_3 = conference_models.Location.objects.create(
+            conference=self.conference, name='Room 3', order=3)
+        self.create_session('Keynote', dt(2014, 7, 21, 9, 0),
+            dt(2014, 7, 21, 10, 0), [self.location_1, self.location_2])
+        self.create_session('Talk 1', dt(2014, 7, 21, 9, 30),
+            dt(2014, 7, 21, 10, 30), [self.location_3])
+        self.create_session('Talk 2', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 10, 30), [self.location_1])
+        self.create_session('Talk 3', dt(2014, 7, 21, 11, 30),
+            dt(2014, 7, 21, 12, 0), [self.location_1, self.location_3])
+        self.create_session('Talk 4', dt(2014, 7, 22, 9, 0),
+            dt(2014, 7, 22, 9, 30), [self.location_2])
+        models.SideEvent.objects.create(
+            name='Coffee', start=dt(2014, 7, 21, 10, 30),
+            end=dt(2014, 7, 21, 11, 30), section=self.section,
+            conference=self.conference, is_global=True, is_pause=True)
+
+    def describe(self, days):
+        return [(day.day, [(row.start, row.pause,
+                            [(c.name, c.rowspan, c.colspan, c.is_filler) for c in row.cells])
+                           for row in day.rows])
+                for day in days]
+
+    def create_days(self, layout):
+        with self.settings(SCHEDULE_LAYOUT=layout):
+            return utils.create_section_schedule(self.section, row_duration=30,
+                                                 uncached=True)
+
+    def test_identical_output(self):
+        locations, grid_days = self.create_days('grid')
+        sweep_locations, sweep_days = self.create_days('sweepline')
+        self.assertEqual(locations, sweep_locations)
+        self.assertEqual(self.describe(grid_days), self.describe(sweep_days))
+
+    def test_overlapping_events_in_same_room(self):
+        self.create_session('Overlap', dt(2014, 7, 21, 9, 30),
+            dt(2014, 7, 21, 10, 0), [self.location_1])
+        locations, days = self.create_days('sweepline')
+        keynote = days[0].rows[0].cells[0]
+        self.assertEqual((u'Keynote', 1, 2), (keynote.name, keynote.rowspan, keynote.colspan))
+        self.assertEqual([u'Overlap', None, u'Talk 1'],
+                         [None if c.is_empty else c.name for c in days[0].rows[1].cells])
+        # Every row has to cover all columns
+        for row in days[0].rows:
+            if not row.contains_global:
+                self.assertEqual(3, len([c for c in row.cells]) +
+                                 sum(c.colspan - 1 for c in row.cells))
+
+
+class ScheduleSnapshotTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(ScheduleSnapshotTests, self).setUp()
+        self.session = self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+
+    def snapshot_key(self, *parts):
+        return ':'.join(map(str, ('schedule_snapshot', self.conference.pk) + parts))
+
+    def test_schedule_served_from_snapshot(self):
+        self.assertIsNotNone(cache.get(self.snapshot_key('current')))
+        with self.assertNumQueries(0):
+            schedule = utils.get_schedule(row_duration=30)
+        locations, days = schedule[self.section]
+        self.assertEqual(u'Talk', days[0].rows[0].cells[0].name)
+
+    def test_change_creates_new_version(self):
+        version = cache.get(self.snapshot_key('current'))
+        self.session.title = 'Updated talk'
+        self.session.save()
+        self.assertEqual(version + 1, cache.get(self.snapshot_key('current')))
+        self.assertEqual(version, cache.get(self.snapshot_key('previous')))
+        self.assertIsNotNone(cache.get(self.snapshot_key(version, 30, False)))
+        self.assertIsNone(cache.get(self.snapshot_key(version - 1, 30, False)))
+        locations, days = utils.get_schedule(row_duration=30)[self.section]
+        self.assertEqual(u'Updated talk', days[0].rows[0].cells[0].name)
+
+    def test_active_day_follows_date(self):
+        self.create_session('Next day', dt(2014, 7, 22, 10, 0),
+            dt(2014, 7, 22, 11, 0), [self.location_1])
+        version = cache.get(self.snapshot_key('current'))
+        with mock.patch('pyconde.schedule.utils.now',
+                        return_value=dt(2014, 7, 22, 9, 0)):
+            locations, days = utils.get_schedule(row_duration=30)[self.section]
+            self.assertEqual([False, True], [day.active for day in days])
+        with mock.patch('pyconde.schedule.utils.now',
+                        return_value=dt(2014, 7, 21, 9, 0)):
+            locations, days = utils.get_schedule(row_duration=30)[self.section]
+            self.assertEqual([True, False], [day.active for day in days])
+        # Before the conference the first day is active
+        locations, days = utils.get_schedule(row_duration=30)[self.section]
+        self.assertEqual([True, False], [day.active for day in days])
+        self.assertEqual(version, cache.get(self.snapshot_key('current')))
+
+    def test_snapshot_rebuilt_before_expiry(self):
+        entry = settings.CELERYBEAT_SCHEDULE['rebuild-schedule-snapshot']
+        self.assertEqual('pyconde.schedule.tasks.build_schedule_snapshot', entry['task'])
+        self.assertLess(entry['schedule'],
+                        datetime.timedelta(seconds=settings.SCHEDULE_SNAPSHOT_TIMEOUT))
+
+    @override_settings(SCHEDULE_SNAPSHOT_TIMEOUT=60)
+    def test_snapshot_expires(self):
+        with mock.patch.object(utils.cache, 'set', wraps=utils.cache.set) as mock_set:
+            version = utils.build_schedule_snapshot()
+        timeouts = dict((args[0], args[2]) for args, kwargs in mock_set.call_args_list)
+        self.assertEqual(60, timeouts[self.snapshot_key(version, 30, False)])
+        self.assertIsNone(timeouts[self.snapshot_key('current')])
+
+
+class ScheduleInvalidationTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(ScheduleInvalidationTests, self).setUp()
+        self.other_section = conference_models.Section.objects.create(
+            conference=self.conference, name='Tutorials')
+        self.session = self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+        self.other_session = self.create_session('Tutorial', dt(2014, 7, 22, 10, 0),
+            dt(2014, 7, 22, 11, 0), [self.location_2])
+        self.other_session.section = self.other_section
+        self.other_session.save()
+        utils.create_schedule(row_duration=30)
+        utils.create_schedule(row_duration=30, merge_sections=True)
+
+    def section_key(self, section):
+        return 'section_schedule:{0}:30'.format(section.pk)
+
+    def test_unrendered_fields_keep_caches(self):
+        version = cache.get('schedule_snapshot:{0}:current'.format(self.conference.pk))
+        self.session.slides_url = 'http://example.com/slides'
+        self.session.save()
+        self.assertIsNotNone(cache.get(self.section_key(self.section)))
+        self.assertIsNotNone(cache.get('section_schedule:__merged__:30'))
+        self.assertEqual(version, cache.get('schedule_snapshot:{0}:current'.format(self.conference.pk)))
+
+    @mock.patch('pyconde.schedule.utils.update_section_cells')
+    def test_update_fields_skip_interval_models(self, mock_update):
+        self.session.video_url = 'http://example.com/video'
+        self.session.save(update_fields=['video_url'])
+        self.assertFalse(mock_update.called)
+        self.assertIsNotNone(cache.get(self.section_key(self.section)))
+
+    @mock.patch('pyconde.schedule.utils.request_schedule_snapshot')
+    def test_only_affected_sections_are_cleared(self, mock_request_snapshot):
+        self.session.title = 'Updated talk'
+        self.session.save()
+        self.assertIsNone(cache.get(self.section_key(self.section)))
+        self.assertIsNone(cache.get('section_schedule:__merged__:30'))
+        self.assertIsNotNone(cache.get(self.section_key(self.other_section)))
+        self.assertTrue(mock_request_snapshot.called)
+
+
+class StreamingExportTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(StreamingExportTests, self).setUp()
+        self.session = self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_2])
+        self.other_session = self.create_session(u'Tälk 2', dt(2014, 7, 21, 9, 0),
+            dt(2014, 7, 21, 10, 0), [self.location_1])
+        self.side_event = models.SideEvent.objects.create(
+            name='Lightning talks', start=dt(2014, 7, 21, 10, 0),
+            end=dt(2014, 7, 21, 11, 0), section=self.section,
+            conference=self.conference)
+        self.side_event.location = [self.location_1]
+
+    def test_iter_csv_matches_dataset(self):
+        for exporter in (exporters.GuidebookExporterSessions(),
+                         exporters.GuidebookExporterSpeakers(),
+                         exporters.GuidebookExporterLinks(),
+                         exporters.SimpleSessionExporter(models.Session.objects.all())):
+            self.assertEqual(exporter().csv, ''.join(exporter.iter_csv()))
+
+    def test_sessions_sorted_by_start_and_location(self):
+        rows = list(exporters.GuidebookExporterSessions().get_rows())
+        self.assertEqual([u'Tälk 2', 'Lightning talks', 'Talk'],
+                         [row[0] for row in rows])
+
+    def test_iter_queryset(self):
+        queryset = models.Session.objects.order_by('start')
+        self.assertEqual([self.other_session, self.session],
+                         list(exporters.iter_queryset(queryset, chunk_size=1)))
+
+    def test_guidebook_export_is_streamed(self):
+        get_user_model().objects.create_superuser(
+            'admin@example.com', 'admin', username='admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(reverse('guidebook-export', kwargs={'kind': 'sessions'}))
+        self.assertTrue(response.streaming)
+        self.assertEqual(exporters.GuidebookExporterSessions()().csv,
+                         ''.join(response.streaming_content))
+
+
+class ScheduleDatasetTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(ScheduleDatasetTests, self).setUp()
+        self.conference.start_date = datetime.date(2014, 7, 21)
+        self.conference.end_date = datetime.date(2014, 7, 22)
+        self.conference.save()
+        other_user = get_user_model().objects.create_user(
+            'cospeaker@example.com', 'cospeaker', username='cospeaker')
+        self.session = self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+        self.session.additional_speakers = [other_user.speaker_profile]
+        self.session.tags.add('python')
+        self.other_session = self.create_session('Other talk', dt(2014, 7, 22, 10, 0),
+            dt(2014, 7, 22, 11, 0), [self.location_2])
+        self.side_event = models.SideEvent.objects.create(
+            name='Lunch', start=dt(2014, 7, 21, 12, 0),
+            end=dt(2014, 7, 21, 13, 0), section=self.section,
+            conference=self.conference, is_pause=True)
+        self.side_event.location = [self.location_1, self.location_2]
+
+    def test_load_dataset(self):
+        from .dataset import load_schedule_dataset
+
+        with self.assertNumQueries(7):
+            dataset = load_schedule_dataset(self.conference)
+        self.assertEqual([self.session.pk, self.other_session.pk],
+                         [s.pk for s in dataset.sessions])
+        self.assertEqual(('python',), dataset.sessions[0].tags)
+        self.assertEqual('Room 1, Room 2', dataset.side_events[0].location_pretty)
+        self.assertIs(dataset.sessions[0].speaker, dataset.sessions[1].speaker)
+        self.assertEqual(['Talk', 'Lunch', 'Other talk'],
+                         [force_text(evt) for evt in dataset.events])
+
+    def test_exporters_do_not_query(self):
+        from .dataset import load_schedule_dataset
+
+        dataset = load_schedule_dataset(self.conference)
+        exporter_list = [exporters.get_exporter(name, dataset)
+                         for name in exporters.EXPORTERS]
+        with self.assertNumQueries(0):
+            for exporter in exporter_list:
+                exporter.write(StringIO.StringIO())
+
+    def test_guidebook_exporter_uses_dataset(self):
+        rows = list(exporters.GuidebookExporterSessions().get_rows())
+        self.assertEqual(['Talk', 'Lunch', 'Other talk'], [row[0] for row in rows])
+        self.assertEqual('', rows[1][4])
+        self.assertEqual('<https://example.com/accounts/profile/{0}/>'.format(
+            self.speaker.user.pk), rows[0][11])
+
+    def test_guidebook_exporters_load_chunks(self):
+        from . import dataset
+
+        with mock.patch.object(exporters, 'load_schedule_dataset',
+                               wraps=dataset.load_schedule_dataset) as mock_load:
+            list(exporters.GuidebookExporterSpeakers().get_rows())
+        self.assertEqual([(dt(2014, 7, 21), dt(2014, 7, 22)),
+                          (dt(2014, 7, 22), dt(2014, 7, 23))],
+                         [(kwargs['start'], kwargs['end'])
+                          for args, kwargs in mock_load.call_args_list])
+
+        with mock.patch.object(exporters, 'EXPORT_CHUNK_SIZE', 1), \
+                mock.patch.object(exporters, 'load_schedule_dataset',
+                                  wraps=dataset.load_schedule_dataset) as mock_load:
+            rows = list(exporters.GuidebookExporterLinks().get_rows())
+        self.assertEqual(['Talk', 'Other talk'], [row[1] for row in rows])
+        self.assertEqual([[self.session.pk], [self.other_session.pk]],
+                         [kwargs['session_pks'] for args, kwargs in mock_load.call_args_list])
+
+    def test_export_all(self):
+        outdir = tempfile.mkdtemp()
+        try:
+            call_command('export_all', outdir=outdir, stdout=StringIO.StringIO())
+            self.assertEqual(
+                sorted('{0}.{1}'.format(name, fmt.extension)
+                       for name, fmt in exporters.EXPORTERS.items()),
+                sorted(os.listdir(outdir)))
+            with open(os.path.join(outdir, 'frab.xml')) as fp:
+                self.assertIn('<title>Talk</title>', fp.read())
+        finally:
+            shutil.rmtree(outdir)
+
+
+class FrabExportTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(FrabExportTests, self).setUp()
+        self.conference.start_date = datetime.date(2014, 7, 21)
+        self.conference.end_date = datetime.date(2014, 7, 22)
+        self.conference.save()
+        self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+        self.create_session('Other talk', dt(2014, 7, 22, 10, 0),
+            dt(2014, 7, 22, 11, 30), [self.location_2])
+        self.create_session('Too late', dt(2014, 7, 23, 10, 0),
+            dt(2014, 7, 23, 11, 0), [self.location_2])
+        models.SideEvent.objects.create(
+            name='Party', start=dt(2014, 7, 21, 20, 0),
+            end=dt(2014, 7, 21, 23, 0), conference=self.conference)
+
+    def get_rooms(self, doc):
+        return dict(((day.get('date'), room.get('name')),
+                     [evt.findtext('title') for evt in room.findall('event')])
+                    for day in doc.findall('day') for room in day.findall('room'))
+
+    def test_events_grouped_by_day_and_room(self):
+        from lxml import etree
+
+        output = StringIO.StringIO()
+        with self.assertNumQueries(7):
+            exporters.FrabExporter(output, self.conference)()
+        rooms = self.get_rooms(etree.fromstring(output.getvalue()))
+        self.assertEqual({
+            ('2014-07-21', 'Room 1'): ['Talk'],
+            ('2014-07-21', 'Room 2'): [],
+            ('2014-07-21', 'Other'): ['Party'],
+            ('2014-07-22', 'Room 1'): [],
+            ('2014-07-22', 'Room 2'): ['Other talk'],
+            ('2014-07-22', 'Other'): [],
+        }, rooms)
+        self.assertIn('<duration>01:30</duration>', output.getvalue())
+
+
+class ConditionalScheduleViewTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(ConditionalScheduleViewTests, self).setUp()
+        self.session = self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+        self.url = reverse('session', kwargs={'session_pk': self.session.pk})
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(304, response.status_code)
+
+    def test_changes_modify_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.session.slides_url = 'http://example.com/slides'
+        self.session.save(update_fields=['slides_url'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+        etag = response['ETag']
+        self.session.tags.add('python')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+
+    def test_speaker_changes_modify_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        user = self.speaker.user
+        user.last_login = dt(2014, 7, 21, 9, 0)
+        user.save(update_fields=['last_login'])
+        self.assertEqual(304, self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code)
+        user.display_name = 'New name'
+        user.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, 'New name')
+
+    def test_modified_on_next_day(self):
+        with mock.patch('pyconde.schedule.utils.now',
+                        return_value=dt(2014, 7, 21, 23, 0)):
+            utils.bump_schedule_version()
+            response = self.client.get(self.url)
+        with mock.patch('pyconde.schedule.utils.now',
+                        return_value=dt(2014, 7, 22, 1, 0)):
+            self.assertEqual(200, self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+            self.assertEqual(200, self.client.get(
+                self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code)
+
+    def test_etag_depends_on_session(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.cookies['sessionid'] = 'other'
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_guidebook_export_checks_permission_first(self):
+        get_user_model().objects.create_superuser(
+            'admin@example.com', 'admin', username='admin')
+        self.client.login(username='admin', password='admin')
+        url = reverse('guidebook-export', kwargs={'kind': 'sessions'})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+        self.client.logout()
+        self.assertEqual(403, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+
+class ScheduleApiTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(ScheduleApiTests, self).setUp()
+        self.session = self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+        self.other_session = self.create_session('Other talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_2])
+        self.side_event = models.SideEvent.objects.create(
+            name='Lunch', start=dt(2014, 7, 21, 12, 0),
+            end=dt(2014, 7, 21, 13, 0), conference=self.conference)
+        self.url = reverse('schedule-api')
+
+    def get_json(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual('application/json', response['Content-Type'])
+        return json.loads(response.content)
+
+    def test_full_schedule(self):
+        data = self.get_json()
+        self.assertEqual(models.ScheduleChange.objects.latest('pk').pk, data['version'])
+        self.assertEqual(['Room 1', 'Room 2'], [loc['name'] for loc in data['locations']])
+        self.assertEqual(['Talk', 'Other talk', 'Lunch'], [evt['title'] for evt in data['events']])
+        self.assertEqual([self.location_1.pk], data['events'][0]['locations'])
+
+    def test_delta(self):
+        version = self.get_json()['version']
+        self.assertEqual([], self.get_json(since=version)['events'])
+
+        self.session.title = 'Updated talk'
+        self.session.save()
+        self.other_session.released = False
+        self.other_session.save()
+        side_event_pk = self.side_event.pk
+        self.side_event.delete()
+        data = self.get_json(since=version)
+        self.assertEqual(['Updated talk'], [evt['title'] for evt in data['events']])
+        self.assertEqual([{'type': 'session', 'id': self.other_session.pk},
+                          {'type': 'sideevent', 'id': side_event_pk}],
+                         data['deleted'])
+        self.assertEqual([], self.get_json(since=data['version'])['events'])
+
+    def test_location_changes_are_logged(self):
+        version = self.get_json()['version']
+        self.session.location = [self.location_2]
+        data = self.get_json(since=version)
+        self.assertEqual([[self.location_2.pk]], [evt['locations'] for evt in data['events']])
+
+    def test_invalid_version(self):
+        self.assertEqual(400, self.client.get(self.url, {'since': 'abc'}).status_code)
+
+    def test_changes_are_logged_for_event_conference(self):
+        other_conference = conference_models.Conference.objects.create(title='Other')
+        side_event = models.SideEvent.objects.create(
+            name='Party', start=dt(2014, 7, 21, 20, 0),
+            end=dt(2014, 7, 21, 23, 0), conference=other_conference)
+        change = models.ScheduleChange.objects.latest('pk')
+        self.assertEqual((other_conference.pk, side_event.pk),
+                         (change.conference_id, change.event_id))
+
+    def test_prune_changes(self):
+        from . import tasks
+
+        version = self.get_json()['version']
+        self.session.title = 'Updated talk'
+        self.session.save()
+        self.session.title = 'Final talk'
+        self.session.save()
+        models.ScheduleChange.objects.update(created=dt(2014, 1, 1))
+        tasks.prune_schedule_changes()
+        self.assertEqual(
+            sorted([('session', self.session.pk), ('session', self.other_session.pk),
+                    ('sideevent', self.side_event.pk)]),
+            sorted(models.ScheduleChange.objects.values_list('event_type', 'event_id')))
+        data = self.get_json(since=version)
+        self.assertEqual(['Final talk'], [evt['title'] for evt in data['events']])
+
+
+class RenderedScheduleTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(RenderedScheduleTests, self).setUp()
+        self.session = self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+        self.other_session = self.create_session('Other talk', dt(2014, 7, 22, 10, 0),
+            dt(2014, 7, 22, 11, 0), [self.location_2])
+
+    def test_days_are_rendered_once(self):
+        with mock.patch('pyconde.schedule.utils.render_to_string',
+                        wraps=utils.render_to_string) as mock_render:
+            schedule = utils.get_rendered_schedule(row_duration=30)
+            self.assertEqual(2, mock_render.call_count)
+            with self.assertNumQueries(0):
+                cached = utils.get_rendered_schedule(row_duration=30)
+            self.assertEqual([html for day, html in schedule[self.section][1]],
+                             [html for day, html in cached[self.section][1]])
+            self.assertEqual(2, mock_render.call_count)
+        locations, days = schedule[self.section]
+        self.assertEqual([datetime.date(2014, 7, 21), datetime.date(2014, 7, 22)],
+                         [day.day for day, html in days])
+        self.assertIn('Talk', days[0][1])
+        self.assertIn('Other talk', days[1][1])
+
+    def test_changes_are_rendered(self):
+        utils.get_rendered_schedule(row_duration=30)
+        self.session.title = 'Updated talk'
+        self.session.save()
+        locations, days = utils.get_rendered_schedule(row_duration=30)[self.section]
+        self.assertIn('Updated talk', days[0][1])
+
+    def test_sections(self):
+        other_section = conference_models.Section.objects.create(
+            conference=self.conference, name='Tutorials')
+        self.assertEqual([], utils.get_rendered_schedule(
+            row_duration=30, sections=[other_section]).keys())
+
+    def test_view_schedule(self):
+        response = self.client.get(reverse('schedule'))
+        self.assertContains(response, 'Other talk')
+
+    def test_active_day_is_not_cached(self):
+        with mock.patch('pyconde.schedule.utils.render_to_string',
+                        wraps=utils.render_to_string) as mock_render:
+            with mock.patch('pyconde.schedule.utils.now',
+                            return_value=dt(2014, 7, 21, 9, 0)):
+                response = self.client.get(reverse('schedule'))
+            self.assertContains(response, 'href="#day1" class="switch active"')
+            with mock.patch('pyconde.schedule.utils.now',
+                            return_value=dt(2014, 7, 22, 9, 0)):
+                response = self.client.get(reverse('schedule'))
+            self.assertContains(response, 'href="#day2" class="switch active"')
+            self.assertEqual(2, mock_render.call_count)
+
+
+class AttendanceCacheTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(AttendanceCacheTests, self).setUp()
+        self.session = self.create_session('Training', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+        self.session.max_attendees = 2
+        self.session.save()
+        self.user = get_user_model().objects.create_user(
+            'attendee@example.com', 'attendee', username='attendee')
+
+    def test_single_cache_read(self):
+        attendance.get_attendance(self.user, [self.session])
+        with self.assertNumQueries(0):
+            result = attendance.get_attendance(self.user, [self.session])
+        self.assertFalse(result.is_attending(self.session))
+        self.assertTrue(result.has_free_seats(self.session))
+        self.assertEqual({self.session.pk: 0}, result.seats)
+
+    def test_attend_and_leave(self):
+        attendance.get_attendance(self.user, [self.session])
+        self.user.sessions_attending.add(self.session)
+        result = attendance.get_attendance(self.user, [self.session])
+        self.assertEqual(frozenset([self.session.pk]), result.session_ids)
+        self.assertEqual(1, result.seats[self.session.pk])
+        self.session.attendees.remove(self.user)
+        result = attendance.get_attendance(self.user, [self.session])
+        self.assertFalse(result.is_attending(self.session))
+        self.assertEqual(0, result.seats[self.session.pk])
+
+    def test_clear(self):
+        self.session.attendees.add(self.user)
+        attendance.get_attendance(self.user, [self.session])
+        self.session.attendees.clear()
+        result = attendance.get_attendance(self.user, [self.session])
+        self.assertEqual(frozenset(), result.session_ids)
+        self.assertEqual(0, result.seats[self.session.pk])
+
+    def test_free_seats(self):
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'other', username='other')
+        self.session.attendees.add(self.user, other)
+        self.assertFalse(self.session.has_free_seats())
+        self.assertTrue(self.session.is_attending(self.user))
+
+    def test_anonymous(self):
+        result = attendance.get_attendance(AnonymousUser(), [self.session])
+        self.assertEqual(frozenset(), result.session_ids)
+        self.assertFalse(self.session.is_attending(AnonymousUser()))
+
+    def test_api(self):
+        self.session.attendees.add(self.user)
+        self.client.login(username='attendee', password='attendee')
+        response = self.client.get(reverse('schedule-attendance-api'))
+        self.assertEqual({'attending': [self.session.pk]}, json.loads(response.content))
+
+
+class SeatReservationTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(SeatReservationTests, self).setUp()
+        start = datetime.datetime.now().replace(microsecond=0, second=0) + datetime.timedelta(days=1)
+        self.start = start
+        self.session = self.create_session('Training', start,
+            start + datetime.timedelta(hours=2), [self.location_1])
+        self.session.max_attendees = 1
+        self.session.save()
+        self.users = [get_user_model().objects.create_user(
+            'att{0}@example.com'.format(i), 'att', username='att{0}'.format(i))
+            for i in range(2)]
+        self.attending_override = self.settings(SCHEDULE_ATTENDING_POSSIBLE=['kind'])
+        self.attending_override.enable()
+
+    def tearDown(self):
+        self.attending_override.disable()
+        super(SeatReservationTests, self).tearDown()
+
+    def test_no_overbooking(self):
+        self.session.attend(self.users[0])
+        with self.assertRaises(AttendingError):
+            self.session.attend(self.users[1])
+        self.assertEqual(1, models.SeatCounter.objects.get(session=self.session).taken)
+        self.assertEqual([self.users[0].pk],
+                         list(self.session.attendees.values_list('pk', flat=True)))
+
+    def test_attend_twice(self):
+        self.session.attend(self.users[0])
+        self.session.attend(self.users[0])
+        self.assertEqual(1, models.SeatCounter.objects.get(session=self.session).taken)
+
+    def test_leave(self):
+        self.session.attend(self.users[0])
+        self.assertFalse(self.session.has_free_seats())
+        self.session.leave(self.users[0])
+        self.session.leave(self.users[0])
+        self.assertEqual(0, models.SeatCounter.objects.get(session=self.session).taken)
+        self.assertTrue(self.session.has_free_seats())
+        self.session.attend(self.users[1])
+        self.assertTrue(self.session.is_attending(self.users[1]))
+
+    def test_relation_changes(self):
+        self.session.attend(self.users[0])
+        self.session.attendees.remove(self.users[0])
+        self.users[1].sessions_attending.add(self.session)
+        self.assertEqual(1, models.SeatCounter.objects.get(session=self.session).taken)
+        self.users[1].sessions_attending.clear()
+        self.assertEqual(0, models.SeatCounter.objects.get(session=self.session).taken)
+
+    def test_overlaps(self):
+        overlapping = self.create_session('Contained',
+            self.start + datetime.timedelta(minutes=30),
+            self.start + datetime.timedelta(hours=1), [self.location_2])
+        adjacent = self.create_session('Adjacent',
+            self.start + datetime.timedelta(hours=2),
+            self.start + datetime.timedelta(hours=3), [self.location_2])
+        self.session.attend(self.users[0])
+        self.assertFalse(overlapping.can_attend(self.users[0]))
+        with self.assertRaises(AttendingError):
+            overlapping.attend(self.users[0])
+        adjacent.attend(self.users[0])
+        self.assertTrue(self.session.can_attend(self.users[0]))
+
+    def test_moved_session(self):
+        other = self.create_session('Later', self.start + datetime.timedelta(hours=3),
+            self.start + datetime.timedelta(hours=4), [self.location_2])
+        self.session.attend(self.users[0])
+        self.assertTrue(other.can_attend(self.users[0]))
+        self.session.end = other.end
+        self.session.save()
+        self.assertFalse(other.can_attend(self.users[0]))
+
+    def test_reconcile(self):
+        self.session.attend(self.users[0])
+        models.SeatCounter.objects.filter(session=self.session).update(taken=5)
+        out = StringIO.StringIO()
+        call_command('reconcile_seats', stdout=out)
+        self.assertIn('Fixed seat counter of session {0} (was 5)'.format(self.session.pk),
+                      out.getvalue())
+        self.assertEqual(1, models.SeatCounter.objects.get(session=self.session).taken)
+
+
+class IntervalTreeTests(unittest.TestCase):
+    def test_overlapping(self):
+        intervals = [(0, 10, 'a'), (2, 3, 'b'), (3, 5, 'c'), (6, 7, 'd'),
+                     (8, 12, 'e'), (12, 13, 'f'), (1, 2, 'g')]
+        tree = conflicts.IntervalTree(intervals)
+        for start in range(15):
+            for end in range(start + 1, 16):
+                expected = sorted(value for s, e, value in intervals
+                                  if s < end and e > start)
+                self.assertEqual(expected, sorted(tree.overlapping(start, end)))
+
+    def test_empty(self):
+        self.assertEqual([], conflicts.IntervalTree().overlapping(0, 1))
+
+
+class ScheduleConflictsTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(ScheduleConflictsTests, self).setUp()
+        self.session_1 = self.create_session('Long', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 12, 0), [self.location_1])
+        self.session_2 = self.create_session('Enclosed', dt(2014, 7, 21, 10, 30),
+            dt(2014, 7, 21, 11, 0), [self.location_2])
+        self.session_3 = self.create_session('Afterwards', dt(2014, 7, 21, 12, 0),
+            dt(2014, 7, 21, 13, 0), [self.location_1])
+        other_user = get_user_model().objects.create_user(
+            'other@example.com', 'other', username='other')
+        self.session_2.speaker = other_user.speaker_profile
+        self.session_2.save()
+        self.session_4 = self.create_session('Parallel', dt(2014, 7, 21, 12, 30),
+            dt(2014, 7, 21, 13, 30), [self.location_2])
+        self.session_5 = self.create_session('Same room', dt(2014, 7, 21, 10, 45),
+            dt(2014, 7, 21, 11, 15), [self.location_2])
+        self.session_5.speaker = other_user.speaker_profile
+        self.session_5.save()
+        self.attendee = get_user_model().objects.create_user(
+            'attendee@example.com', 'attendee', username='attendee')
+        self.attendee.sessions_attending.add(self.session_1, self.session_2, self.session_3)
+
+    def _pairs(self, found):
+        return [(conflict.first.pk, conflict.second.pk) for conflict in found]
+
+    def test_overlapping(self):
+        schedule_conflicts = conflicts.ScheduleConflicts()
+        self.assertEqual([self.session_2.pk, self.session_5.pk],
+            [s.pk for s in schedule_conflicts.overlapping(
+                dt(2014, 7, 21, 10, 30), dt(2014, 7, 21, 11, 0), exclude=self.session_1)])
+
+    def test_speaker_conflicts(self):
+        found = conflicts.ScheduleConflicts().speaker_conflicts()
+        self.assertEqual([(self.session_3.pk, self.session_4.pk),
+                          (self.session_2.pk, self.session_5.pk)], self._pairs(found))
+        self.assertEqual(self.speaker.pk, found[0].key.pk)
+
+    def test_room_conflicts(self):
+        found = conflicts.ScheduleConflicts().room_conflicts()
+        self.assertEqual([(self.session_2.pk, self.session_5.pk)], self._pairs(found))
+        self.assertEqual(self.location_2.pk, found[0].key.pk)
+
+    def test_attendee_conflicts(self):
+        found = conflicts.ScheduleConflicts().attendee_conflicts()
+        self.assertEqual([(self.session_1.pk, self.session_2.pk)], self._pairs(found))
+        self.assertEqual(self.attendee.pk, found[0].key)
+
+    def test_command(self):
+        out = StringIO.StringIO()
+        call_command('schedule_conflicts', kinds=['rooms'], stdout=out)
+        self.assertIn('1 conflicting rooms', out.getvalue())
+        self.assertIn('Room 2: "Enclosed" (2014-07-21 10:30-11:00) overlaps "Same room"',
+                      out.getvalue())
+        self.assertNotIn('speakers', out.getvalue())
+
+    def test_api(self):
+        url = reverse('schedule-conflicts-api')
+        self.client.login(username='attendee', password='attendee')
+        self.assertEqual(403, self.client.get(url).status_code)
+        get_user_model().objects.create_superuser(
+            'admin@example.com', 'admin', username='admin')
+        self.client.login(username='admin', password='admin')
+        data = json.loads(self.client.get(url).content)
+        self.assertEqual([[self.session_2.pk, self.session_5.pk]],
+                         [[evt['id'] for evt in conflict['events']]
+                          for conflict in data['rooms']])
+        self.assertEqual(2, len(data['speakers']))
+
+
+class ScheduleSolverTests(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+        self.periods = []
+        for offset in range(3):
+            day = datetime.date(2014, 7, 21) + datetime.timedelta(days=offset)
+            self.periods.append(solver.Period(day, 1, dt.combine(day, datetime.time(9)),
+                                              dt.combine(day, datetime.time(12, 30))))
+            self.periods.append(solver.Period(day, 2, dt.combine(day, datetime.time(13, 30)),
+                                              dt.combine(day, datetime.time(18))))
+        self.rooms = [solver.Room(pk, rnd.choice([None, 50, 200])) for pk in range(8)]
+        self.tasks = [solver.Task(pk=pk,
+                                  minutes=rnd.choice([30, 30, 45, 90]),
+                                  speakers=frozenset([rnd.randrange(150)]),
+                                  track=rnd.randrange(6),
+                                  max_attendees=rnd.choice([None, None, 100]),
+                                  periods=tuple(sorted(rnd.sample(range(6), rnd.randint(2, 6)))))
+                      for pk in range(200)]
+
+    def assertValid(self, solution, tasks, busy_rooms=()):
+        tasks = dict((task.pk, task) for task in tasks)
+        rooms = dict((room.pk, room) for room in self.rooms)
+        for pk, placement in solution.placements.items():
+            task = tasks[pk]
+            self.assertTrue(any(self.periods[idx].start <= placement.start and
+                                placement.end <= self.periods[idx].end
+                                for idx in task.periods))
+            capacity = rooms[placement.room].capacity
+            if task.max_attendees and capacity is not None:
+                self.assertGreaterEqual(capacity, task.max_attendees)
+            for other_pk, other in solution.placements.items():
+                if other_pk == pk or not (other.start < placement.end and
+                                          other.end > placement.start):
+                    continue
+                self.assertNotEqual(placement.room, other.room)
+                self.assertFalse(task.speakers & tasks[other_pk].speakers)
+            for room_pk, start, end in busy_rooms:
+                if room_pk in (None, placement.room):
+                    self.assertFalse(start < placement.end and end > placement.start)
+
+    def test_conference(self):
+        started = time.time()
+        schedule_solver = solver.ScheduleSolver(self.tasks, self.rooms, self.periods, seed=1)
+        solution = schedule_solver.solve()
+        self.assertLess(time.time() - started, 30)
+        self.assertEqual([], solution.unplaced)
+        self.assertValid(solution, self.tasks)
+
+    def test_busy(self):
+        busy_rooms = [(None, dt(2014, 7, 21, 10, 30), dt(2014, 7, 21, 11, 0)),
+                      (0, dt(2014, 7, 22, 9, 0), dt(2014, 7, 22, 18, 0))]
+        solution = solver.ScheduleSolver(self.tasks[:100], self.rooms, self.periods,
+                                         busy_rooms=busy_rooms, seed=1).solve()
+        self.assertEqual([], solution.unplaced)
+        self.assertValid(solution, self.tasks[:100], busy_rooms)
+
+    def test_unplaceable(self):
+        tasks = [solver.Task(pk, 180, frozenset([1]), None, None, (0,)) for pk in range(2)]
+        solution = solver.ScheduleSolver(tasks, self.rooms, self.periods, seed=1).solve()
+        self.assertEqual(1, len(solution.placements))
+        self.assertEqual(1, len(solution.unplaced))
+
+    def test_make_room(self):
+        # The first task fits everywhere but is placed first, so the
+        # second one only fits after the first one was moved.
+        tasks = [solver.Task(1, 60, frozenset([1]), None, None, (0, 1)),
+                 solver.Task(2, 210, frozenset([1]), None, None, (0,))]
+        schedule_solver = solver.ScheduleSolver(tasks, self.rooms[:1], self.periods, seed=1)
+        schedule_solver._place(tasks[0], self.rooms[0].pk,
+                               schedule_solver.period_starts[0], 0)
+        solution = schedule_solver.solve()
+        self.assertEqual([], solution.unplaced)
+        self.assertValid(solution, tasks)
+
+    def test_track_clustering(self):
+        tasks = [solver.Task(pk, 30, frozenset([pk]), 1, None, (0,)) for pk in range(4)]
+        solution = solver.ScheduleSolver(tasks, self.rooms, self.periods, seed=1).solve()
+        self.assertEqual(1, len(set(placement.room for placement in solution.placements.values())))
+        self.assertEqual(0 + 2 + 4 + 6, solution.cost)
+
+
+class ScheduleDraftTests(ScheduleTestingMixin, TestCase):
+    def setUp(self):
+        super(ScheduleDraftTests, self).setUp()
+        self.conference.start_date = datetime.date(2014, 7, 21)
+        self.conference.end_date = datetime.date(2014, 7, 22)
+        self.conference.save()
+        self.fixed = self.create_session('Fixed', dt(2014, 7, 21, 9, 0),
+            dt(2014, 7, 21, 12, 30), [self.location_1])
+        self.timeslot = proposal_models.TimeSlot.objects.create(
+            date=datetime.date(2014, 7, 21), slot=1, section=self.section)
+        self.session_1 = self.create_session('Morning', None, None, [])
+        self.session_1.available_timeslots = [self.timeslot]
+        self.session_2 = self.create_session('Anytime', None, None, [])
+
+    def test_create_and_apply(self):
+        draft = solver.create_draft(models.Session.objects.filter(start__isnull=True),
+                                    self.conference, seed=1)
+        items = dict((item.session_id, item) for item in draft.items.all())
+        self.assertEqual(set([self.session_1.pk, self.session_2.pk]), set(items))
+        morning = items[self.session_1.pk]
+        # Room 1 is taken by the fixed session and the speaker is busy.
+        self.assertIsNone(morning.start)
+        anytime = items[self.session_2.pk]
+        self.assertIn(anytime.start, [dt(2014, 7, 21, 13, 30), dt(2014, 7, 22, 9, 0)])
+        self.assertIsNone(models.Session.objects.get(pk=self.session_2.pk).start)
+        draft.apply()
+        session = models.Session.objects.get(pk=self.session_2.pk)
+        self.assertEqual(anytime.start, session.start)
+        self.assertEqual([anytime.location_id], [loc.pk for loc in session.location.all()])
+        self.assertIsNotNone(models.ScheduleDraft.objects.get(pk=draft.pk).applied)
+
+    def test_command(self):
+        out = StringIO.StringIO()
+        call_command('solve_schedule', seed=1, stdout=out)
+        self.assertIn('1 session(s) placed, 1 unplaced', out.getvalue())
+        self.assertIn('Could not place "Morning"', out.getvalue())
+
+
+class StubServiceHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """
+    Answers like an oEmbed provider (or a slow one for ``/slow``).
+    """
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path.startswith('/slow'):
+            time.sleep(0.5)
+        body = json.dumps({'html': '<iframe src="http://embed.example.com/1"></iframe>'})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class EmbedTests(ScheduleTestingMixin, TestCase):
+    slides_url = 'https://www.slideshare.net/someone/talk'
+
+    def setUp(self):
+        super(EmbedTests, self).setUp()
+        self.server = SocketServer.TCPServer(('127.0.0.1', 0), StubServiceHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.stub_url = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+        self.session = self.create_session('Talk', dt(2014, 7, 21, 10, 0),
+            dt(2014, 7, 21, 11, 0), [self.location_1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super(EmbedTests, self).tearDown()
+
+    def _patch_oembed_url(self, path='/oembed'):
+        return mock.patch.object(slides.SlideShareService, 'get_oembed_url',
+                                 return_value=self.stub_url + path)
+
+    def test_resolved_on_change(self):
+        with self._patch_oembed_url():
+            self.session.slides_url = self.slides_url
+            self.session.save()
+            self.session.save()
+        self.assertEqual(['/oembed'], self.server.requests)
+        embed = models.Embed.objects.get(kind=models.Embed.KIND_SLIDES, url=self.slides_url)
+        self.assertIn('embed.example.com', embed.html)
+        self.assertIsNotNone(embed.resolved)
+
+    def test_render_reads_stored_code(self):
+        with self._patch_oembed_url():
+            self.session.slides_url = self.slides_url
+            self.session.save()
+        with mock.patch('pyconde.helpers.http.get', side_effect=AssertionError):
+            response = self.client.get(self.session.get_absolute_url())
+        self.assertContains(response, '<iframe src="http://embed.example.com/1"></iframe>')
+
+    def test_unknown_links_are_requested(self):
+        models.Session.objects.filter(pk=self.session.pk).update(slides_url=self.slides_url)
+        with mock.patch('pyconde.schedule.tasks.resolve_embed.delay') as mock_delay:
+            self.assertIsNone(embeds.get_embed_code(models.Embed.KIND_SLIDES, self.slides_url))
+            self.assertIsNone(embeds.get_embed_code(models.Embed.KIND_SLIDES, self.slides_url))
+        mock_delay.assert_called_once_with(models.Embed.KIND_SLIDES, self.slides_url)
+
+    @override_settings(HTTP_TIMEOUT=0.1)
+    def test_timeout(self):
+        with self._patch_oembed_url('/slow'):
+            embed = embeds.resolve_embed(models.Embed.KIND_SLIDES, self.slides_url)
+        self.assertEqual('', embed.html)
+        self.assertIsNone(embeds.get_embed_code(models.Embed.KIND_SLIDES, self.slides_url))
+
+    def test_command(self):
+        models.Session.objects.filter(pk=self.session.pk).update(slides_url=self.slides_url)
+        out = StringIO.StringIO()
+        with self._patch_oembed_url():
+            call_command('resolve_embeds', stdout=out)
+            call_command('resolve_embeds', stdout=out)
+        self.assertEqual('slides {0}: resolved\n'.format(self.slides_url), out.getvalue())
+
+
+class EmbedStateTests(ScheduleTestingMixin, TestCase):
+    slides_url = 'https://www.slideshare.net/someone/talk'
+
+    def _resolve_failing(self):
+        with mock.patch('pyconde.helpers.http.get', side_effect=IOError):
+            return embeds.resolve_embed(models.Embed.KIND_SLIDES, self.slides_url)
+
+    def test_unsupported(self):
+        embed = embeds.resolve_embed(models.Embed.KIND_SLIDES, 'http://example.com/slides')
+        self.assertEqual(models.Embed.STATE_UNSUPPORTED, embed.state)
+        self.assertIsNone(embed.retry_at)
+        with mock.patch('pyconde.schedule.tasks.resolve_embed.delay') as mock_delay:
+            self.assertIsNone(embeds.get_embed_code(models.Embed.KIND_SLIDES,
+                                                    'http://example.com/slides'))
+        self.assertFalse(mock_delay.called)
+
+    def test_backoff(self):
+        before = datetime.datetime.now()
+        embed = self._resolve_failing()
+        self.assertEqual(models.Embed.STATE_FAILED, embed.state)
+        self.assertEqual(1, embed.failures)
+        self.assertGreaterEqual(embed.retry_at, before + datetime.timedelta(seconds=embeds.RETRY_DELAY))
+        embed = self._resolve_failing()
+        self.assertEqual(2, embed.failures)
+        self.assertGreaterEqual(embed.retry_at, before + datetime.timedelta(seconds=2 * embeds.RETRY_DELAY))
+        self.assertEqual(embeds.MAX_RETRY_DELAY, embeds.get_retry_delay(100))
+
+    def test_no_retry_before_due(self):
+        self._resolve_failing()
+        with mock.patch('pyconde.schedule.tasks.resolve_embed.delay') as mock_delay:
+            with self.assertNumQueries(0):
+                self.assertIsNone(embeds.get_embed_code(models.Embed.KIND_SLIDES, self.slides_url))
+            self.assertFalse(mock_delay.called)
+            models.Embed.objects.update(retry_at=datetime.datetime.now())
+            cache.clear()
+            embeds.get_embed_code(models.Embed.KIND_SLIDES, self.slides_url)
+            embeds.get_embed_code(models.Embed.KIND_SLIDES, self.slides_url)
+        mock_delay.assert_called_once_with(models.Embed.KIND_SLIDES, self.slides_url)
+
+    def test_recovery_keeps_nothing_stale(self):
+        self._resolve_failing()
+        with mock.patch.object(slides.SlideShareService, 'generate_embed_code',
+                               return_value='<iframe></iframe>'):
+            embed = embeds.resolve_embed(models.Embed.KIND_SLIDES, self.slides_url)
+        self.assertEqual(models.Embed.STATE_RESOLVED, embed.state)
+        self.assertEqual(0, embed.failures)
+        self.assertIsNone(embed.retry_at)
+        self.assertEqual('<iframe></iframe>',
+                         embeds.get_embed_code(models.Embed.KIND_SLIDES, self.slides_url))
+
+    def test_list_failing(self):
+        self._resolve_failing()
+        out = StringIO.StringIO()
+        call_command('resolve_embeds', failing=True, stdout=out)
+        self.assertIn('slides {0}: 1 failure(s)'.format(self.slides_url), out.getvalue())
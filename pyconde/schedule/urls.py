@@ -14,6 +14,9 @@ urlpatterns = patterns('',
     url(r'^sessions/kind/(?P<pk>[^/]+)/$', views.sessions_by_kind, name='sessions_by_kind'),
     url(r'^events/(?P<pk>\d+)/$', views.view_sideevent, name='side_event'),
     url(r'^schedule/$', views.view_schedule, name='schedule'),
+    url(r'^api/schedule/$', views.schedule_api, name='schedule-api'),
+    url(r'^api/conflicts/$', views.conflicts_api, name='schedule-conflicts-api'),
+    url(r'^api/attendance/$', views.attendance_api, name='schedule-attendance-api'),
     url(r'^attendances/$', views.list_user_attendances, name='schedule-attendances'),
     url(r'^export/guidebook/(?P<kind>[^/.]+)/$', views.guidebook_export, name='guidebook-export'),
 )
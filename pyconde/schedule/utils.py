@@ -1,28 +1,44 @@
+import copy
+import functools
+import hashlib
 import itertools
+import logging
 import math
 import datetime
 import collections
+from operator import attrgetter
+
 from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db.models import Q
+from django.template.loader import render_to_string
 from django.utils.datastructures import SortedDict
+from django.utils.encoding import force_text
+from django.utils.safestring import mark_safe
 from django.utils.timezone import now
+from django.utils.translation import get_language
 
 from ..conference import models as conference_models
+from ..helpers.cache import get_or_compute
+from ..speakers import models as speaker_models
 
 from . import models
 
 from django.core.cache import cache
 
 
+LOG = logging.getLogger(__name__)
+
+
 def proposal_is_scheduled(proposal):
     """
     Checks if a given proposal already has a session associated with it.
 
     Warning: This internally caches the result for 10 seconds.
     """
-    proposal_pks = cache.get('proposal_pks_with_session')
-    if proposal_pks is None:
-        proposal_pks = set([o['proposal__pk'] for o in models.Session.objects.values('proposal__pk')])
-        cache.set('proposal_pks_with_session', proposal_pks, 10)
+    proposal_pks = get_or_compute('proposal_pks_with_session',
+        lambda: set([o['proposal__pk'] for o in models.Session.objects.values('proposal__pk')]),
+        10)
     return proposal.pk in proposal_pks
 
 
@@ -36,10 +52,17 @@ def create_schedule(row_duration=30, uncached=None, merge_sections=False):
         uncached = not getattr(settings, 'SCHEDULE_CACHE_SCHEDULE', True)
     conf = conference_models.current_conference()
     cache_key = 'schedule:{0}:{1}'.format(conf.pk, row_duration)
-    if not uncached:
-        result = cache.get(cache_key)
-        if result:
-            return result
+    if merge_sections:
+        cache_key += ':merged'
+    if uncached:
+        return mark_active_days(
+            _create_schedule(row_duration, merge_sections, uncached))
+    return mark_active_days(get_or_compute(cache_key,
+        functools.partial(_create_schedule, row_duration, merge_sections, uncached),
+        settings.SCHEDULE_CACHE_TIMEOUT))
+
+
+def _create_schedule(row_duration, merge_sections, uncached):
     result = SortedDict()
     if merge_sections:
         section_schedule = create_section_schedule(None,
@@ -50,27 +73,282 @@ def create_schedule(row_duration=30, uncached=None, merge_sections=False):
             section_schedule = create_section_schedule(section,
                 row_duration=row_duration, uncached=uncached)
             result[section] = section_schedule
-    if not uncached:
-        cache.set(cache_key, result, settings.SCHEDULE_CACHE_TIMEOUT)
     return result
 
 
+def get_schedule(row_duration=30, merge_sections=False):
+    """
+    Returns the schedule from the last complete snapshot (see
+    :func:`build_schedule_snapshot`). Only if no snapshot is available at
+    all, the schedule is created right away and a new snapshot requested.
+    """
+    return _get_schedule_snapshot(row_duration, merge_sections)[1]
+
+
+def _get_schedule_snapshot(row_duration, merge_sections):
+    """
+    Returns the version of the snapshot and the schedule in it. The version
+    is None if the schedule had to be created without a snapshot.
+    """
+    if not getattr(settings, 'SCHEDULE_CACHE_SCHEDULE', True):
+        return None, create_schedule(row_duration=row_duration,
+                                     merge_sections=merge_sections)
+    version = cache.get(_get_snapshot_key('current'))
+    if version is not None:
+        result = cache.get(_get_snapshot_key(version, row_duration, merge_sections))
+        if result is not None:
+            return version, mark_active_days(result)
+    request_schedule_snapshot()
+    return None, create_schedule(row_duration=row_duration,
+                                 merge_sections=merge_sections)
+
+
+def get_rendered_schedule(row_duration=30, merge_sections=False, sections=None):
+    """
+    Returns the schedule like :func:`get_schedule` but with the rendered
+    HTML of every day instead of its rows, optionally limited to the given
+    sections. The HTML of each day is cached per snapshot and language, so
+    the template only has to be rendered once the schedule changed. It must
+    therefore not depend on the current date: the active day is marked
+    by the page around it.
+    """
+    version, schedule = _get_schedule_snapshot(row_duration, merge_sections)
+    if sections:
+        schedule = SortedDict((section, grid) for section, grid in schedule.items()
+                              if section in sections)
+    language = get_language()
+    keys = {}
+    if version is not None:
+        for section, (locations, days) in schedule.items():
+            section_key = section.pk if isinstance(section, conference_models.Section) else section
+            for day in days:
+                keys[section, day.day] = ':'.join(map(force_text, (
+                    'schedule_fragment', settings.CONFERENCE_ID, version,
+                    section_key, day.day.isoformat(), row_duration, language)))
+    fragments = cache.get_many(keys.values())
+    rendered = {}
+    result = SortedDict()
+    for section, (locations, days) in schedule.items():
+        rendered_days = []
+        for day in days:
+            key = keys.get((section, day.day))
+            html = fragments.get(key)
+            if html is None:
+                html = render_to_string('schedule/plugins/day.html', {
+                    'section': section,
+                    'locations': locations,
+                    'day': day,
+                })
+                if key is not None:
+                    rendered[key] = html
+            rendered_days.append((day, mark_safe(html)))
+        result[section] = (locations, rendered_days)
+    if rendered:
+        cache.set_many(rendered, settings.SCHEDULE_CACHE_TIMEOUT)
+    return result
+
+
+def build_schedule_snapshot():
+    """
+    Creates the schedule for every row duration with and without merged
+    sections and stores them as a new snapshot version. Only once all of
+    them are stored, the pointer to the current version is updated so that
+    readers never see a partial snapshot. The previous version is kept
+    around for readers that already fetched the old pointer.
+
+    Returns the version number of the new snapshot or None if it could not
+    be created.
+    """
+    # Changes from now on require another snapshot
+    cache.delete(_get_snapshot_key('pending'))
+    version_key = _get_snapshot_key('version')
+    cache.add(version_key, 0, None)
+    try:
+        version = cache.incr(version_key)
+    except ValueError:
+        LOG.warning("The configured cache does not support schedule snapshots")
+        return None
+    snapshot_keys = _get_snapshot_keys(version)
+    # Snapshots expire, so that a stale one isn't served forever if a new
+    # one could not be built (e.g. without a running worker).
+    timeout = getattr(settings, 'SCHEDULE_SNAPSHOT_TIMEOUT', 3600)
+    for (row_duration, merge_sections), key in snapshot_keys.iteritems():
+        schedule = create_schedule(row_duration=row_duration,
+                                   merge_sections=merge_sections)
+        cache.set(key, schedule, timeout)
+
+    current_version = cache.get(_get_snapshot_key('current'))
+    if current_version is not None and current_version > version:
+        # A snapshot that was started later has already been completed.
+        cache.delete_many(snapshot_keys.values())
+        return current_version
+    previous_version = cache.get(_get_snapshot_key('previous'))
+    cache.set(_get_snapshot_key('current'), version, None)
+    LOG.debug("Schedule snapshot %s is now current", version)
+    if current_version is not None:
+        cache.set(_get_snapshot_key('previous'), current_version, None)
+    if previous_version is not None:
+        cache.delete_many(_get_snapshot_keys(previous_version).values())
+    return version
+
+
+def request_schedule_snapshot():
+    """
+    Queues the creation of a new schedule snapshot unless one is already
+    pending. The task is delayed by SCHEDULE_SNAPSHOT_DELAY seconds so that
+    multiple changes in a row only result in a single snapshot.
+    """
+    from . import tasks
+
+    if not getattr(settings, 'SCHEDULE_CACHE_SCHEDULE', True):
+        return
+    delay = getattr(settings, 'SCHEDULE_SNAPSHOT_DELAY', 5)
+    if cache.add(_get_snapshot_key('pending'), True, delay + settings.SCHEDULE_CACHE_TIMEOUT):
+        tasks.build_schedule_snapshot.apply_async(countdown=delay)
+
+
+def _get_snapshot_key(*parts):
+    return ':'.join(map(str, ('schedule_snapshot', settings.CONFERENCE_ID) + parts))
+
+
+def _get_snapshot_keys(version):
+    durations = dict(models.CompleteSchedulePlugin.ROW_DURATION_CHOICES).keys()
+    return dict(
+        ((row_duration, merge_sections), _get_snapshot_key(version, row_duration, merge_sections))
+        for row_duration, merge_sections in itertools.product(durations, (False, True)))
+
+
+def get_schedule_version():
+    """
+    Returns the content version of the schedule, which is the time of the
+    last change to any session, side event or other data shown on the
+    schedule pages.
+    """
+    key = _get_version_key()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, now(), None)
+        version = cache.get(key) or now()
+    return version
+
+
+def bump_schedule_version():
+    cache.set(_get_version_key(), now(), None)
+
+
+def _get_version_key():
+    return 'schedule_version:{0}'.format(settings.CONFERENCE_ID)
+
+
+def get_schedule_etag(request, *args, **kwargs):
+    """
+    ETag of schedule pages. Next to the content version this depends on
+    the current date (for the active day), the requested URL and language
+    as well as the session and CSRF cookies, as pages show user specific
+    data. This does not touch the database.
+    """
+    data = u':'.join([
+        get_schedule_version().isoformat(),
+        now().date().isoformat(),
+        request.get_full_path(),
+        get_language() or u'',
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME, u''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, u''),
+    ])
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+def get_schedule_last_modified(request, *args, **kwargs):
+    """
+    Last-Modified of schedule pages. This is only provided for requests
+    without a session, since the pages of users with a session might
+    change without a new content version (e.g. after logging in or out).
+    Pages are considered modified at midnight as well, when the active day
+    changes.
+    """
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return None
+    today = now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(get_schedule_version(), today)
+
+
 def create_section_schedule(section, row_duration=30, uncached=False):
     """
     Creates a schedule for a given section.
 
+    The schedule is assembled day by day from the section's interval model
+    (see :func:`get_section_cells`). Every day is cached on its own so that
+    changing a single event only requires the days it touches to be rebuilt.
+
     @param section section for which the schedule should be generated.
     @param row_duration number of minutes a single row should represent
     """
-    if section is None:
-        schedule_cache_key = 'section_schedule:__merged__:{0}'.format(row_duration)
+    if uncached:
+        result = _create_section_schedule(section, row_duration, uncached)
     else:
-        schedule_cache_key = 'section_schedule:{0}:{1}'.format(section.pk, row_duration)
+        schedule_cache_key = 'section_schedule:{0}:{1}'.format(
+            _get_section_name(section), row_duration)
+        result = get_or_compute(schedule_cache_key,
+            functools.partial(_create_section_schedule, section, row_duration, uncached),
+            settings.SCHEDULE_CACHE_TIMEOUT)
+    if result:
+        _mark_active_day(result[1])
+    return result
 
-    if not uncached:
-        section_schedule = cache.get(schedule_cache_key)
+
+def _create_section_schedule(section, row_duration, uncached):
+    section_name = _get_section_name(section)
+    cells = get_section_cells(section, uncached=uncached)
+    if not cells:
+        return {}
+
+    locations = _get_cell_locations(cells.values())
+    days = []
+    for day, day_cells in _group_cells_by_day(cells.values()):
+        section_day = _get_section_day(section_name, day, day_cells,
+                                       locations, row_duration, uncached)
+        if section_day.rows:
+            days.append(section_day)
+    return (locations, days)
+
+
+def mark_active_days(schedule):
+    """
+    Marks the current day (or the first one) of every section of the given
+    schedule as active. As this depends on the date, it is done whenever a
+    schedule is read instead of when it is built and cached.
+    """
+    for section_schedule in schedule.values():
         if section_schedule:
-            return section_schedule
+            _mark_active_day(section_schedule[1])
+    return schedule
+
+
+def _mark_active_day(days):
+    today = now().date()
+    has_active = False
+    for day in days:
+        day.active = (day.day == today)
+        if day.active:
+            has_active = True
+    if days and not has_active:
+        days[0].active = True
+
+
+def get_section_cells(section, uncached=False):
+    """
+    Returns the interval model of a section: a dict mapping event keys
+    (see :meth:`GridCell.repr`) to prepared cells for all events that are
+    part of the section's schedule.
+
+    The model is cached independently of the row duration and is patched by
+    :func:`update_section_cells` whenever an event changes.
+    """
+    cache_key = 'section_cells:{0}'.format(_get_section_name(section))
+    if not uncached:
+        cells = cache.get(cache_key)
+        if cells is not None:
+            return cells
 
     if section is None:
         sessions = models.Session.objects
@@ -79,77 +357,255 @@ def create_section_schedule(section, row_duration=30, uncached=False):
         sessions = section.sessions
         side_events = section.side_events
 
-    sessions = sessions.select_related('audience_level',
-                                       'track',
-                                       'kind',
-                                       'speaker__user',
-                                       'conference') \
-                       .prefetch_related('additional_speakers__user',
-                                         'location') \
-                       .filter(released=True, start__isnull=False, end__isnull=False) \
-                       .order_by('start') \
-                       .all()
-    side_events = side_events.prefetch_related('location') \
-                             .filter(start__isnull=False, end__isnull=False) \
-                             .order_by('start') \
-                             .all()
-
-    evt_cache = {}
+    cells = _load_cells(
+        sessions.filter(released=True, start__isnull=False, end__isnull=False),
+        side_events.filter(start__isnull=False, end__isnull=False))
 
-    locations = set()
-    start_time = None
-    end_time = None
-    for session in sessions:
-        start_time = session.start if start_time is None else min(start_time, session.start)
-        end_time = session.end if end_time is None else max(end_time, session.end)
-        if session.is_global:
+    if not uncached:
+        cache.set(cache_key, cells, settings.SCHEDULE_CACHE_TIMEOUT)
+    return cells
+
+
+def update_section_cells(evt, removed=False):
+    """
+    Patches the cached interval models of all sections with the current
+    state of the given event and drops the cached days it was or is now
+    part of.
+
+    Returns the names of all sections whose schedule might have changed.
+    If the event's cell did not change in a section, neither the section
+    nor any of its days are invalidated. Sections whose interval model is
+    not cached are always considered changed.
+    """
+    evt_key = _get_event_key(evt)
+    cell = None
+    if not removed:
+        cell = _prepare_cell_for_interval_model(evt)
+    section_names = list(conference_models.Section.objects.values_list('pk', flat=True))
+    section_names.append('__merged__')
+    durations = dict(models.CompleteSchedulePlugin.ROW_DURATION_CHOICES).keys()
+    changed_sections = []
+    for section_name in section_names:
+        cache_key = 'section_cells:{0}'.format(section_name)
+        cells = cache.get(cache_key)
+        if cells is None:
+            changed_sections.append(section_name)
             continue
-        locations |= set(session.location.all())
-    for evt in side_events:
-        start_time = evt.start if start_time is None else min(start_time, evt.start)
-        end_time = evt.end if end_time is None else max(end_time, evt.end)
+        old_cell = cells.pop(evt_key, None)
+        new_cell = None
+        if cell is not None and (section_name == '__merged__' or section_name == evt.section_id):
+            new_cell = cell
+            cells[evt_key] = new_cell
+        if old_cell is None and new_cell is None:
+            continue
+        if old_cell is not None and new_cell is not None \
+                and old_cell.__getstate__() == new_cell.__getstate__():
+            continue
+        changed_sections.append(section_name)
+        affected_days = set(c.start.date() for c in (old_cell, new_cell) if c is not None)
+        cache.set(cache_key, cells, settings.SCHEDULE_CACHE_TIMEOUT)
+        cache.delete_many([
+            'section_schedule_day:{0}:{1}:{2}'.format(section_name, day.isoformat(), duration)
+            for day, duration in itertools.product(affected_days, durations)])
+        LOG.debug("Patched interval model of section %s for %s (days: %s)",
+                  section_name, evt_key, affected_days)
+    return changed_sections
+
+
+def _get_section_name(section):
+    return '__merged__' if section is None else section.pk
+
+
+def _get_event_key(evt):
+    type_ = 'session' if isinstance(evt, models.Session) else 'side'
+    return '{0}:{1}'.format(type_, evt.pk)
+
+
+def _prepare_cell_for_interval_model(evt):
+    """
+    Reloads the given event and returns it as cell or None if it should not
+    be part of any schedule.
+    """
+    if isinstance(evt, models.Session):
+        sessions = models.Session.objects.filter(pk=evt.pk, released=True)
+        side_events = models.SideEvent.objects.none()
+    else:
+        sessions = models.Session.objects.none()
+        side_events = models.SideEvent.objects.filter(pk=evt.pk)
+    cells = _load_cells(sessions.filter(start__isnull=False, end__isnull=False),
+                        side_events.filter(start__isnull=False, end__isnull=False))
+    return cells.get(_get_event_key(evt))
+
+
+def _load_cells(sessions, side_events):
+    """
+    Creates cells for all the given sessions and side events. Instead of
+    loading the event models including their relations, all the data
+    required for rendering is fetched with a fixed number of queries into
+    maps keyed by the respective event's pk.
+    """
+    session_values = list(sessions.values(
+        'pk', 'title', 'start', 'end', 'is_global', 'language', 'speaker_id',
+        'kind__slug', 'track__name', 'audience_level__name',
+        'audience_level__level'))
+    side_event_values = list(side_events.values(
+        'pk', 'name', 'start', 'end', 'is_global', 'is_pause', 'icon'))
+    cells = {}
+    if not session_values and not side_event_values:
+        return cells
+
+    session_pks = sessions.values('pk')
+    session_locations = _load_location_map(
+        models.Session.location.through.objects.filter(session__in=session_pks),
+        'session_id')
+    side_event_locations = _load_location_map(
+        models.SideEvent.location.through.objects.filter(sideevent__in=side_events.values('pk')),
+        'sideevent_id')
+
+    additional_speakers = collections.defaultdict(list)
+    for session_pk, speaker_pk in models.Session.additional_speakers.through.objects \
+            .filter(session__in=session_pks) \
+            .order_by('pk') \
+            .values_list('session_id', 'speaker_id'):
+        additional_speakers[session_pk].append(speaker_pk)
+    speaker_names = dict(
+        (speaker.pk, unicode(speaker)) for speaker in
+        speaker_models.Speaker.objects.select_related('user').filter(
+            Q(sessions__in=session_pks) | Q(session_participations__in=session_pks)
+        ).distinct())
+
+    languages = dict(models.Session._meta.get_field('language').flatchoices)
+    session_url = _get_url_template('session', 'session_pk')
+    side_event_url = _get_url_template('side_event', 'pk')
+
+    for values in session_values:
+        cell = _create_cell('session', values, session_locations, session_url)
+        cell.type = 'session'
+        cell.name = values['title']
+        cell.session_kind = values['kind__slug']
+        speaker_pks = additional_speakers.get(values['pk'], [])
+        if values['speaker_id']:
+            speaker_pks = [values['speaker_id']] + speaker_pks
+        cell.speakers = tuple(speaker_names[pk] for pk in speaker_pks)
+        cell.track_name = values['track__name']
+        if values['audience_level__name'] is not None:
+            cell.level_name = values['audience_level__name']
+            cell.level = values['audience_level__level']
+        if values['language']:
+            cell.language = force_text(languages.get(values['language'], values['language']))
+        cells[cell.key] = cell
+    for values in side_event_values:
+        cell = _create_cell('side', values, side_event_locations, side_event_url)
+        cell.type = 'sideevent'
+        cell.name = values['name']
+        cell.is_pause = values['is_pause']
+        cell.icon = values['icon']
+        cells[cell.key] = cell
+    return cells
+
+
+def _create_cell(type_, values, locations, url):
+    cell = GridCell(None, None)
+    cell.key = '{0}:{1}'.format(type_, values['pk'])
+    cell.pk = values['pk']
+    cell.url = url.format(values['pk'])
+    cell.start = values['start']
+    cell.end = values['end']
+    cell.is_global = values['is_global']
+    cell.location = tuple(locations.get(values['pk'], ()))
+    return cell
+
+
+def _load_location_map(through_qs, event_field):
+    """
+    Returns a dict mapping event pks to the grid locations of the events
+    based on the given queryset of the location relation.
+    """
+    result = collections.defaultdict(list)
+    for event_pk, pk, name, order in through_qs.order_by('pk').values_list(
+            event_field, 'location_id', 'location__name', 'location__order'):
+        result[event_pk].append(GridLocation(pk, name, order))
+    return result
+
+
+def _get_url_template(viewname, kwarg):
+    """
+    Reverses the given view only once and returns a format string for
+    generating the URLs of all events.
+    """
+    placeholder = '9999999999'
+    url = reverse(viewname, kwargs={kwarg: placeholder})
+    return url.replace('{', '{{').replace('}', '}}').replace(placeholder, '{0}')
+
+
+def _get_cell_locations(cells):
+    locations = set()
+    for cell in cells:
         # Global events span all session locations and therefor the location
         # should not be included in the columns list
-        if evt.is_global:
+        if cell.is_global:
             continue
-        locations |= set(evt.location.all())
-    locations = sorted(locations, cmp=lambda a, b: a.order - b.order)
+        locations |= set(cell.location)
+    return sorted(locations, key=attrgetter('order'))
+
 
+def _group_cells_by_day(cells):
     # This allows overriding sessions (e.g. posters) with side events in the
     # schedule table but still have them listed in the general lists.
-    events = sorted(itertools.chain(sessions, side_events),
-        cmp=_evt_start_cmp)
+    cells = sorted(cells, key=_cell_sort_key)
+    return [(day, list(day_cells)) for day, day_cells
+            in itertools.groupby(cells, lambda c: c.start.date())]
+
+
+def _cell_sort_key(cell):
+    return (cell.start, 0 if cell.type == 'session' else 1, cell.pk)
 
-    if not events:
-        return {}
+
+def _get_section_day(section_name, day, cells, locations, row_duration, uncached=False):
+    """
+    Returns the SectionDay for the given cells. As the layout of a day also
+    depends on the columns of the whole section, the cached day is only
+    used if it was created for the same set of locations and by the same
+    layout builder.
+    """
+    cache_key = 'section_schedule_day:{0}:{1}:{2}'.format(section_name, day.isoformat(), row_duration)
+    layout = getattr(settings, 'SCHEDULE_LAYOUT', 'grid')
+    locations_signature = (layout,) + tuple(loc.pk for loc in locations)
+    if not uncached:
+        cached = cache.get(cache_key)
+        if cached is not None and cached[0] == locations_signature:
+            return cached[1]
+    section_day = LAYOUT_BUILDERS[layout](day, cells, locations, row_duration)
+    if not uncached:
+        cache.set(cache_key, (locations_signature, section_day), settings.SCHEDULE_CACHE_TIMEOUT)
+    return section_day
+
+
+def _create_section_day(day, cells, locations, row_duration):
+    """
+    Creates the rows of a single day out of the (sorted) cells of events
+    starting on that day.
+    """
+    start_time = min(c.start for c in cells)
+    end_time = max(c.end for c in cells)
 
     # As a first step we build a grid with the respective row start time as
     # key and fill it with events starting at that time.
     grid = _create_base_grid(start_time, end_time, row_duration)
-    for evt in events:
-        cell = GridCell(evt, int((evt.end - evt.start).total_seconds() / (row_duration * 60)))
-        evt_cache[repr(cell)] = cell
-        grid[evt.start].append(cell)
+    for prepared_cell in cells:
+        cell = copy.copy(prepared_cell)
+        cell.rowspan = int((cell.end - cell.start).total_seconds() / (row_duration * 60))
+        grid[cell.start].append(cell)
 
     # Convert this grid into a list of grid rows sorted by the row's start time.
-    new_grid = []
+    rows = []
     for k, v in grid.iteritems():
-        new_grid.append(GridRow(k, k + datetime.timedelta(0, row_duration * 60), v))
-    new_grid.sort(cmp=lambda a, b: cmp(a.start, b.start))
+        rows.append(GridRow(k, k + datetime.timedelta(0, row_duration * 60), v))
+    rows.sort(key=attrgetter('start'))
 
-    # Split the whole section grid into days
-    current_day = None
-    days = []
     prev_row = None
-    for row in new_grid:
+    for row in rows:
         _pad_row_for_locations(row, prev_row, locations)
-
-        if current_day is None:
-            current_day = SectionDay(row.start.date(), [])
-        elif current_day.day < row.start.date():
-            days.append(current_day)
-            current_day = SectionDay(row.start.date(), [])
-        current_day.rows.append(row)
         # Propagate pause rows if necessary
         if prev_row is not None:
             if prev_row.is_pause_row() and not row.events:
@@ -158,26 +614,140 @@ def create_section_schedule(section, row_duration=30, uncached=False):
                 if prev_row.pause_until is not None and prev_row.pause_until >= row.end:
                     row.pause = True
                     row.pause_until = prev_row.pause_until
-
         prev_row = row
-    if current_day and current_day.rows:
-        days.append(current_day)
+
     # Strip out heading and tailing empty rows
-    has_active = False
-    for day in days:
-        day.rows = _strip_empty_rows(day.rows)
-        day.rows = _merge_adjacent_row_cells(day.rows)
-        if day.active:
-            has_active = True
-    if days and not has_active:
-        days[0].active = True
+    rows = _strip_empty_rows(rows)
+    rows = _merge_adjacent_row_cells(rows)
+    return SectionDay(day, rows)
 
-    if not uncached:
-        cache.set(schedule_cache_key, (locations, days), settings.SCHEDULE_CACHE_TIMEOUT)
-    return (locations, days)
+
+def _create_section_day_sweepline(day, cells, locations, row_duration):
+    """
+    Alternative to :func:`_create_section_day` which sweeps once over the
+    (sorted) cells of a day instead of building a grid of all row intervals
+    first and stripping and merging it afterwards.
+
+    Rows are only created from the first event's start up to the last one's
+    end, rowspans and colspans are assigned while sweeping. If an event
+    starts in a room that is still occupied by another event, the earlier
+    event is cut off at that row so that the table stays rectangular.
+    """
+    row_seconds = row_duration * 60
+    step = datetime.timedelta(0, row_seconds)
+    day_start = cells[0].start
+    end_time = max(c.end for c in cells)
+
+    starting = collections.defaultdict(list)
+    for prepared_cell in cells:
+        cell = copy.copy(prepared_cell)
+        cell.rowspan = int((cell.end - cell.start).total_seconds() / row_seconds)
+        starting[int((cell.start - day_start).total_seconds()) // row_seconds].append(cell)
+
+    # Start row index and (if cut off) effective end of every placed event
+    started_at = {}
+    cut_at = {}
+    rows = []
+    last_idx = -1
+    rows_until = None
+    prev_row = None
+    idx = 0
+    row_start = day_start
+    while row_start < end_time:
+        row = GridRow(row_start, row_start + step, starting.get(idx, []))
+        for cell in row.events:
+            started_at[cell.key] = (idx, cell)
+            if rows_until is None or cell.end > rows_until:
+                rows_until = cell.end
+        if prev_row is not None:
+            for loc, cell in row.event_by_location.iteritems():
+                prev_cell = _get_previous_cell(prev_row, loc)
+                if prev_cell is not None and _get_cell_end(prev_cell, cut_at) > row_start:
+                    prev_idx, prev_owner = started_at[prev_cell.key]
+                    prev_owner.rowspan = idx - prev_idx
+                    cut_at[prev_cell.key] = row_start
+
+        if not row.contains_global:
+            for loc in locations:
+                if loc in row.event_by_location:
+                    continue
+                prev_cell = _get_previous_cell(prev_row, loc)
+                if prev_cell is None or _get_cell_end(prev_cell, cut_at) <= row_start:
+                    filler = GridCell(None, 1)
+                    filler.start = row.start
+                    filler.end = row.end
+                else:
+                    filler = copy.copy(prev_cell)
+                    filler.rowspan = 1
+                    filler.colspan = 1
+                filler.location = (loc,)
+                filler.is_filler = True
+                row.event_by_location[loc] = filler
+            row.reorder_by_location(locations)
+
+        # Combine adjacent cells of the same event
+        merged = []
+        for cell in row.cells:
+            if merged and merged[-1] is cell:
+                cell.colspan += 1
+            else:
+                merged.append(cell)
+        row.cells = merged
+
+        if prev_row is not None and prev_row.is_pause_row() and not row.events:
+            if prev_row.events:
+                prev_row.pause_until = prev_row.events[0].end
+            if prev_row.pause_until is not None and prev_row.pause_until >= row.end:
+                row.pause = True
+                row.pause_until = prev_row.pause_until
+
+        if row.events or row.end <= rows_until:
+            last_idx = idx
+        rows.append(row)
+        prev_row = row
+        idx += 1
+        row_start += step
+    return SectionDay(day, rows[:last_idx + 1])
+
+
+def _get_previous_cell(prev_row, location):
+    """
+    Returns the non-empty cell covering the given location in the previous
+    row or None.
+    """
+    if prev_row is None:
+        return None
+    cell = prev_row.event_by_location.get(location, None)
+    if cell is None and prev_row.is_global_row():
+        cell = prev_row.events[0]
+    if cell is None or cell.is_empty:
+        return None
+    return cell
+
+
+def _get_cell_end(cell, cut_at):
+    return cut_at.get(cell.key, cell.end)
+
+
+LAYOUT_BUILDERS = {
+    'grid': _create_section_day,
+    'sweepline': _create_section_day_sweepline,
+}
 
 
 class GridRow(object):
+    """
+    A row within a day's schedule grid covering the time between start and
+    end.
+
+    ``event_by_location`` is only required while the grid is built and is
+    therefor not part of the cached state of a row.
+    """
+
+    __slots__ = ('start', 'end', 'events', 'cells', 'pause', 'pause_until',
+                 'event_by_location')
+    _state_slots = ('start', 'end', 'events', 'cells', 'pause', 'pause_until')
+
     def __init__(self, start, end, events):
         self.start = start
         self.end = end
@@ -187,11 +757,17 @@ class GridRow(object):
         self.event_by_location = {}
         self.cells = events
         for evt in events:
-            if not evt.event or not evt.event.location:
-                continue
-            for loc in evt.event.location.all():
+            for loc in evt.location or []:
                 self.event_by_location[loc] = evt
 
+    def __getstate__(self):
+        return tuple(getattr(self, attr) for attr in self._state_slots)
+
+    def __setstate__(self, state):
+        for attr, value in zip(self._state_slots, state):
+            setattr(self, attr, value)
+        self.event_by_location = {}
+
     def is_pause_row(self):
         if self.pause is not None:
             return self.pause
@@ -233,18 +809,36 @@ class GridRow(object):
         return (c for c in self.cells if c.is_empty or not c.is_filler)
 
 
+GridLocation = collections.namedtuple('GridLocation', 'pk name order')
+
+
+def _get_grid_location(location):
+    return GridLocation(location.pk, location.name, location.order)
+
+
 class GridCell(object):
     """
     A cell prepresents an element within a row that can either be an actual
     event or a placeholder for an event in the same room that hasn't yet ended
     or a completely empty placeholder.
+
+    Cells are part of the cached schedule and therefor only hold the data
+    required for rendering them. The event itself is only referenced by its
+    key (see :meth:`repr`).
     """
 
+    __slots__ = ('key', 'pk', 'is_filler', 'rowspan', 'colspan', 'speakers',
+                 'track_name', 'name', 'url', 'is_global', 'is_pause',
+                 'start', 'end', 'level', 'level_name', 'language',
+                 'location', 'icon', 'type', 'session_kind')
+
     def __init__(self, event, rowspan, colspan=1):
+        self.key = None
+        self.pk = None
         self.is_filler = False
         self.rowspan = rowspan
         self.colspan = colspan
-        self.speakers = []
+        self.speakers = ()
         self.track_name = None
         self.name = None
         self.url = ""
@@ -255,47 +849,64 @@ class GridCell(object):
         self.level = 0
         self.level_name = None
         self.language = None
-        self.location = event.location if event else None
+        self.location = None
         self.icon = None
-        if isinstance(self.location, conference_models.Location):
-            self.location = [self.location]
-        elif hasattr(self.location, 'all'):
-            self.location = self.location.all()
-        self.event = None
         self.type = None
         self.session_kind = None
         if event is not None:
-            self.event = event
+            location = event.location
+            if isinstance(location, conference_models.Location):
+                location = [location]
+            elif hasattr(location, 'all'):
+                location = location.all()
+            self.location = tuple(_get_grid_location(loc) for loc in location)
+            self.pk = event.pk
             if hasattr(event, 'get_absolute_url'):
                 self.url = event.get_absolute_url()
             self.start = event.start
             self.end = event.end
             if isinstance(event, models.Session):
+                self.key = 'session:{0}'.format(event.pk)
                 self.name = event.title
                 self.type = 'session'
-                self.session_kind = self.event.kind.slug if self.event.kind else None
+                self.session_kind = event.kind.slug if event.kind else None
                 self.is_global = event.is_global
+                speakers = []
                 if event.speaker:
-                    self.speakers.append(unicode(event.speaker))
+                    speakers.append(unicode(event.speaker))
                 for speaker in event.additional_speakers.all():  # .select_related('user__profile')
-                    self.speakers.append(unicode(speaker))
+                    speakers.append(unicode(speaker))
+                self.speakers = tuple(speakers)
                 if event.track:
                     self.track_name = event.track.name
                 if event.audience_level:
                     self.level_name = event.audience_level.name
                     self.level = event.audience_level.level
                 if event.language:
-                    self.language = event.get_language_display()
+                    self.language = unicode(event.get_language_display())
             else:
+                self.key = 'side:{0}'.format(event.pk)
                 self.type = 'sideevent'
                 self.is_global = event.is_global
                 self.is_pause = event.is_pause
                 self.icon = event.icon
                 self.name = event.name
 
+    def __getstate__(self):
+        return tuple(getattr(self, attr) for attr in self.__slots__)
+
+    def __setstate__(self, state):
+        for attr, value in zip(self.__slots__, state):
+            setattr(self, attr, value)
+
+    def __copy__(self):
+        cell = GridCell.__new__(GridCell)
+        cell.__setstate__(self.__getstate__())
+        return cell
+
     @property
     def is_empty(self):
-        return self.is_filler and not self.event
+        return self.is_filler and not self.key
 
     def __str__(self):
         if self.is_empty:
@@ -303,20 +914,28 @@ class GridCell(object):
         elif self.is_filler:
             return '<GridCell FILLER location=%s>' % (self.location,)
         else:
-            return '<GridCell location=%s start=%s end=%s evt=%s>' % (self.location, self.start, self.end, self.event)
+            return '<GridCell location=%s start=%s end=%s evt=%s>' % (self.location, self.start, self.end, self.key)
 
     __repr__ = __str__
 
     def repr(self):
-        type_ = 'session' if isinstance(self.event, models.Session) else 'side'
-        return '{0}:{1}'.format(type_, self.event.pk)
+        return self.key
 
 
 class SectionDay(object):
+    __slots__ = ('day', 'rows', 'active')
+
     def __init__(self, day, rows):
         self.day = day
         self.rows = rows
-        self.active = (self.day == now().date())
+        # Set when the schedule is read, see mark_active_days()
+        self.active = False
+
+    def __getstate__(self):
+        return (self.day, self.rows, self.active)
+
+    def __setstate__(self, state):
+        self.day, self.rows, self.active = state
 
 
 def _create_base_grid(start_time, end_time, row_duration):
@@ -345,10 +964,6 @@ def _evt_start_cmp(a, b):
     return int((a.start - b.start).total_seconds())
 
 
-def _gridcell_location_cmp(a, b):
-    return a.event.location.order - b.event.location.order
-
-
 def _strip_empty_rows(rows):
     """
     Removes empty rows at the end and beginning of the rows collections and
@@ -367,9 +982,9 @@ def _strip_empty_rows(rows):
                     rows_until = evt.end
         if last_idx_with_events is not None and not row.events and row.end <= rows_until:
             last_idx_with_events = idx
-    if not first_idx_with_events:
+    if first_idx_with_events is None:
         first_idx_with_events = 0
-    if not last_idx_with_events:
+    if last_idx_with_events is None:
         last_idx_with_events = first_idx_with_events - 1
     return rows[first_idx_with_events:last_idx_with_events + 1]
 
@@ -396,12 +1011,14 @@ def _pad_row_for_locations(row, prev_row, locations):
             elif prev_event.end <= row.start:
                 filler = GridCell(None, 1)
             else:
-                filler = GridCell(prev_event, 1)
+                filler = copy.copy(prev_event)
+                filler.rowspan = 1
+                filler.colspan = 1
             if not filler.start:
                 filler.start = row.start
             if not filler.end:
                 filler.end = row.end
-            filler.location = location
+            filler.location = (location,)
             filler.is_filler = True
             row.event_by_location[location] = filler
     row.reorder_by_location(locations)
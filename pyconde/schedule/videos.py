@@ -6,9 +6,10 @@ session page.
 import abc
 import urllib
 import logging
-import requests
 import re
 
+from ..helpers import http
+
 
 LOG = logging.getLogger(__name__)
 
@@ -34,7 +35,7 @@ class OEmbedSupportingVideoService(VideoService):
 
     def generate_embed_code(self, url):
         oembed_url = self.generate_oembed_url(url)
-        resp = requests.get(oembed_url).json()
+        resp = http.get(oembed_url).json()
         return resp['html']
 
 
@@ -69,7 +70,7 @@ class PyVideoService(VideoService):
         video_id = self.get_video_id(url)
         if video_id is None:
             return None
-        data = requests.get('http://pyvideo.org/api/v1/video/{0}/'.format(video_id)).json
+        data = http.get('http://pyvideo.org/api/v1/video/{0}/'.format(video_id)).json()
 
         # pyvideos is used as front for some other service like YouTube, use
         # the embed-code from the source.
@@ -82,6 +83,10 @@ class PyVideoService(VideoService):
 _SERVICES = [YouTubeService(), PyVideoService()]
 
 
+def is_supported(url):
+    return any(service.matches_link(url) for service in _SERVICES)
+
+
 def generate_embed_code(url):
     for service in _SERVICES:
         if service.matches_link(url):
@@ -1,22 +1,25 @@
 # -*- encoding: utf-8 -*-
+import json
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.http import (HttpResponseRedirect, HttpResponse,
-    HttpResponseBadRequest)
+    HttpResponseBadRequest, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import condition, require_POST
 
 from ..proposals import models as proposal_models
 from ..conference import models as conference_models
 from ..utils import create_403
 
+from . import api
+from . import attendance
+from . import conflicts
 from . import models
 from . import utils
 from . import forms
@@ -25,16 +28,67 @@ from . import exporters
 from .exceptions import AttendingError
 
 
+#: Responds with "304 Not Modified" if the schedule didn't change since the
+#: client's last request before the view itself is called.
+schedule_condition = condition(etag_func=utils.get_schedule_etag,
+                               last_modified_func=utils.get_schedule_last_modified)
+
+
+@schedule_condition
 def view_schedule(request):
     return TemplateResponse(
         request=request,
         context={
-            'schedule': utils.create_schedule(row_duration=15, merge_sections=True)
+            'schedule': utils.get_rendered_schedule(row_duration=15, merge_sections=True)
         },
         template='schedule/schedule.html'
     )
 
 
+@schedule_condition
+def schedule_api(request):
+    """
+    Returns all public events of the schedule as JSON. If a ``since``
+    version is given, only events changed after that version are returned.
+    """
+    since = request.GET.get('since')
+    if since is None:
+        data = api.get_schedule_data()
+    else:
+        try:
+            since = int(since)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid version %s' % since)
+        data = api.get_schedule_delta(since)
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+@login_required
+def conflicts_api(request):
+    """
+    Lists double-booked speakers, rooms and attendees for schedule planners.
+    """
+    if not request.user.has_perm('schedule.change_session'):
+        raise PermissionDenied()
+    schedule_conflicts = conflicts.ScheduleConflicts()
+
+    def _serialize(found, key_func):
+        return [{'key': key_func(conflict.key),
+                 'events': [api.serialize_event(conflict.first),
+                            api.serialize_event(conflict.second)]}
+                for conflict in found]
+
+    data = {
+        'speakers': _serialize(schedule_conflicts.speaker_conflicts(),
+                               lambda speaker: speaker.display_name),
+        'rooms': _serialize(schedule_conflicts.room_conflicts(),
+                            lambda location: location.pk),
+        'attendees': _serialize(schedule_conflicts.attendee_conflicts(),
+                                lambda user_pk: user_pk),
+    }
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
 def session_by_proposal(request, proposal_pk):
     """
     Redirects to a session page based on the given proposal pk or presents
@@ -55,6 +109,7 @@ def session_by_proposal(request, proposal_pk):
         )
 
 
+@schedule_condition
 def sessions_by_tag(request, tag):
     """
     Lists all talks with a given tag on a single page.
@@ -74,6 +129,7 @@ def sessions_by_tag(request, tag):
     )
 
 
+@schedule_condition
 def sessions_by_location(request, pk):
     """
     Lists all talks with a given tag on a single page.
@@ -94,6 +150,7 @@ def sessions_by_location(request, pk):
     )
 
 
+@schedule_condition
 def sessions_by_kind(request, pk):
     """
     Lists all talks with a given tag on a single page.
@@ -114,12 +171,14 @@ def sessions_by_kind(request, pk):
     )
 
 
+@schedule_condition
 def view_session(request, session_pk):
     """
     Renders all information available about a session.
     """
     session = get_object_or_404(models.Session, pk=session_pk, released=True)
     tags = list(session.tags.all())
+    user_attendance = attendance.get_attendance(request.user, [session])
     return TemplateResponse(
         request=request,
         context={
@@ -130,13 +189,14 @@ def view_session(request, session_pk):
             'can_edit': utils.can_edit_session(request.user, session),
             'can_admin': request.user.has_perm('schedule.change_session'),
             'attending_possible': settings.SCHEDULE_ATTENDING_POSSIBLE,
-            'is_attending': session.is_attending(request.user),
-            'has_free_seats': session.has_free_seats(),
+            'is_attending': user_attendance.is_attending(session),
+            'has_free_seats': user_attendance.has_free_seats(session),
         },
         template='schedule/session.html'
     )
 
 
+@schedule_condition
 def view_sideevent(request, pk):
     """
     Shows details of a specific side event.
@@ -204,6 +264,19 @@ def attend_session(request, session_pk, attending):
     return HttpResponseRedirect(session.get_absolute_url())
 
 
+@login_required
+def attendance_api(request):
+    """
+    Returns the sessions the current user attends, so that the globally
+    cached schedule can be personalized on the client.
+    """
+    session_ids = attendance.get_attendance(request.user).session_ids
+    response = HttpResponse(json.dumps({'attending': sorted(session_ids)}),
+                            content_type='application/json')
+    response['Cache-Control'] = 'private'
+    return response
+
+
 @login_required
 def list_user_attendances(request):
     """
@@ -231,7 +304,11 @@ def guidebook_export(request, kind):
     """
     if not request.user.has_perm('accounts.export_guidebook'):
         raise PermissionDenied
+    return _guidebook_export(request, kind)
+
 
+@schedule_condition
+def _guidebook_export(request, kind):
     exporter_classes = {
         # 'sections': exporters.GuidebookExporterSections,
         'sessions': exporters.GuidebookExporterSessions,
@@ -244,11 +321,9 @@ def guidebook_export(request, kind):
     if exporter_class is None:
         return HttpResponseBadRequest('Invalid exporter %s' % kind)
 
-    cache_key = 'schedule:guidebook:%s' % kind
-    data = cache.get(cache_key, None)
-    if not data:
-        data = exporter_class()().csv
-        cache.set(cache_key, data)
-    response = HttpResponse(data, content_type='text/csv')
+    # Not cached: the CSV is streamed instead of being built in memory, and
+    # clients with an up-to-date copy get a 304 from schedule_condition.
+    response = StreamingHttpResponse(exporter_class().iter_csv(),
+                                     content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="%s.csv"' % kind
     return response
@@ -1,5 +1,6 @@
 import os
 
+from datetime import timedelta
 from email.utils import parseaddr
 from configurations import Configuration, values
 
@@ -336,6 +337,28 @@ class Base(Configuration):
     SCHEDULE_ATTENDING_POSSIBLE = values.ListValue(['training'])
     SCHEDULE_CACHE_SCHEDULE = values.BooleanValue(True)
     SCHEDULE_CACHE_TIMEOUT = values.IntegerValue(300)
+    # Either 'grid' or 'sweepline'. See pyconde.schedule.utils.LAYOUT_BUILDERS
+    SCHEDULE_LAYOUT = values.Value('grid')
+    # Seconds to wait after a change before creating a new schedule snapshot
+    SCHEDULE_SNAPSHOT_DELAY = values.IntegerValue(5)
+    # Seconds a schedule snapshot is kept before it has to be built again,
+    # see 'rebuild-schedule-snapshot' in CELERYBEAT_SCHEDULE
+    SCHEDULE_SNAPSHOT_TIMEOUT = values.IntegerValue(3600)
+    # Days the full log of schedule changes is kept for delta syncs, older
+    # entries are reduced to the latest change of each event
+    SCHEDULE_CHANGE_RETENTION_DAYS = values.IntegerValue(30)
+    # Times of the proposal timeslots (morning and afternoon) used by the
+    # schedule solver and the minutes sessions starts are aligned to
+    SCHEDULE_SOLVER_TIMESLOTS = values.DictValue({
+        1: ('09:00', '12:30'),
+        2: ('13:30', '18:00'),
+    })
+    SCHEDULE_SOLVER_GRANULARITY = values.IntegerValue(15)
+
+    # Seconds to wait for external services like oEmbed providers and the
+    # number of times failed requests are retried
+    HTTP_TIMEOUT = values.FloatValue(5)
+    HTTP_RETRIES = values.IntegerValue(2)
 
     ###########################################################################
     #
@@ -467,6 +490,26 @@ class Base(Configuration):
 
     BROKER_URL = values.Value('redis://localhost:6379/0')
 
+    CELERYBEAT_SCHEDULE = {
+        # Gives tickets held by abandoned checkouts back to the inventory
+        'release-expired-ticket-holds': {
+            'task': 'pyconde.attendees.tasks.release_expired_ticket_holds',
+            'schedule': timedelta(minutes=1),
+        },
+        # Rebuilds the schedule snapshot before it expires, so that readers
+        # of a schedule that hasn't changed for a while never have to build
+        # it themselves. Has to be shorter than SCHEDULE_SNAPSHOT_TIMEOUT.
+        'rebuild-schedule-snapshot': {
+            'task': 'pyconde.schedule.tasks.build_schedule_snapshot',
+            'schedule': timedelta(minutes=30),
+        },
+        # Keeps the log of schedule changes from growing without bounds
+        'prune-schedule-changes': {
+            'task': 'pyconde.schedule.tasks.prune_schedule_changes',
+            'schedule': timedelta(days=1),
+        },
+    }
+
     LOCALE_PATHS = (
         os.path.join(BASE_DIR, PROJECT_NAME, 'locale'),
     )